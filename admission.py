@@ -0,0 +1,160 @@
+"""
+Admission control for the work queued on the match actors (see match_actor.py), so that a clock press is not kept waiting behind sensor frames.
+
+Work has one of two priorities. Control commands (end of turn, challenges, blank updates) have strict priority over other matches' frames: while any match has a command waiting, every other actor holds its frames back until that command has started. Within a match, a command still runs after the frames queued before it, as the end of the turn must see the last snapshots taken before the clock was pressed. Actors yield to the loop between frames, so the wait before a command starts is bounded by its own match's backlog and the frames already being processed, not by the number queued across matches.
+
+Event loop lag (how late a periodic check wakes up) shows when frames arrive faster than they are processed. Above LAG_THRESHOLD the loop is overloaded. Until the lag falls back below half the threshold, a frame takes the place of its sensor's frame already queued rather than queueing behind it, and queued frames superseded by a newer one are shed. A match's backlog is then at most one frame per sensor between commands. Each frame is a full snapshot of its sensor, so only the number of votes the resolvers see is lost (see snapshot_window.py), never a tile.
+"""
+
+import asyncio
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from clock import Clock
+from logger import get_logger
+
+class Priority(IntEnum):
+    control = 0
+    frames = 1
+
+class AdmissionController():
+    LAG_THRESHOLD = 0.05
+    CHECK_INTERVAL = 0.1
+
+    def __init__(self, lag_threshold: float = LAG_THRESHOLD, check_interval: float = CHECK_INTERVAL, clock: Optional[Clock] = None) -> None:
+        """
+        @param lag_threshold: Seconds of event loop lag above which the loop is overloaded, and frames are coalesced
+        @param check_interval: Seconds between measurements of the loop's lag
+        @param clock: Clock the lag is measured with, the system's by default
+        """
+        self._lag_threshold = lag_threshold
+        self._check_interval = check_interval
+        self._clock = clock or Clock()
+        self._task: Optional[asyncio.Future] = None
+        self._lag = 0.
+        self._max_lag = 0.
+        self._is_overloaded = False
+        self._n_of_overloads = 0
+        self._n_of_waiting_commands = 0
+        self._waiters: List[asyncio.Future] = [] # Actors holding frames back until no command is waiting
+        self._queues = {priority: {'queued': 0, 'max_queued': 0, 'started': 0, 'total_wait': 0., 'max_wait': 0.} for priority in Priority}
+        self._frame_stats = {'dropped': 0, 'coalesced': 0, 'shed': 0}
+        self._logger = get_logger(__class__.__name__)
+
+    def start(self):
+        """
+        Starts measuring the running loop's lag
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._monitor())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def is_overloaded(self):
+        return self._is_overloaded
+
+    @property
+    def frames_may_run(self):
+        """
+        False while any match has a command waiting to start
+        """
+        return self._n_of_waiting_commands == 0
+
+    def wait_for_commands(self, future: asyncio.Future):
+        """
+        Resolves the future once no match has a command waiting to start
+        """
+        if self._n_of_waiting_commands == 0:
+            future.set_result(None)
+        else:
+            self._waiters.append(future)
+
+    def record_lag(self, lag: float):
+        self._lag = lag
+        self._max_lag = max(lag, self._max_lag)
+        if not self._is_overloaded and lag > self._lag_threshold:
+            self._is_overloaded = True
+            self._n_of_overloads += 1
+            self._logger.warning(f"Event loop lagging by {lag * 1000:.1f} ms, coalescing sensor frames")
+        elif self._is_overloaded and lag < self._lag_threshold / 2:
+            self._is_overloaded = False
+            self._logger.info(f"Event loop lag down to {lag * 1000:.1f} ms, no longer coalescing sensor frames")
+
+    def on_queued(self, priority: Priority):
+        queue = self._queues[priority]
+        queue['queued'] += 1
+        queue['max_queued'] = max(queue['queued'], queue['max_queued'])
+        if priority == Priority.control:
+            self._n_of_waiting_commands += 1
+
+    def on_started(self, priority: Priority, wait: float):
+        """
+        @param wait: Seconds the work was queued for
+        """
+        queue = self._queues[priority]
+        queue['started'] += 1
+        queue['total_wait'] += wait
+        queue['max_wait'] = max(wait, queue['max_wait'])
+        self.on_removed(priority)
+
+    def on_removed(self, priority: Priority, n: int = 1):
+        """
+        Records work leaving its queue, whether started or discarded (e.g. when a match's actor is closed)
+        """
+        self._queues[priority]['queued'] -= n
+        if priority == Priority.control:
+            self._n_of_waiting_commands -= n
+            if self._n_of_waiting_commands == 0:
+                waiters, self._waiters = self._waiters, []
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(None)
+
+    def on_dropped(self):
+        """
+        Records a frame dropped as its match's queue was full
+        """
+        self._frame_stats['dropped'] += 1
+
+    def on_coalesced(self):
+        """
+        Records a queued frame replaced by a newer frame from the same sensor
+        """
+        self._frame_stats['coalesced'] += 1
+
+    def on_shed(self):
+        """
+        Records a queued frame discarded as a newer frame from the same sensor is queued after it
+        """
+        self._frame_stats['shed'] += 1
+        self.on_removed(Priority.frames)
+
+    @property
+    def stats(self) -> Dict[str, object]:
+        queues = {}
+        for priority, queue in self._queues.items():
+            queues[priority.name] = {
+                'queued': queue['queued'],
+                'max_queued': queue['max_queued'],
+                'started': queue['started'],
+                'mean_wait': queue['total_wait'] / queue['started'] if queue['started'] else 0.,
+                'max_wait': queue['max_wait']
+            }
+        queues[Priority.frames.name].update(self._frame_stats)
+        return {
+            'lag': self._lag,
+            'max_lag': self._max_lag,
+            'overloaded': self._is_overloaded,
+            'overloads': self._n_of_overloads,
+            **queues
+        }
+
+    async def _monitor(self):
+        while True:
+            start = self._clock.now()
+            await self._clock.sleep(self._check_interval)
+            self.record_lag(max(self._clock.now() - start - self._check_interval, 0.))
@@ -0,0 +1,44 @@
+"""
+Retry delays shared by the sensor clients' reconnections and the server's requests to other services (see publisher.py). Has no dependencies, so that server-side modules can use it without loading the sensor client.
+"""
+
+import random
+from typing import Optional
+
+class ReconnectPolicy:
+    def __init__(self, base: float = 0.5, cap: float = 30., max_attempts: int = 5, rng: Optional[random.Random] = None):
+        """
+        Exponential backoff with decorrelated jitter (each delay is drawn between base and 3x the previous delay, capped). Spreads out reconnections when many sensors lose the server at the same moment.
+
+        @param base: Minimum delay between attempts, in seconds
+        @param cap: Maximum delay between attempts, in seconds
+        @param max_attempts: Number of consecutive failed attempts before giving up
+        @param rng: Random number generator, can be seeded for reproducible delays
+        """
+        self.base = base
+        self.cap = cap
+        self.max_attempts = max_attempts
+        self._rng = rng or random.Random()
+        self._delay = base
+        self._deferred = 0.
+
+    def next_delay(self) -> float:
+        """
+        Returns the time to wait before the next connection attempt
+        """
+        self._delay = min(self.cap, self._rng.uniform(self.base, self._delay * 3))
+        delay = max(self._delay, self._deferred)
+        self._deferred = 0.
+        return delay
+
+    def defer(self, delay: float):
+        """
+        Ensures the next delay is at least the given time, e.g. when the server asks the sensor to retry later
+        """
+        self._deferred = max(self._deferred, delay)
+
+    def reset(self):
+        """
+        Called once a connection succeeds
+        """
+        self._delay = self.base
@@ -1,19 +1,53 @@
 import asyncio
 import logging
+from time import monotonic
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
 
 import capnp
 import game_capture_capnp
 
+from backoff import ReconnectPolicy
+from transport import StreamCodec, ReadSizer, PACKED_HELLO, PACKED_ACK, WRITE_HIGH_WATER
+
+class QueuedRequest:
+    def __init__(self, seq: int, key: str, make_request: Callable, timeout: float, future: asyncio.Future):
+        """
+        An outbound RPC waiting in (or sent from) the client's send queue
+
+        @param seq: Sequence number, increasing in the order requests are queued
+        @param key: Stream the request belongs to. Queued requests with the same key are coalesced to the newest
+        @param make_request: Creates the capnp request when it is sent, given the request's seq
+        @param timeout: Time to wait for an acknowledgement once sent
+        @param future: Resolved with the response, or None if the request was coalesced, dropped or not acknowledged
+        """
+        self.seq = seq
+        self.key = key
+        self.make_request = make_request
+        self.timeout = timeout
+        self.future = future
+
 class Client:
-    def __init__(self, loop: asyncio.AbstractEventLoop, logger: logging.Logger):
+    MAX_IN_FLIGHT = 4
+    MAX_QUEUED = 8
+    PULSE_INTERVAL = 2.
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, logger: logging.Logger, max_in_flight: int = MAX_IN_FLIGHT, max_queued: int = MAX_QUEUED, reconnect_policy: Optional[ReconnectPolicy] = None, packed: bool = False, quiet_pulse: bool = False, pulse_interval: float = PULSE_INTERVAL):
         """
         Base capnproto client class which initializes socket connection and MatchServer schema.
 
         @param loop: Reference to current event loop
         @param logger: Logger to redirect logs to
+        @param max_in_flight: Number of queued requests which may be awaiting a response at once
+        @param max_queued: Number of requests which may wait in the send queue before the oldest are dropped
+        @param reconnect_policy: Delays between connection attempts, defaults to jittered exponential backoff
+        @param packed: Request the packed transport (see transport.py). Falls back to the plain stream if the server does not confirm it
+        @param quiet_pulse: Only pulse the server after pulse_interval without receiving anything from it. While frames are being acknowledged the connection is known to be alive, and the server treats the frames themselves as liveness.
+        @param pulse_interval: Seconds between pulses
         """
         self._retry_task = False
-        self._reconnection_attempts = 5
+        self._reconnect_policy = reconnect_policy or ReconnectPolicy()
+        self._reconnection_attempts = self._reconnect_policy.max_attempts
         self._addr = None
         self._port = None
         self._reader = None
@@ -24,12 +58,31 @@ class Client:
         self._loop = loop
         self._is_connected = False
         self._logger = logger
+        self._packed = packed
+        self._quiet_pulse = quiet_pulse
+        self._pulse_interval = pulse_interval
+        self._last_inbound = monotonic()
+        self._codec = StreamCodec()
+        self._read_sizer = ReadSizer()
+        self._write_sizer = ReadSizer()
+
+        # Pipelined send queue, see queue_request
+        self._max_in_flight = max_in_flight
+        self._max_queued = max_queued
+        self._send_queue: Deque[QueuedRequest] = deque()
+        self._queued_by_key: Dict[str, QueuedRequest] = {}
+        self._in_flight: Dict[int, QueuedRequest] = {}
+        self._send_wakeup = asyncio.Event()
+        self._send_seq = 0
+        self._last_acked: Dict[str, int] = {}
+        self._send_stats = {'sent': 0, 'acked': 0, 'coalesced': 0, 'dropped': 0, 'timed_out': 0, 'pulses': 0, 'pulses_skipped': 0}
 
     def __del__(self):
         '''
         Forceably cancel all async tasks when deleting the object
         '''
-        asyncio.ensure_future(self.disconnect(), loop=self._loop)
+        if self._writer is not None and not self._loop.is_closed():
+            asyncio.ensure_future(self.disconnect(), loop=self._loop)
 
     async def socketreader(self):
         '''
@@ -40,7 +93,7 @@ class Client:
                 # Must be a wait_for in order to give watch_connection a slot
                 # to try again
                 data = await asyncio.wait_for(
-                    self._reader.read(4096),
+                    self._reader.read(self._read_sizer.size),
                     timeout=5.0
                 )
             except asyncio.TimeoutError:
@@ -49,7 +102,10 @@ class Client:
             except Exception as err:
                 self._logger.error("Unknown socketreader err: %s", err)
                 return False
-            self._client.write(data)
+            if data:
+                self._last_inbound = monotonic()
+            self._read_sizer.update(len(data))
+            self._client.write(self._codec.decode(data))
         self._logger.debug("socketreader done.")
         return True
 
@@ -62,10 +118,13 @@ class Client:
                 # Must be a wait_for in order to give watch_connection a slot
                 # to try again
                 data = await asyncio.wait_for(
-                    self._client.read(4096),
+                    self._client.read(self._write_sizer.size),
                     timeout=5.0
                 )
-                self._writer.write(data.tobytes())
+                self._write_sizer.update(len(data))
+                self._writer.write(self._codec.encode(data))
+                if self._writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+                    await self._writer.drain()
             except asyncio.TimeoutError:
                 self._logger.debug2("socketwriter timeout.")
                 continue
@@ -78,17 +137,24 @@ class Client:
     async def socketwatcher(self):
         '''
         Periodically attempts to make an API call with a timeout to validate
-        the server is still alive
+        the server is still alive. In quiet pulse mode, the call is skipped
+        while other traffic from the server shows it is alive.
         '''
         while self._retry_task:
             try:
+                if self._quiet_pulse and (quiet_for := monotonic() - self._last_inbound) < self._pulse_interval:
+                    self._send_stats['pulses_skipped'] += 1
+                    await asyncio.sleep(self._pulse_interval - quiet_for)
+                    continue
+
                 self._logger.debug2("Pulsing server")
+                self._send_stats['pulses'] += 1
                 await asyncio.wait_for(
                     self._server.pulse().a_wait(),
                     timeout=5.0
                 )
                 self._logger.debug2("Server connection ok.")
-                await asyncio.sleep(2)
+                await asyncio.sleep(self._pulse_interval)
             except asyncio.TimeoutError:
                 self._logger.warning("Server connection failed, disconnecting.")
                 # End other tasks
@@ -100,6 +166,133 @@ class Client:
         self._logger.debug("socketwatcher done.")
         return True
 
+    async def socketsender(self):
+        '''
+        Sends queued requests without waiting for earlier ones to be acknowledged, keeping up to max_in_flight outstanding
+        '''
+        while self._retry_task:
+            if not self._send_queue or len(self._in_flight) >= self._max_in_flight:
+                self._send_wakeup.clear()
+                try:
+                    # Must be a wait_for in order to notice the connection ending
+                    await asyncio.wait_for(self._send_wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    self._logger.debug2("socketsender timeout.")
+                continue
+
+            entry = self._send_queue.popleft()
+            del self._queued_by_key[entry.key]
+            try:
+                promise = entry.make_request(entry.seq)
+            except Exception as err:
+                self._logger.error(f"Unable to send queued {entry.key} request {entry.seq}: {err}")
+                Client._resolve(entry, None)
+                continue
+
+            self._in_flight[entry.seq] = entry
+            self._send_stats['sent'] += 1
+            asyncio.ensure_future(self._await_ack(entry, promise))
+        self._logger.debug("socketsender done.")
+        return True
+
+    async def _await_ack(self, entry: QueuedRequest, promise):
+        try:
+            res = await asyncio.wait_for(promise.a_wait(), timeout=entry.timeout)
+            self._send_stats['acked'] += 1
+            self._last_acked[entry.key] = max(entry.seq, self._last_acked.get(entry.key, 0))
+        except asyncio.TimeoutError:
+            self._logger.debug(f"Queued {entry.key} request {entry.seq} timed out")
+            self._send_stats['timed_out'] += 1
+            res = None
+        except Exception as err:
+            self._logger.error(f"Queued {entry.key} request {entry.seq} failed: {err}")
+            res = None
+        finally:
+            self._in_flight.pop(entry.seq, None)
+            self._send_wakeup.set()
+        Client._resolve(entry, res)
+
+    def queue_request(self, key: str, make_request: Callable, timeout: float = 1.0) -> asyncio.Future:
+        """
+        Queues an RPC to be pipelined with other outbound requests, rather than waiting a round trip for each one. If a request with the same key is still waiting to be sent (i.e. the link is slow), it is replaced by this one, as only the newest frame of a stream is worth sending. make_request is called with the request's seq, which increases with every queued request and can be used to sequence frames.
+
+        Returns a future resolved with the response, or None if the request was coalesced, dropped or timed out.
+        """
+        future = self._loop.create_future()
+        self._send_seq += 1
+
+        if (queued := self._queued_by_key.get(key)) is not None:
+            self._send_stats['coalesced'] += 1
+            Client._resolve(queued, None)
+            queued.seq = self._send_seq
+            queued.make_request = make_request
+            queued.timeout = timeout
+            queued.future = future
+            return future
+
+        if len(self._send_queue) >= self._max_queued:
+            dropped = self._send_queue.popleft()
+            del self._queued_by_key[dropped.key]
+            self._logger.warning(f"Send queue full, dropping {dropped.key} request {dropped.seq}")
+            self._send_stats['dropped'] += 1
+            Client._resolve(dropped, None)
+
+        entry = QueuedRequest(self._send_seq, key, make_request, timeout, future)
+        self._send_queue.append(entry)
+        self._queued_by_key[key] = entry
+        self._send_wakeup.set()
+        return future
+
+    def last_acked(self, key: str) -> int:
+        """
+        Returns the seq of the newest acknowledged request with the given key, or 0 if none has been acknowledged
+        """
+        return self._last_acked.get(key, 0)
+
+    @property
+    def send_stats(self):
+        return {
+            **self._send_stats,
+            'queued': len(self._send_queue),
+            'in_flight': len(self._in_flight),
+            'last_acked': dict(self._last_acked)
+        }
+
+    def _clear_send_queue(self):
+        for entry in [*self._send_queue, *self._in_flight.values()]:
+            Client._resolve(entry, None)
+        self._send_queue.clear()
+        self._queued_by_key.clear()
+        self._in_flight.clear()
+
+    @staticmethod
+    def _resolve(entry: QueuedRequest, res):
+        if not entry.future.done():
+            entry.future.set_result(res)
+
+    async def negotiate_transport(self):
+        '''
+        Requests the packed transport if enabled. If the server does not confirm it, the connection is abandoned and the next attempt uses the plain stream.
+        '''
+        self._codec = StreamCodec()
+        if not self._packed:
+            return True
+
+        self._writer.write(PACKED_HELLO)
+        try:
+            ack = await asyncio.wait_for(self._reader.readexactly(len(PACKED_ACK)), timeout=1.0)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            ack = None
+
+        if ack != PACKED_ACK:
+            self._logger.warning("Server did not confirm packed transport, reconnecting without it")
+            self._packed = False
+            return False
+
+        self._logger.debug("Using packed transport")
+        self._codec = StreamCodec(packed=True)
+        return True
+
     async def socketconnection(self):
         '''
         Main socket connection function
@@ -114,12 +307,18 @@ class Client:
                 timeout=1.0
             )
             self._is_connected = True
-            self._reconnection_attempts = 5
+            self._reconnection_attempts = self._reconnect_policy.max_attempts
+            self._reconnect_policy.reset()
         except (asyncio.TimeoutError, OSError):
             self._logger.debug(f"Retrying port connection {self._addr}:{self._port}")
             self._reconnection_attempts -= 1
             return False
 
+        if not await self.negotiate_transport():
+            self._is_connected = False
+            self._writer.close()
+            return False
+
         self._tasks = []
 
         # Assemble reader and writer tasks, run in the background
@@ -135,7 +334,7 @@ class Client:
 
         # Start watcher to restart socket connection if it is lost
         self._logger.debug("Backgrounding socketwatcher")
-        watcher = [self.socketwatcher()]
+        watcher = [self.socketwatcher(), self.socketsender()]
         self._tasks.append(asyncio.gather(*watcher, return_exceptions=True))
 
         # Callback
@@ -170,8 +369,9 @@ class Client:
                 await self.socketconnection()
             except Exception as err:
                 self._logger.error(f"Unhandled Exception: {err}")
-            await asyncio.sleep(1)
-            self._logger.info(f"{self._reconnection_attempts} remaining reconnection attempts")
+            delay = self._reconnect_policy.next_delay()
+            self._logger.info(f"{self._reconnection_attempts} remaining reconnection attempts, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
 
         # Remove reference to loop once we finish
         self._logger.debug("Connection ended")
@@ -200,6 +400,8 @@ class Client:
             self._logger.debug(f"Ending task {index}")
             await task
 
+        self._clear_send_queue()
+
         self._logger.debug("Closing connection")
         self._writer.close()
         await self._writer.wait_closed()
@@ -234,6 +436,14 @@ class Client:
             self._logger.debug("Handle request timed out")
             return None
         
+    def redirect(self, addr: str, port: int):
+        """
+        Makes the next connection attempt go to another server, e.g. when the server says the sensor's match is running on another node
+        """
+        self._logger.info(f"Redirected from {self._addr}:{self._port} to {addr}:{port}")
+        self._addr = addr
+        self._port = port
+
     def add_task(self, task):
         self._logger.debug(f"Backgrounding {task.__name__}")
         self._tasks.append(asyncio.gather(task(), return_exceptions=True))
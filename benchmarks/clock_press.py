@@ -0,0 +1,88 @@
+"""
+Measures the latency of clock presses (end of turn commands) in one match while other matches' sensors flood the loop with frames, with and without a shared AdmissionController. Without one, each actor only orders its own work, so a command waits behind every frame the loop runs before it.
+
+Run from the repository root with: python -m benchmarks.clock_press --noisy 16 --burst 8
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import match_commands as commands
+from admission import AdmissionController
+from game_simulator import GameSimulator
+from match_actor import MatchActor
+from matchdata import GameState
+
+class NullConnectionHandler():
+    def confirm_move(self, match_id, move):
+        return 0
+
+    def set_frame_rate(self, match_id, role, fps):
+        pass
+
+def make_frames(seed: int):
+    return [(frame.role, frame.to_delta()) for turn in GameSimulator(seed).turns() for frame in turn.frames]
+
+async def flood(actor: MatchActor, frames, burst: int, stopped: asyncio.Event):
+    i = 0
+    while not stopped.is_set():
+        for _ in range(burst):
+            role, delta = frames[i % len(frames)]
+            # Deltas are mutated during processing, so each frame posted is a copy
+            actor.post_frame(role, dict(delta))
+            i += 1
+        await asyncio.sleep(0)
+
+async def run(n_of_noisy: int, burst: int, shared: bool):
+    handler = NullConnectionHandler()
+    admission = AdmissionController() if shared else None
+    if admission is not None:
+        admission.start()
+
+    def create(match_id: str):
+        return MatchActor(match_id, GameState(match_id, ('Player 1', 'Player 2'), handler), admission=admission)
+
+    noisy = [create(f'Noisy{i}') for i in range(n_of_noisy)]
+    stopped = asyncio.Event()
+    floods = [asyncio.ensure_future(flood(actor, make_frames(i + 1), burst, stopped)) for i, actor in enumerate(noisy)]
+
+    measured = create('Measured')
+    latencies = []
+    for turn in GameSimulator(0).turns():
+        for frame in turn.frames:
+            measured.post_frame(frame.role, frame.to_delta())
+        start = time.perf_counter()
+        res = await measured.call(commands.end_turn, turn.number, 0)
+        latencies.append(time.perf_counter() - start)
+        if not res.is_success:
+            break
+
+    stopped.set()
+    await asyncio.gather(*floods)
+    for actor in noisy + [measured]:
+        actor.close()
+    stats = admission.stats if admission is not None else None
+    if admission is not None:
+        admission.close()
+    return latencies, stats
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--noisy", type=int, default=16, help="Number of matches flooding the loop with frames")
+    parser.add_argument("--burst", type=int, default=8, help="Frames each noisy match posts per loop iteration")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    for shared in [False, True]:
+        latencies, stats = await run(args.noisy, args.burst, shared)
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{'Shared' if shared else 'Per-actor'} admission: median {statistics.median(latencies) * 1000:8.2f} ms, p99 {p99 * 1000:8.2f} ms, max {latencies[-1] * 1000:8.2f} ms")
+        if stats is not None:
+            print(f"  max lag {stats['max_lag'] * 1000:.1f} ms, frames coalesced {stats['frames']['coalesced']}, shed {stats['frames']['shed']}, dropped {stats['frames']['dropped']}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
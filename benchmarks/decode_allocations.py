@@ -0,0 +1,69 @@
+"""
+Measures the memory allocated per decoded board frame by BoardFeed.sendMove, before (per-tile Pos/Tile construction plus an eagerly formatted move string) and after (interned tables via board_codec).
+
+Run from the repository root with: python -m benchmarks.decode_allocations
+"""
+
+import tracemalloc
+
+import capnp
+import game_capture_capnp
+
+from board_codec import decode_move
+from scrabble import Pos, Tile
+
+N_OF_FRAMES = 1000
+
+def make_frame(n_of_tiles: int):
+    msg = game_capture_capnp.Move.new_message()
+    tiles = msg.init('tiles', n_of_tiles)
+    for i, entry in enumerate(tiles):
+        entry.value = ord('A') + i % 26
+        entry.pos.row = i // 15
+        entry.pos.col = i % 15
+    return msg.as_reader()
+
+def legacy_decode(move):
+    def format_tile(tile):
+        return f"Tile '{chr(tile.value)}' @ {Pos(tile.pos.row, tile.pos.col)}"
+
+    move_str = ', '.join(format_tile(tile) for tile in move.tiles)
+    delta = {}
+    for play in move.tiles:
+        if (pos := Pos(play.pos.row, play.pos.col)) in delta:
+            return None
+        try:
+            tile = Tile(chr(play.value))
+        except ValueError:
+            return None
+        delta[pos] = tile
+    return delta
+
+def interned_decode(move):
+    return decode_move(move.tiles).value
+
+def measure(decode, frame):
+    decode(frame) # Warm up any lazily created state
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    results = [decode(frame) for _ in range(N_OF_FRAMES)] # Results are retained so that their allocations are counted
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del results
+    return blocks / N_OF_FRAMES, size / N_OF_FRAMES, peak / N_OF_FRAMES
+
+def main():
+    for n_of_tiles in [2, 7, 40, 100]:
+        frame = make_frame(n_of_tiles)
+        for name, decode in [('legacy', legacy_decode), ('interned', interned_decode)]:
+            blocks, size, peak = measure(decode, frame)
+            print(f"{n_of_tiles:>3} tiles {name:>8}: {blocks:7.1f} blocks/frame, {size:9.1f} B/frame retained, {peak:9.1f} B/frame peak")
+
+if __name__ == '__main__':
+    main()
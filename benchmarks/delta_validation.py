@@ -0,0 +1,74 @@
+"""
+Measures the per-frame cost of validating board frames (BoardDeltaResolver._validate_delta), walking the board's Pos and Tile objects and building a Move (before) against bitboard mask operations (after).
+
+Every board frame of simulated games is validated against the board as confirmed at the start of its turn. Frames are whole-board snapshots, so later in a game most of each frame's tiles are confirmed ones.
+
+Run from the repository root with: python -m benchmarks.delta_validation
+"""
+
+import argparse
+import time
+
+from bitboard import BitBoard, fold_delta, is_in_line
+from board_codec import get_pos, get_tile
+from game_simulator import GameSimulator
+from matchdata import SensorRole
+from scrabble import Board, Move
+
+def legacy_validate(board: Board, delta) -> bool:
+    confirmed_positions = []
+    for pos, tile in delta.items():
+        if (placed_tile := board.get_tile(pos)) is not None:
+            if tile != placed_tile:
+                return False
+            confirmed_positions.append(pos)
+
+    for pos in confirmed_positions:
+        del delta[pos]
+
+    if len(delta) > 7:
+        return False
+    return len(delta) == 0 or Move(list(delta.values()), list(delta.keys())).is_valid
+
+def bitboard_validate(board: BitBoard, delta) -> bool:
+    mask, letters, letter_mask = fold_delta(delta)
+    if board.find_conflict(letters, letter_mask) >= 0:
+        return False
+    placed = board.remove_confirmed(delta, mask)
+    return placed.bit_count() <= 7 and is_in_line(placed)
+
+def time_frames(validate, board, frames) -> float:
+    copies = [dict(frame) for frame in frames]
+    start = time.perf_counter()
+    for delta in copies:
+        validate(board, delta)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=20)
+    args = parser.parse_args()
+
+    n_of_frames, n_of_tiles = 0, 0
+    elapsed = {'legacy': 0., 'bitboard': 0.}
+    for seed in range(args.games):
+        boards = {'legacy': Board(), 'bitboard': BitBoard()}
+        validators = {'legacy': legacy_validate, 'bitboard': bitboard_validate}
+        for turn in GameSimulator(seed).turns():
+            frames = [frame.to_delta() for frame in turn.frames if frame.role == SensorRole.board]
+            n_of_frames += len(frames)
+            n_of_tiles += sum(len(frame) for frame in frames)
+            for name, board in boards.items():
+                elapsed[name] += time_frames(validators[name], board, frames)
+
+            if turn.placement:
+                move = Move([get_tile(ord(letter)) for _, _, letter in turn.placement], [get_pos(row, col) for row, col, _ in turn.placement])
+                for board in boards.values():
+                    board.apply_move(move)
+
+    print(f"{n_of_frames} board frames, {n_of_tiles / n_of_frames:.1f} tiles per frame")
+    for name, total in elapsed.items():
+        print(f"{name:>8}: {total / n_of_frames * 1e6:7.2f} us per frame ({elapsed['legacy'] / total:.2f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Measures the cost of handing every decoded frame to several consumers, by copying the frame once per consumer (before) against writing it once to a FrameRing which each consumer reads through its own cursor (after).
+
+The frames are those of simulated games, and each consumer reads every frame's entries, as a recorder or analytics job would.
+
+Run from the repository root with: python -m benchmarks.frame_fanout
+"""
+
+import argparse
+import time
+
+from frame_ring import FrameRing
+from game_simulator import GameSimulator
+
+def copy_per_consumer(frames, n_of_consumers: int) -> float:
+    queues = [[] for _ in range(n_of_consumers)]
+    start = time.perf_counter()
+    for role, delta in frames:
+        for queue in queues:
+            queue.append((role, dict(delta)))
+    ingest = time.perf_counter() - start
+    for queue in queues:
+        for _, delta in queue:
+            len(delta)
+    return ingest
+
+def ring_fan_out(frames, n_of_consumers: int) -> float:
+    ring = FrameRing()
+    cursors = [ring.cursor() for _ in range(n_of_consumers)]
+    ingest = 0.
+    for i, (role, delta) in enumerate(frames):
+        start = time.perf_counter()
+        ring.append(role, delta)
+        ingest += time.perf_counter() - start
+        if i % 16 == 15:
+            for cursor in cursors:
+                for record in cursor.read():
+                    len(record.entries)
+    return ingest
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=5)
+    args = parser.parse_args()
+
+    frames = [(frame.role, frame.to_delta()) for seed in range(args.games) for turn in GameSimulator(seed).turns() for frame in turn.frames]
+    print(f"{len(frames)} frames")
+    for n_of_consumers in [1, 2, 4, 8, 16]:
+        copy = copy_per_consumer(frames, n_of_consumers)
+        ring = ring_fan_out(frames, n_of_consumers)
+        print(f"{n_of_consumers:>2} consumers: copy {copy / len(frames) * 1e6:6.2f} us, ring {ring / len(frames) * 1e6:6.2f} us ingest per frame")
+
+if __name__ == '__main__':
+    main()
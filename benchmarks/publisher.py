@@ -0,0 +1,57 @@
+"""
+Measures the outbound publisher with many matches ending turns at once: the time publish takes (which end_turn waits for) and how long until every event has reached a local stub receiver.
+
+In each round every match publishes one end-of-turn event at the same moment, as when the clocks of a round of matches are pressed together. With --delay the receiver takes that long to respond to each request, as a remote platform would.
+
+Run from the repository root with: python -m benchmarks.publisher
+"""
+
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from publisher import Publisher, StubReceiver
+
+async def run(n_of_matches: int, n_of_rounds: int, delay: float):
+    receiver = StubReceiver()
+    url = await receiver.start()
+    receiver.delay = delay
+    with tempfile.TemporaryDirectory() as directory:
+        publisher = Publisher(url, Path(directory) / 'spill.db')
+        publish_time = 0.
+        start = time.perf_counter()
+        for turn in range(n_of_rounds):
+            round_start = time.perf_counter()
+            for i in range(n_of_matches):
+                publisher.publish(f'Match{i}', {'type': 'move', 'turn': turn, 'tiles': [{'row': 7, 'col': 7 + j, 'letter': 'A'} for j in range(4)]})
+            publish_time += time.perf_counter() - round_start
+            await asyncio.sleep(0.05)
+
+        while publisher.stats['queued'] > 0:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        stats = publisher.stats
+        await publisher.close()
+    await receiver.close()
+
+    n_of_events = n_of_matches * n_of_rounds
+    assert sum(len(events) for events in receiver.events.values()) == n_of_events
+    print(f"{n_of_matches} matches x {n_of_rounds} turns, receiver delay {delay * 1000:.0f} ms: "
+          f"publish {publish_time / n_of_events * 1e6:.1f} us per event, all delivered after {elapsed:.2f}s "
+          f"({stats['requests']} requests, {n_of_events / stats['requests']:.1f} events per request)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.02)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args.matches, args.turns, 0.))
+    asyncio.run(run(args.matches, args.turns, args.delay))
+
+if __name__ == '__main__':
+    main()
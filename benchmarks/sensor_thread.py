@@ -0,0 +1,110 @@
+"""
+Measures HTTP latency while sensors stream frames as fast as the server accepts them, with the sensor side on the main event loop and on its own thread (--sensor-thread).
+
+For each mode a server is started in a child process, and a second child process connects a board and two racks per match which, once assigned to a match, send frames back to back. Meanwhile this process sends requests to /challengeable-words, which are answered by the match's actor, and reports their latency.
+
+Run from the repository root with: python -m benchmarks.sensor_thread
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import time
+
+import aiohttp
+
+from board_client import FakeBoardClient
+from rack_client import FakeRackClient
+
+SENSOR_PORT = 9289
+HTTP_PORT = 9290
+FRAME = {'tiles': [{'value': ord('A') + i, 'pos': {'row': 7, 'col': i}} for i in range(7)]}
+RACK = 'AEINRST'
+
+def run_server(sensor_thread: bool):
+    import main_server
+    logging.disable(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = main_server.MatchDataServer(loop, sensor_port=SENSOR_PORT, http_port=HTTP_PORT, sensor_thread=sensor_thread)
+    loop.run_until_complete(server.start())
+
+def run_sensors(n_of_matches: int):
+    logging.disable(logging.WARNING)
+    asyncio.run(stream_frames(n_of_matches))
+
+async def stream_frames(n_of_matches: int):
+    loop = asyncio.get_running_loop()
+    boards = [FakeBoardClient(loop, 0x10000 + i, send_test_frames=False) for i in range(n_of_matches)]
+    racks = [FakeRackClient(loop, 0x20000 + i, send_test_frames=False) for i in range(2 * n_of_matches)]
+    for client in boards + racks:
+        asyncio.ensure_future(client.connect(addr='localhost', port=SENSOR_PORT))
+
+    async def flood(client, send):
+        while True:
+            if not client.is_assigned:
+                await asyncio.sleep(0.1)
+                continue
+            await send()
+
+    await asyncio.gather(
+        *(flood(board, lambda board=board: board.send_move(FRAME)) for board in boards),
+        *(flood(rack, lambda rack=rack: rack.send_rack(RACK)) for rack in racks)
+    )
+
+async def measure(n_of_matches: int, n_of_requests: int):
+    url = f'http://localhost:{HTTP_PORT}'
+    async with aiohttp.ClientSession() as session:
+        match_ids = []
+        while len(match_ids) < n_of_matches:
+            try:
+                async with session.get(f'{url}/setup', params={'p1': f'A{len(match_ids)}', 'p2': f'B{len(match_ids)}'}) as res:
+                    body = await res.json()
+            except aiohttp.ClientError:
+                body = {}
+            if 'body' in body:
+                match_ids.append(body['body']['match_id'])
+            else:
+                await asyncio.sleep(0.2) # Server starting, or sensors still registering
+
+        await asyncio.sleep(2.) # Let the sensors reach full rate
+
+        latencies = []
+        for i in range(n_of_requests):
+            start = time.perf_counter()
+            async with session.get(f'{url}/challengeable-words', params={'match_id': match_ids[i % n_of_matches], 'turn_number': 1}) as res:
+                await res.read()
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.005)
+        return latencies
+
+def run(sensor_thread: bool, n_of_matches: int, n_of_requests: int):
+    context = multiprocessing.get_context('spawn')
+    server = context.Process(target=run_server, args=(sensor_thread,), daemon=True)
+    sensors = context.Process(target=run_sensors, args=(n_of_matches,), daemon=True)
+    server.start()
+    sensors.start()
+    try:
+        return asyncio.run(measure(n_of_matches, n_of_requests))
+    finally:
+        sensors.terminate()
+        server.terminate()
+        sensors.join()
+        server.join()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    for sensor_thread in [False, True]:
+        latencies = sorted(run(sensor_thread, args.matches, args.requests))
+        name = 'sensor thread' if sensor_thread else 'shared loop'
+        p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+        print(f"{name:>13}: mean {statistics.mean(latencies) * 1000:6.1f} ms, p50 {p50 * 1000:6.1f} ms, p99 {p99 * 1000:6.1f} ms, max {latencies[-1] * 1000:6.1f} ms")
+
+if __name__ == '__main__':
+    main()
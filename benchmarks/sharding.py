@@ -0,0 +1,83 @@
+"""
+Measures frame throughput with matches run in-process (0 workers) and sharded across worker processes. Every match replays a simulated game: each turn's frames are posted to the match's actor, followed by an end of turn command, with all matches running concurrently.
+
+Run from the repository root with: python -m benchmarks.sharding --workers 0 1 2 4
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import match_commands as commands
+from game_simulator import GameSimulator
+from match_actor import MatchActor
+from match_shards import ShardPool
+from matchdata import GameState
+
+class NullConnectionHandler():
+    def confirm_move(self, match_id, move):
+        return 0
+
+    def set_frame_rate(self, match_id, role, fps):
+        pass
+
+def make_games(n_of_matches: int):
+    games = []
+    for seed in range(n_of_matches):
+        turns = [(turn.number, [(frame.role, frame.to_delta()) for frame in turn.frames]) for turn in GameSimulator(seed).turns()]
+        games.append(turns)
+    return games
+
+async def play(actor, turns) -> int:
+    n_of_frames = 0
+    for turn_number, frames in turns:
+        for role, delta in frames:
+            # Deltas are mutated during processing, so each run posts a copy
+            actor.post_frame(role, dict(delta))
+        n_of_frames += len(frames)
+        res = await actor.call(commands.end_turn, turn_number, 0)
+        if not res.is_success:
+            break
+    return n_of_frames
+
+async def run(n_of_workers: int, games) -> float:
+    handler = NullConnectionHandler()
+    pool = ShardPool(n_of_workers) if n_of_workers > 0 else None
+    actors = []
+    for i in range(len(games)):
+        match_id = f'Bench{i}'
+        if pool is None:
+            actors.append(MatchActor(match_id, GameState(match_id, ('Player 1', 'Player 2'), handler)))
+        else:
+            actors.append(pool.create_match(match_id, ('Player 1', 'Player 2'), handler))
+
+    if pool is not None:
+        await asyncio.gather(*(actor.call(commands.sync) for actor in actors)) # Wait for the workers to start
+
+    start = time.perf_counter()
+    n_of_frames = sum(await asyncio.gather(*(play(actor, turns) for actor, turns in zip(actors, games))))
+    elapsed = time.perf_counter() - start
+
+    for actor in actors:
+        actor.close()
+    if pool is not None:
+        pool.close()
+    return n_of_frames / elapsed
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument("--matches", type=int, default=32)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    games = make_games(args.matches)
+    baseline = None
+    for n_of_workers in args.workers:
+        rate = await run(n_of_workers, games)
+        baseline = baseline or rate
+        print(f"{n_of_workers} workers: {rate:10.0f} frames/s ({rate / baseline:.2f}x)")
+
+if __name__ == '__main__':
+    asyncio.run(main())
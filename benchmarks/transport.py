@@ -0,0 +1,70 @@
+"""
+Compares the plain and packed transports: bytes on the wire and CPU time per 1000 board frames. The client and server are connected in-process through their pipe interfaces, with every byte passing through the same StreamCodec the sockets use.
+
+Run from the repository root with: python -m benchmarks.transport
+"""
+
+import asyncio
+import time
+
+import capnp
+import game_capture_capnp
+
+from transport import StreamCodec
+
+N_OF_FRAMES = 1000
+N_OF_TILES = 40 # Mid-game board
+
+class BoardFeedImpl(game_capture_capnp.BoardFeed.Server):
+    def sendMove(self, move, seq, **kwargs):
+        return True
+
+def make_frame():
+    return {'tiles': [
+        {'value': ord('A') + i % 26, 'pos': {'row': i // 15, 'col': i % 15}} for i in range(N_OF_TILES)
+    ]}
+
+async def pump(read, write, sender: StreamCodec, receiver: StreamCodec):
+    while True:
+        data = await read(64 * 1024)
+        res = write(receiver.decode(sender.encode(data)))
+        if asyncio.iscoroutine(res):
+            await res
+
+async def run(packed: bool):
+    server = capnp.TwoPartyServer(bootstrap=BoardFeedImpl())
+    client = capnp.TwoPartyClient()
+    feed = client.bootstrap().cast_as(game_capture_capnp.BoardFeed)
+    client_codec, server_codec = StreamCodec(packed), StreamCodec(packed)
+
+    async def poll():
+        while True:
+            server.poll_once()
+            await asyncio.sleep(0)
+
+    tasks = [
+        asyncio.ensure_future(pump(client.read, server.write, client_codec, server_codec)),
+        asyncio.ensure_future(pump(server.read, client.write, server_codec, client_codec)),
+        asyncio.ensure_future(poll())
+    ]
+
+    frame = make_frame()
+    await feed.sendMove(frame, 0).a_wait() # Bootstrap the connection before measuring
+    bytes_before = client_codec.bytes_out + server_codec.bytes_out
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(feed.sendMove(frame, seq).a_wait() for seq in range(1, N_OF_FRAMES + 1)))
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    wire = client_codec.bytes_out + server_codec.bytes_out - bytes_before
+
+    for task in tasks:
+        task.cancel()
+    return wire, cpu, wall
+
+async def main():
+    for packed in [False, True]:
+        wire, cpu, wall = await run(packed)
+        name = 'packed' if packed else 'plain'
+        print(f"{name:>6}: {wire / 1024:8.1f} KiB on the wire, {cpu * 1000:7.1f} ms CPU, {wall * 1000:7.1f} ms wall per {N_OF_FRAMES} frames of {N_OF_TILES} tiles")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""
+Bitboard representation of the confirmed tiles on a board, used to validate board deltas.
+
+Square i (row * 15 + col) is bit i of a 225-bit occupancy mask, and byte i of a letters integer holding the tile code of each occupied square. A frame is folded into the same form once, after which filtering out its confirmed tiles, checking them for conflicts, and the line, gap and adjacency checks on the rest are each a few integer operations rather than walks over Pos, Tile and Move objects.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+
+from board_codec import BOARD_SIZE, N_OF_SQUARES, POSITIONS, TILE_CODES
+from scrabble import Board, Move, Pos, Tile
+
+FULL_MASK = (1 << N_OF_SQUARES) - 1
+ROW_MASKS = [((1 << BOARD_SIZE) - 1) << (row * BOARD_SIZE) for row in range(BOARD_SIZE)]
+COL_MASKS = [sum(1 << (row * BOARD_SIZE + col) for row in range(BOARD_SIZE)) for col in range(BOARD_SIZE)]
+CENTRE_MASK = 1 << (N_OF_SQUARES // 2)
+_NOT_FIRST_COL = FULL_MASK & ~COL_MASKS[0]
+_NOT_LAST_COL = FULL_MASK & ~COL_MASKS[-1]
+
+def fold_delta(delta: Dict[Pos, Tile]) -> Tuple[int, int, int]:
+    """
+    Returns the delta's occupancy mask, its letters, and a mask selecting the letters' bytes
+    """
+    mask = letters = letter_mask = 0
+    for pos, tile in delta.items():
+        i = pos.row * BOARD_SIZE + pos.col
+        mask |= 1 << i
+        letters |= TILE_CODES[tile] << (8 * i)
+        letter_mask |= 0xFF << (8 * i)
+    return mask, letters, letter_mask
+
+def squares(mask: int) -> Iterator[int]:
+    """
+    Yields the index of each square in the mask, lowest first
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def is_in_line(mask: int) -> bool:
+    """
+    Returns True if every square in the mask is in the same row or column
+    """
+    if mask == 0:
+        return True
+    row, col = divmod((mask & -mask).bit_length() - 1, BOARD_SIZE)
+    return mask & ~ROW_MASKS[row] == 0 or mask & ~COL_MASKS[col] == 0
+
+def get_span(mask: int) -> int:
+    """
+    Returns every square from the first to the last square of a mask which is in a line
+    """
+    first, last = (mask & -mask).bit_length() - 1, mask.bit_length() - 1
+    between = (1 << (last + 1)) - (1 << first)
+    if first // BOARD_SIZE == last // BOARD_SIZE:
+        return between
+    return between & COL_MASKS[first % BOARD_SIZE]
+
+def get_neighbours(mask: int) -> int:
+    """
+    Returns the squares orthogonally adjacent to any square in the mask
+    """
+    return (((mask << 1) & _NOT_FIRST_COL)
+            | ((mask >> 1) & _NOT_LAST_COL)
+            | (mask << BOARD_SIZE)
+            | (mask >> BOARD_SIZE)) & FULL_MASK
+
+class BitBoard(Board):
+    def __init__(self) -> None:
+        """
+        Board which keeps bitboards of its confirmed tiles up to date as moves are applied and undone. Letters are the tile codes the tiles were placed with, which is how sensors read them (e.g. blanks stay '?' after their letter is set).
+        """
+        super().__init__()
+        self.occupancy = 0
+        self.letters = 0
+        self.letter_mask = 0
+        # Identifies the confirmed tiles, so that results derived from them can be invalidated when they change. Undoing a move restores the version from before it, so applying and undoing a move (see SpeculativeResolver) invalidates nothing.
+        self.version = 0
+        self._n_of_versions = 0
+        self._previous_versions: List[int] = []
+
+    def apply_move(self, move: Move) -> bool:
+        if not super().apply_move(move):
+            return False
+        for tile, pos in move:
+            i = pos.row * BOARD_SIZE + pos.col
+            self.occupancy |= 1 << i
+            self.letters |= TILE_CODES[tile] << (8 * i)
+            self.letter_mask |= 0xFF << (8 * i)
+        self._previous_versions.append(self.version)
+        self._new_version()
+        return True
+
+    def undo_move(self):
+        move_info = super().undo_move()
+        if move_info is not None:
+            for _, pos in move_info.move:
+                i = pos.row * BOARD_SIZE + pos.col
+                self.occupancy &= ~(1 << i)
+                self.letters &= ~(0xFF << (8 * i))
+                self.letter_mask &= ~(0xFF << (8 * i))
+            if self._previous_versions:
+                self.version = self._previous_versions.pop()
+            else:
+                self._new_version()
+        return move_info
+
+    def set_blanks(self, letters: str) -> bool:
+        # Sensors still read the blanks as '?', so only the version changes
+        if not super().set_blanks(letters):
+            return False
+        self._new_version()
+        return True
+
+    def find_conflict(self, letters: int, letter_mask: int) -> int:
+        """
+        Returns the first square on which folded letters differ from the confirmed tile, or -1 if there is none
+        """
+        conflicts = (letters ^ self.letters) & letter_mask & self.letter_mask
+        return -1 if conflicts == 0 else ((conflicts & -conflicts).bit_length() - 1) // 8
+
+    def is_playable(self, mask: int) -> bool:
+        """
+        Returns True if tiles placed on the squares in the mask could form a move: in one line, with no empty squares between them, and touching a confirmed tile (or covering the centre square on an empty board)
+        """
+        if mask == 0 or mask & self.occupancy or not is_in_line(mask):
+            return False
+        if get_span(mask) & ~(mask | self.occupancy):
+            return False
+        if self.occupancy == 0:
+            return mask & CENTRE_MASK != 0
+        return get_neighbours(mask) & self.occupancy != 0
+
+    def remove_confirmed(self, delta: Dict[Pos, Tile], mask: int) -> int:
+        """
+        Removes the delta's tiles on confirmed squares, and returns the mask of the remaining ones. The delta's tiles must already have been checked for conflicts.
+        """
+        placed = mask & ~self.occupancy
+        if placed != mask:
+            # Usually far fewer tiles are being placed than are confirmed, so the delta is rebuilt rather than deleted from
+            kept = [(POSITIONS[i], delta[POSITIONS[i]]) for i in squares(placed)]
+            delta.clear()
+            delta.update(kept)
+        return placed
+
+    def _new_version(self):
+        self._n_of_versions += 1
+        self.version = self._n_of_versions
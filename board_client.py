@@ -5,6 +5,7 @@ import capnp
 import game_capture_capnp
 
 from base_client import Client
+from board_codec import PackedBoard, BOARD_SIZE
 from logger import get_logger
 
 def parse_args():
@@ -21,18 +22,29 @@ async def main(loop):
     await client.connect(addr='localhost')
 
 class FakeBoardClient(Client):
-    def __init__(self, loop: asyncio.AbstractEventLoop, mac: int):
+    def __init__(self, loop: asyncio.AbstractEventLoop, mac: int, send_test_frames: bool = True, packed: bool = False, quiet_pulse: bool = False):
+        """
+        @param send_test_frames: If set to False, the client only sends the frames it is given (used by the game simulator)
+        @param packed: Request the packed transport from the server
+        @param quiet_pulse: Only pulse the server when no frames have been acknowledged recently
+        """
         self._logger = get_logger(__class__.__name__)
         self._loop = loop
         self._mac = mac # getnode()
         self._data_feed = None
-        super().__init__(loop, self._logger)
+        self._is_registered = False
+        self._send_test_frames = send_test_frames
+        self._last_frame = None # (seq, frame) of the newest frame, resent on reconnection if the server did not receive it
+        self._last_confirmed_move = 0
+        self._confirmed_squares = {} # Tile code of each confirmed square index, stands in for the camera's view of the board
+        self._frame_interval = .5 # Seconds between test frames, set by the server through setFrameRate
+        super().__init__(loop, self._logger, packed=packed, quiet_pulse=quiet_pulse)
 
     async def on_connect(self, server):
         client = BoardImpl(self)
         self._logger.info(f"Registering with server (MAC: {hex(self._mac)})")
         res = await self.handle_request(
-            server.register(self._mac, {'board': client}), timeout=2.0)
+            server.register(self._mac, {'board': client}, self._resume_state()), timeout=2.0)
 
         if res is None:
             self._logger.error('Did not receive registration response')
@@ -43,15 +55,23 @@ class FakeBoardClient(Client):
             case 'board':
                 self._logger.info(f"Registered successfully, reassigned to match")
                 self._data_feed = data_feed.board
+                self._resume(res.resume)
             case 'rack':
                 self._logger.error('Server responded with incompatible data feed to registration request')
                 self.disconnect(retry_connection=False)
             case 'none':
                 self._logger.info(f"Registered successfully, not assigned to match")
+            case 'retryAfter':
+                self._logger.info(f"Server deferred registration, retrying in {data_feed.retryAfter} ms")
+                self._reconnect_policy.defer(data_feed.retryAfter / 1000)
+                return False
+            case 'redirect':
+                self.redirect(data_feed.redirect.host, data_feed.redirect.port)
+                return False
 
         async def test_send_move():
             while self._retry_task:
-                await asyncio.sleep(.5)
+                await asyncio.sleep(self._frame_interval)
                 if self._data_feed is not None:
                     await self.send_move(
                         {'tiles': [
@@ -67,23 +87,73 @@ class FakeBoardClient(Client):
                         }
                     )
         
-        self.add_task(test_send_move)
+        self._is_registered = True
+        if self._send_test_frames:
+            self.add_task(test_send_move)
         return True
 
+    @property
+    def is_registered(self):
+        return self._is_registered
+
+    @property
+    def is_assigned(self):
+        return self._data_feed is not None
+
     async def on_disconnect(self):
         self._logger.debug("Resetting data feed")
         self._data_feed = None
+        self._is_registered = False
 
-    async def send_move(self, move):
+    def queue_move(self, move) -> asyncio.Future:
+        """
+        Queues a move to be pipelined with other frames, see Client.queue_request
+        """
         assert self._is_connected
+        data_feed = self._data_feed
+        def make_request(seq):
+            self._last_frame = (seq, move)
+            return data_feed.sendMove(move, seq)
+        return self.queue_request('move', make_request, timeout=1.)
+
+    def confirm_move(self, seq, move):
+        if seq <= self._last_confirmed_move:
+            self._logger.debug(f"Ignoring confirmed move {seq}, already confirmed up to {self._last_confirmed_move}")
+            return
+        if seq != self._last_confirmed_move + 1:
+            self._logger.warning(f"Received confirmed move {seq} out of order, last confirmed move was {self._last_confirmed_move}")
+        self._logger.info(f"Confirming move {seq}: {str(move)}")
+        self._last_confirmed_move = max(seq, self._last_confirmed_move)
+        for tile in move.tiles:
+            self._confirmed_squares[tile.pos.row * BOARD_SIZE + tile.pos.col] = tile.value
+
+    def set_frame_rate(self, fps):
+        self._logger.info(f"Server set frame rate to {fps:.1f} fps")
+        self._frame_interval = 1 / fps
+
+    def _resume_state(self):
+        return {'lastConfirmedMove': self._last_confirmed_move, 'lastAckedFrame': self.last_acked('move')}
+
+    def _resume(self, info):
+        """
+        Catches up on the moves confirmed while disconnected, and resends the newest frame if the server missed it
+        """
+        for confirmed in info.missedMoves:
+            self.confirm_move(confirmed.seq, confirmed.move)
+
+        if info.frameRate > 0:
+            self.set_frame_rate(info.frameRate)
+
+        if self._last_frame is not None and self._last_frame[0] > info.lastFrameSeq:
+            self._logger.info(f"Resending move frame {self._last_frame[0]}, server last received {info.lastFrameSeq}")
+            self.queue_move(self._last_frame[1])
+
+    async def send_move(self, move):
         self._logger.debug2("Sending move to server")
-        res = await self.handle_request(
-            self._data_feed.sendMove(move),
-            timeout=1.
-        )
+        res = await self.queue_move(move)
         
         if res is None:
-            self._logger.error(f"Did not obtain response for sendMove {move}")
+            self._logger.warning(f"Did not obtain response for sendMove {move} (superseded or timed out)")
         else:
             res = res.success
             self._logger.debug2(f"Obtained response {res} for sendMove")
@@ -100,14 +170,22 @@ class BoardImpl(game_capture_capnp.Board.Server):
         self._client._data_feed = dataFeed
         return True
     
-    def confirmMove(self, move, **kwargs):
-        self._logger.info(f"Confirming move {str(move)}")
+    def confirmMove(self, move, seq, **kwargs):
+        self._client.confirm_move(seq, move)
+        return True
+
+    def setFrameRate(self, framesPerSecond, **kwargs):
+        self._client.set_frame_rate(framesPerSecond)
         return True
 
     def getFullBoardState(self, **kwargs):
         self._logger.info("Getting full board state")
         return "Example Board State"
 
+    def getPackedBoardState(self, _context, **kwargs):
+        self._logger.debug("Getting packed board state")
+        PackedBoard.from_squares(self._client._confirmed_squares).write(_context.results.state)
+
 if __name__ == '__main__':
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
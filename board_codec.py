@@ -0,0 +1,191 @@
+"""
+Conversions between capnp Move messages and the board deltas used by the resolvers.
+
+Pos and Tile objects are interned: every frame reuses the same 225 positions and 27 tiles rather than constructing new ones for each tile of each frame, which keeps decoding down to a couple of table lookups per tile.
+"""
+
+from typing import Dict, List, Optional
+
+import capnp
+import game_capture_capnp
+
+from util import Result
+from scrabble import Pos, Tile, Move
+
+BOARD_SIZE = 15
+
+def _make_tile_table() -> List[Optional[Tile]]:
+    table = []
+    for code in range(128):
+        try:
+            table.append(Tile(chr(code)))
+        except ValueError:
+            table.append(None)
+
+    # Letters which map to equal tiles (e.g. lower and upper case) share a single instance
+    canonical: Dict[Tile, Tile] = {}
+    return [None if tile is None else canonical.setdefault(tile, tile) for tile in table]
+
+POSITIONS: List[Pos] = [Pos(row, col) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)]
+TILES_BY_CODE: List[Optional[Tile]] = _make_tile_table()
+TILES: List[Tile] = list({tile: None for tile in TILES_BY_CODE if tile is not None})
+TILE_CODES: Dict[Tile, int] = {tile: ord(tile.letter) for tile in TILES}
+
+def get_pos(row: int, col: int) -> Pos:
+    return POSITIONS[row * BOARD_SIZE + col]
+
+def get_tile(code: int) -> Optional[Tile]:
+    """
+    Returns the interned tile for a capnp tile value, or None if the value is not a valid tile
+    """
+    return TILES_BY_CODE[code] if 0 <= code < len(TILES_BY_CODE) else None
+
+def decode_move(tiles) -> Result[Dict[Pos, Tile]]:
+    """
+    Decodes a capnp List(Move.Tile) into a board delta, or an error message describing why the move is malformed
+    """
+    delta = {}
+    for play in tiles:
+        pos = play.pos
+        row, col = pos.row, pos.col
+        if row >= BOARD_SIZE or col >= BOARD_SIZE:
+            return Result.failure(f"it contains out of bounds position ({row}, {col})")
+
+        pos = POSITIONS[row * BOARD_SIZE + col]
+        if pos in delta:
+            return Result.failure(f"it contains multiple tiles for pos {pos}")
+
+        if (tile := get_tile(play.value)) is None:
+            return Result.failure(f"it contains invalid letter '{chr(play.value & 0xFF)}'")
+
+        delta[pos] = tile
+
+    return Result.success(delta)
+
+def format_move(tiles) -> str:
+    """
+    Human readable form of a capnp List(Move.Tile), only built when it is actually logged
+    """
+    return ', '.join(f"Tile '{chr(play.value & 0xFF)}' @ ({play.pos.row}, {play.pos.col})" for play in tiles)
+
+def encode_move(move: Move):
+    """
+    Builds a capnp Move message directly from a Move, without going through intermediate dicts
+    """
+    msg = game_capture_capnp.Move.new_message()
+    write_move(msg, move)
+    return msg
+
+def write_move(msg, move: Move):
+    """
+    Fills in a capnp Move builder (e.g. a field of a larger message) from a Move
+    """
+    plays = list(move)
+    tiles = msg.init('tiles', len(plays))
+    for entry, (tile, pos) in zip(tiles, plays):
+        entry.value = TILE_CODES[tile]
+        entry.pos.row = pos.row
+        entry.pos.col = pos.col
+
+BLANK_CODE = ord('?')
+N_OF_SQUARES = BOARD_SIZE * BOARD_SIZE
+OCCUPANCY_BYTES = (N_OF_SQUARES + 7) // 8
+
+class BoardDiff():
+    def __init__(self, missing: List[Pos], conflicting: List[Pos], pending: List[Pos]) -> None:
+        """
+        Differences between the expected (confirmed) board and an observed one
+
+        @param missing: Confirmed tiles which were not observed
+        @param conflicting: Squares observed with a different tile than the confirmed one
+        @param pending: Observed tiles on squares which have no confirmed tile (e.g. the move currently being played)
+        """
+        self.missing = missing
+        self.conflicting = conflicting
+        self.pending = pending
+
+    @property
+    def is_consistent(self):
+        return len(self.missing) == 0 and len(self.conflicting) == 0
+
+    def __str__(self) -> str:
+        return f"missing={self.missing}, conflicting={self.conflicting}, pending={len(self.pending)}"
+
+class PackedBoard():
+    def __init__(self, occupancy: int, codes: bytes) -> None:
+        """
+        Board contents as a 225-bit occupancy mask plus the tile codes of the occupied squares in square order, matching the PackedBoardState message
+        """
+        self.occupancy = occupancy
+        self.codes = codes
+
+    @staticmethod
+    def from_board(board) -> 'PackedBoard':
+        squares = {}
+        for i, pos in enumerate(POSITIONS):
+            if (tile := board.get_tile(pos)) is not None:
+                squares[i] = TILE_CODES.get(tile, ord(tile.letter))
+        return PackedBoard.from_squares(squares)
+
+    @staticmethod
+    def from_squares(squares: Dict[int, int]) -> 'PackedBoard':
+        """
+        @param squares: Tile code for each occupied square index (row * 15 + col)
+        """
+        occupancy = 0
+        for i in squares:
+            occupancy |= 1 << i
+        return PackedBoard(occupancy, bytes(squares[i] for i in sorted(squares)))
+
+    @staticmethod
+    def from_capnp(state) -> 'PackedBoard':
+        return PackedBoard(int.from_bytes(state.occupancy, 'little'), bytes(state.tiles))
+
+    def write(self, state):
+        """
+        Fills in a capnp PackedBoardState builder
+        """
+        state.occupancy = self.occupancy.to_bytes(OCCUPANCY_BYTES, 'little')
+        state.tiles = self.codes
+
+    def letters(self) -> bytes:
+        """
+        Returns the tile code of every square in row major order, 0 for empty squares
+        """
+        # Imported here as bitboard imports this module
+        from bitboard import squares
+        letters = bytearray(N_OF_SQUARES)
+        for i, code in zip(squares(self.occupancy), self.codes):
+            letters[i] = code
+        return bytes(letters)
+
+    def diff(self, observed: 'PackedBoard') -> BoardDiff:
+        """
+        Compares this (confirmed) board against an observed one using mask operations. A blank read on either side matches any tile, as blanks on the physical board do not show their assigned letter.
+        """
+        if self.occupancy == observed.occupancy and self.codes == observed.codes:
+            return BoardDiff([], [], [])
+
+        from bitboard import squares
+
+        xor = int.from_bytes(self.letters(), 'little') ^ int.from_bytes(observed.letters(), 'little')
+        blanks = PackedBoard._blank_mask(self) | PackedBoard._blank_mask(observed)
+        conflicting = []
+        for i in squares(self.occupancy & observed.occupancy & ~blanks):
+            if (xor >> (8 * i)) & 0xFF:
+                conflicting.append(POSITIONS[i])
+
+        return BoardDiff(
+            missing=[POSITIONS[i] for i in squares(self.occupancy & ~observed.occupancy)],
+            conflicting=conflicting,
+            pending=[POSITIONS[i] for i in squares(observed.occupancy & ~self.occupancy)]
+        )
+
+    @staticmethod
+    def _blank_mask(board: 'PackedBoard') -> int:
+        from bitboard import squares
+        mask = 0
+        for i, code in zip(squares(board.occupancy), board.codes):
+            if code == BLANK_CODE:
+                mask |= 1 << i
+        return mask
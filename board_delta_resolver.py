@@ -1,80 +1,143 @@
-import time
-from typing import Dict
+from typing import Dict, Optional, Tuple
 from logging import Logger
 
-from scrabble import Pos, Board, Tile, Move
+from bitboard import BitBoard, fold_delta, is_in_line
+from clock import Clock
+from board_codec import POSITIONS
+from snapshot_window import SnapshotWindow
+from scrabble import Pos, Tile, Move
 
 class BoardDeltaResolver():
     # Currently identical to values in RackDeltaResolver, but separate values are used to facilitate individual tuning in the future
     MAX_SNAPSHOT_AGE_IN_MS = 3000
     MIN_ACCEPTABLE_CONFIDENCE = 2
+    MAX_CACHED_DELTAS = 256
 
-    def __init__(self, board: Board, logger: Logger) -> None:
+    __slots__ = ('_board', '_window', '_logger', '_clock', '_validity_cache', '_cache_version', '_stats')
+
+    def __init__(self, board: BitBoard, logger: Logger, clock: Optional[Clock] = None) -> None:
+        """
+        @param clock: Clock snapshot ages are measured with, the system's by default
+        """
         self._board = board
-        self._delta: Dict[Pos, Tile] = {}
-        self._confidence = 0
-        self._last_update = 0
+        # Recent accepted deltas, keyed by the folded letters of their unconfirmed tiles, which vote on the delta used at the end of the turn
+        self._window: SnapshotWindow[Dict[Pos, Tile]] = SnapshotWindow(BoardDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS / 1000)
         self._logger = logger
+        self._clock = clock or Clock()
+        # Outcome of validating each delta seen this turn, keyed by its folded letters (see bitboard.py): the delta's tiles after removing confirmed ones along with their folded letters, or None if it was rejected
+        self._validity_cache: Dict[int, Optional[Tuple[Tuple[Tuple[Pos, Tile], ...], int]]] = {}
+        self._cache_version = board.version
+        self._stats = {'validations': 0, 'cache_hits': 0, 'invalidations': 0}
 
     @property
     def delta(self):
-        return self._delta.copy() # Returns a copy to ensure that property is not mutated
+        """
+        Delta with the most votes among the recent frames, or an empty delta if there are none
+        """
+        vote = self._window.vote(self._clock.now())
+        return {} if vote is None else vote[0].copy() # Returns a copy to ensure that property is not mutated
+
+    @property
+    def stats(self):
+        n_of_validations = self._stats['validations']
+        return {
+            **self._stats,
+            'cached_deltas': len(self._validity_cache),
+            'hit_rate': self._stats['cache_hits'] / n_of_validations if n_of_validations else 0.
+        }
 
     def process_delta(self, delta: Dict[Pos, Tile]):
-        if not self._validate_delta(delta):
+        if (key := self._validate_delta(delta)) is None:
             return False
-        
-        self._last_update = time.time()
-        if delta == self._delta:
-            self._confidence += 1
 
-        self._delta = delta
+        self._window.add(key, delta, self._clock.now())
         return True
 
-    def end_turn(self):
-        if (age := (time.time() - self._last_update) * 1000) > BoardDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS:
-            self._logger.error(f"Most recent update {self._delta} received {age:.2f} ms ago is too old to use in end-of-turn resolution")
+    def end_turn(self, move: Optional[Move] = None):
+        """
+        @param move: Move already built from the current delta and validated (see SpeculativeResolver), which is applied as is
+        """
+        now = self._clock.now()
+        if (vote := self._window.vote(now)) is None:
+            age = (now - self._window.last_update) * 1000
+            self._logger.error(f"Most recent update received {age:.2f} ms ago is too old to use in end-of-turn resolution")
             return False
-        
-        if self._confidence < BoardDeltaResolver.MIN_ACCEPTABLE_CONFIDENCE:
-            self._logger.warning(f"Using delta {self._delta} with low confidence {self._confidence} for end-of-turn resolution")
 
-        if len(self._delta) == 0:
+        delta, confidence = vote
+        if confidence < BoardDeltaResolver.MIN_ACCEPTABLE_CONFIDENCE:
+            self._logger.warning(f"Using delta {delta} with low confidence {confidence} for end-of-turn resolution")
+
+        if len(delta) == 0:
             self._logger.info(f"Ending turn with empty move")
+            # The board is unchanged, so frames of the empty delta keep voting for it
+            self._window.retain_leader()
+            self._validity_cache.clear()
             return True
 
-        move = BoardDeltaResolver.delta_to_move(self._delta)
-        if not move.is_valid:
-            self._logger.error(f"Cannot use move formed by delta {move} in end-of-turn resolution as it is invalid (should never happen)")
-            return False
+        if move is None:
+            move = BoardDeltaResolver.delta_to_move(delta)
+            if not move.is_valid:
+                self._logger.error(f"Cannot use move formed by delta {move} in end-of-turn resolution as it is invalid (should never happen)")
+                return False
 
         if not self._board.apply_move(move):
             self._logger.error(f"Unable to apply move formed by delta {move} to board state")
             return False
 
-        self._delta = {}
-        self._confidence = 0
+        self._window.clear()
+        self._validity_cache.clear()
         return True
 
-    def _validate_delta(self, delta: Dict[Pos, Tile]):
-        confirmed_positions = []
-
-        for pos, tile in delta.items():
-            if (placed_tile := self._board.get_tile(pos)) is not None: 
-                if tile != placed_tile:
-                    self._logger.warning(f'Ignoring board delta {delta} because measured {tile} does not match confirmed {placed_tile} @ {pos}')
-                    return False
-                else:
-                    confirmed_positions.append(pos)
-
-        for pos in confirmed_positions:
-            del delta[pos]
-        
-        if len(delta) > 7:
+    def _validate_delta(self, delta: Dict[Pos, Tile]) -> Optional[int]:
+        """
+        Removes confirmed tiles from the delta, and returns the folded letters of the remaining ones, or None if the delta is invalid
+        """
+        mask, letters, letter_mask = fold_delta(delta)
+        self._stats['validations'] += 1
+        if self._cache_version != self._board.version:
+            # The confirmed tiles the window's deltas were filtered against have changed too
+            self._validity_cache.clear()
+            self._window.clear()
+            self._cache_version = self._board.version
+            self._stats['invalidations'] += 1
+
+        # Every occupied square has a non-zero tile code, so the letters alone identify the delta
+        if letters in self._validity_cache:
+            self._stats['cache_hits'] += 1
+            if (cached := self._validity_cache[letters]) is None:
+                self._logger.debug(f'Ignoring board delta {delta}, which was already rejected this turn')
+                return None
+            placed, key = cached
+            delta.clear()
+            delta.update(placed)
+            return key
+
+        if len(self._validity_cache) >= BoardDeltaResolver.MAX_CACHED_DELTAS:
+            self._validity_cache.clear()
+        if not self._check_delta(delta, mask, letters, letter_mask):
+            self._validity_cache[letters] = None
+            return None
+
+        _, key, _ = fold_delta(delta)
+        self._validity_cache[letters] = (tuple(delta.items()), key)
+        return key
+
+    def _check_delta(self, delta: Dict[Pos, Tile], mask: int, letters: int, letter_mask: int):
+        """
+        Removes confirmed tiles from the delta, and checks the rest could be part of a move
+        """
+        if (conflict := self._board.find_conflict(letters, letter_mask)) >= 0:
+            pos = POSITIONS[conflict]
+            self._logger.warning(f'Ignoring board delta {delta} because measured {delta[pos]} does not match confirmed {self._board.get_tile(pos)} @ {pos}')
+            return False
+
+        placed = self._board.remove_confirmed(delta, mask)
+        if placed.bit_count() > 7:
             self._logger.warning(f'Ignoring board delta {delta} as it contains more than 7 tiles')
             return False
 
-        return len(delta) == 0 or BoardDeltaResolver.delta_to_move(delta).is_valid
+        # Gaps and adjacency are only checked once the move is complete (see BitBoard.is_playable), as tiles may be placed in any order
+        return is_in_line(placed)
     
     @staticmethod
     def delta_to_move(delta: Dict[Pos, Tile]):
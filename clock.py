@@ -0,0 +1,63 @@
+"""
+Source of time for the resolvers and socket supervision.
+
+Snapshot ages, heartbeats and registration slots are all measured against a Clock rather than the time module, so that tests and replays can substitute a VirtualClock. Virtual time only moves when it is advanced, which lets a full game or hours of heartbeats run as fast as the code does, and identically on every run.
+"""
+
+import asyncio
+import heapq
+from time import monotonic
+from typing import List, Tuple
+
+class Clock():
+    def now(self) -> float:
+        """
+        Returns the current time in seconds. Only differences between times are meaningful.
+        """
+        return monotonic()
+
+    async def sleep(self, delay: float):
+        await asyncio.sleep(delay)
+
+class VirtualClock(Clock):
+    def __init__(self, start: float = 0.) -> None:
+        """
+        Clock whose time only changes when advanced. Sleepers are woken in order of their deadline as time passes it.
+        """
+        self._now = start
+        self._sleepers: List[Tuple[float, int, asyncio.Future]] = [] # (deadline, order slept in, future), as a heap
+        self._n_of_sleeps = 0
+
+    def now(self) -> float:
+        return self._now
+
+    async def sleep(self, delay: float):
+        future = asyncio.get_running_loop().create_future()
+        self._n_of_sleeps += 1
+        heapq.heappush(self._sleepers, (self._now + max(delay, 0.), self._n_of_sleeps, future))
+        await future
+
+    @property
+    def n_of_sleepers(self):
+        return len(self._sleepers)
+
+    def advance(self, seconds: float):
+        """
+        Moves time forward, and wakes every sleeper whose deadline has passed. Woken sleepers only run once the caller yields to the event loop, see run_for.
+        """
+        self._now += seconds
+        while self._sleepers and self._sleepers[0][0] <= self._now:
+            _, _, future = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
+
+    async def run_for(self, seconds: float):
+        """
+        Moves time forward one deadline at a time, letting each woken sleeper run (e.g. to sleep again) before time moves on
+        """
+        end = self._now + seconds
+        while self._sleepers and self._sleepers[0][0] <= end:
+            self.advance(self._sleepers[0][0] - self._now)
+            await asyncio.sleep(0)
+        self.advance(end - self._now)
+        await asyncio.sleep(0)
@@ -0,0 +1,169 @@
+"""
+Per-match ring buffer of decoded sensor frames, shared by every consumer of a match's frames (e.g. recording, metrics, spectators, sensor quality analytics).
+
+Each frame the feeds accept is written once into a fixed-size bytearray as a record: a header (seq, time received, role, number of entries) followed by two bytes per entry, (square index, tile code) for a board frame or (tile code, count) for a rack. Consumers do not register with the ring. Each one keeps a FrameCursor, and reads records as memoryviews of the buffer, so adding consumers adds nothing to the cost of writing a frame and no frame is copied per consumer.
+
+The ring never waits for consumers. Once a record's bytes have been reused by newer frames it is gone, and a cursor which falls that far behind skips to the oldest record still held, counting the frames it missed. Records are only valid until the next frame is written, so consumers must read them on the event loop the feeds run on and must not hold on to them across awaits.
+"""
+
+import struct
+from array import array
+from typing import Dict, Iterator, Optional
+
+from board_codec import BOARD_SIZE, N_OF_SQUARES, POSITIONS, TILES_BY_CODE, TILE_CODES
+from clock import Clock
+from matchdata import SensorRole
+
+_ROLES_BY_VALUE = {role.value: role for role in SensorRole}
+
+class FrameRecord():
+    __slots__ = ('seq', 'time', 'role', 'entries')
+
+    HEADER = struct.Struct('<QdBH') # seq, time received, role, number of entries
+
+    def __init__(self, seq: int, time: float, role: SensorRole, entries: memoryview) -> None:
+        """
+        @param entries: Two bytes per entry, (square index, tile code) for a board frame or (tile code, count) for a rack, viewing the ring's buffer
+        """
+        self.seq = seq
+        self.time = time
+        self.role = role
+        self.entries = entries
+
+    def to_delta(self):
+        """
+        Copies the record into the form passed to GameState.process_delta
+        """
+        entries = self.entries
+        if self.role == SensorRole.board:
+            return {POSITIONS[entries[i]]: TILES_BY_CODE[entries[i + 1]] for i in range(0, len(entries), 2)}
+        return {TILES_BY_CODE[entries[i]]: entries[i + 1] for i in range(0, len(entries), 2)}
+
+class FrameCursor():
+    __slots__ = ('_ring', '_next_seq', 'n_of_read', 'n_of_missed')
+
+    def __init__(self, ring: 'FrameRing', next_seq: int) -> None:
+        """
+        A consumer's position in a FrameRing, see FrameRing.cursor
+        """
+        self._ring = ring
+        self._next_seq = next_seq
+        self.n_of_read = 0
+        self.n_of_missed = 0 # Frames overwritten before they were read
+
+    @property
+    def lag(self):
+        """
+        Number of frames written which the cursor has not read yet
+        """
+        return self._ring.last_seq - self._next_seq + 1
+
+    def read(self, limit: Optional[int] = None) -> Iterator[FrameRecord]:
+        """
+        Yields the frames written since the last read, oldest first, skipping any which have been overwritten
+        """
+        ring = self._ring
+        n_of_read = 0
+        while self._next_seq <= ring.last_seq and (limit is None or n_of_read < limit):
+            if (oldest := ring.oldest_seq) > self._next_seq:
+                self.n_of_missed += oldest - self._next_seq
+                self._next_seq = oldest
+            record = ring.get(self._next_seq)
+            self._next_seq += 1
+            self.n_of_read += 1
+            n_of_read += 1
+            yield record
+
+class FrameRing():
+    N_OF_BYTES = 16 * 1024
+    MAX_FRAMES = 512
+    MAX_RECORD_SIZE = FrameRecord.HEADER.size + 2 * N_OF_SQUARES
+
+    def __init__(self, n_of_bytes: int = N_OF_BYTES, max_frames: int = MAX_FRAMES, clock: Optional[Clock] = None) -> None:
+        """
+        @param n_of_bytes: Size of the buffer records are written to, which bounds the ring's memory whatever the frames' sizes
+        @param max_frames: Number of records which can be held, if they are small enough to fit in the buffer
+        @param clock: Clock frames are timestamped with, the system's by default
+        """
+        assert n_of_bytes >= FrameRing.MAX_RECORD_SIZE, f"Ring of {n_of_bytes} bytes cannot hold a full board frame"
+        self._buffer = bytearray(n_of_bytes)
+        self._view = memoryview(self._buffer)
+        self._offsets = array('Q', bytes(8 * max_frames)) # Absolute offset of each held record, indexed by seq % max_frames
+        self._write_offset = 0 # Bytes written since the ring was created, including padding
+        self._last_seq = 0
+        self._oldest_seq = 1
+        self._clock = clock or Clock()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    @property
+    def oldest_seq(self):
+        """
+        Seq of the oldest record still held, or last_seq + 1 if there are none
+        """
+        return self._oldest_seq
+
+    def cursor(self, from_oldest: bool = False) -> FrameCursor:
+        """
+        Returns a cursor which reads frames written from now on, or from the oldest frame still held
+        """
+        return FrameCursor(self, self._oldest_seq if from_oldest else self._last_seq + 1)
+
+    def append(self, role: SensorRole, delta) -> int:
+        """
+        Writes a decoded board delta (Pos -> Tile) or rack histogram (Tile -> count), and returns its seq
+        """
+        n_of_bytes = len(self._buffer)
+        size = FrameRecord.HEADER.size + 2 * len(delta)
+        start = self._write_offset % n_of_bytes
+        if start + size > n_of_bytes:
+            # Records are never split, so that each one can be read as a single memoryview
+            self._write_offset += n_of_bytes - start
+            start = 0
+
+        seq = self._last_seq + 1
+        FrameRecord.HEADER.pack_into(self._buffer, start, seq, self._clock.now(), role.value, len(delta))
+        i = start + FrameRecord.HEADER.size
+        buffer = self._buffer
+        if role == SensorRole.board:
+            for pos, tile in delta.items():
+                buffer[i] = pos.row * BOARD_SIZE + pos.col
+                buffer[i + 1] = TILE_CODES[tile]
+                i += 2
+        else:
+            for tile, count in delta.items():
+                buffer[i] = TILE_CODES[tile]
+                buffer[i + 1] = count
+                i += 2
+
+        max_frames = len(self._offsets)
+        self._offsets[seq % max_frames] = self._write_offset
+        self._write_offset += size
+        self._last_seq = seq
+
+        # Drops the records whose bytes have just been reused, or whose slot in the offsets has
+        self._oldest_seq = max(self._oldest_seq, seq - max_frames + 1)
+        while self._offsets[self._oldest_seq % max_frames] < self._write_offset - n_of_bytes:
+            self._oldest_seq += 1
+        return seq
+
+    def get(self, seq: int) -> Optional[FrameRecord]:
+        """
+        Returns the record with the given seq, or None if it has been overwritten or not written yet
+        """
+        if not self._oldest_seq <= seq <= self._last_seq:
+            return None
+        start = self._offsets[seq % len(self._offsets)] % len(self._buffer)
+        _, time, role, n_of_entries = FrameRecord.HEADER.unpack_from(self._buffer, start)
+        entries_start = start + FrameRecord.HEADER.size
+        return FrameRecord(seq, time, _ROLES_BY_VALUE[role], self._view[entries_start:entries_start + 2 * n_of_entries])
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'frames': self._last_seq,
+            'held': self._last_seq - self._oldest_seq + 1,
+            'bytes': len(self._buffer)
+        }
@@ -0,0 +1,492 @@
+"""
+Plays complete games from a seeded tile bag and turns them into the frame streams the board and rack sensors would produce, optionally corrupted with sensor noise. The streams can be replayed directly against a GameState (deterministic soak test) or sent over TCP/HTTP to a running MatchDataServer (throughput benchmark).
+"""
+
+import asyncio
+import argparse
+import logging
+import random
+import time
+from itertools import combinations
+from typing import Dict, List, Tuple, Optional, Iterator
+
+import aiohttp
+
+from logger import get_logger
+from tile_bag import TileBag
+from matchdata import GameState, SensorRole, Dictionary, FrameRate
+from clock import VirtualClock
+from board_codec import get_pos, get_tile
+
+from scrabble import Pos, Board, Tile, Move
+
+BOARD_SIZE = 15
+CENTRE = 7
+BLANK = '?'
+NOISE_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ?'
+TICK_INTERVAL = 1 / FrameRate.active.fps # Time between a sensor's frames, in seconds
+
+BoardState = Tuple[Tuple[int, int, str], ...] # (row, col, letter) for every visible tile
+RackState = str
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        usage="Simulate full games and replay their sensor streams in-process or against a running server"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--misread", type=float, default=0.)
+    parser.add_argument("--flicker", type=float, default=0.)
+    parser.add_argument("--occlusion", type=float, default=0.)
+    parser.add_argument("--late", type=float, default=0.)
+    parser.add_argument("--tcp", action='store_true', help="Send frames to a running server instead of an in-process GameState")
+    parser.add_argument("--addr", default='localhost')
+    parser.add_argument("--realtime", action='store_true', help="Pace frames at the sensor frame interval (TCP only)")
+    parser.add_argument("--quiet", action='store_true', help="Suppress informational game state logging")
+
+    return parser.parse_args()
+
+class NoiseConfig():
+    def __init__(self, misread: float = 0., flicker: float = 0., occlusion: float = 0., late: float = 0., max_lateness: int = 3) -> None:
+        """
+        Per-frame probabilities of each kind of sensor error.
+
+        @param misread: A tile is read as the wrong letter
+        @param flicker: A spurious tile appears for a single frame
+        @param occlusion: Some tiles are hidden (e.g. by a hand) for a single frame
+        @param late: The frame is delivered after up to max_lateness newer frames from the same turn
+        """
+        self.misread = misread
+        self.flicker = flicker
+        self.occlusion = occlusion
+        self.late = late
+        self.max_lateness = max_lateness
+
+    @property
+    def is_clean(self):
+        return not (self.misread or self.flicker or self.occlusion or self.late)
+
+class Frame():
+    def __init__(self, role: SensorRole, tick: int, payload) -> None:
+        self.role = role
+        self.tick = tick
+        self.payload = payload
+
+    def to_delta(self):
+        """
+        Converts the frame into the form passed to GameState.process_delta, i.e. what the feeds decode
+        """
+        if self.role == SensorRole.board:
+            return {get_pos(row, col): get_tile(ord(letter)) for row, col, letter in self.payload}
+
+        histogram = {}
+        for letter in self.payload:
+            tile = Tile(letter)
+            histogram.setdefault(tile, 0)
+            histogram[tile] += 1
+        return histogram
+
+    def to_capnp(self):
+        """
+        Converts the frame into the message sent by a sensor over BoardFeed.sendMove or RackFeed.sendRack
+        """
+        if self.role == SensorRole.board:
+            return {'tiles': [
+                {'value': ord(letter), 'pos': {'row': row, 'col': col}} for row, col, letter in self.payload
+            ]}
+        return self.payload
+
+    def __repr__(self) -> str:
+        return f"Frame({self.role.name}, {self.tick}, {self.payload!r})"
+
+class SimulatedTurn():
+    def __init__(self, number: int, player: SensorRole, frames: List[Frame], placement: List[Tuple[int, int, str]], score: int, game_over: bool) -> None:
+        self.number = number
+        self.player = player
+        self.frames = frames
+        self.placement = placement
+        self.score = score
+        self.game_over = game_over
+
+    @property
+    def is_pass(self):
+        return len(self.placement) == 0
+
+class GameSimulator():
+    ROLES = (SensorRole.board, SensorRole.player1, SensorRole.player2)
+
+    def __init__(self, seed: int, noise: Optional[NoiseConfig] = None, frames_per_state: int = 2, settle_frames: int = 3, max_turns: int = 100) -> None:
+        """
+        Simulates a single game. Identical arguments always produce identical games and frame streams.
+
+        @param seed: Seed for tile draws, move selection and noise
+        @param noise: Sensor noise applied to frames, defaults to no noise
+        @param frames_per_state: Number of frames each sensor emits per physical state (e.g. after each tile is placed)
+        @param settle_frames: Number of clean frames every sensor emits at the end of each turn, before the clock is pressed
+        @param max_turns: Upper bound on the length of the game
+        """
+        self._seed = seed
+        self._noise = noise or NoiseConfig()
+        self._frames_per_state = frames_per_state
+        self._settle_frames = settle_frames
+        self._max_turns = max_turns
+
+    @property
+    def seed(self):
+        return self._seed
+
+    def turns(self) -> Iterator[SimulatedTurn]:
+        """
+        Plays the game, yielding each turn along with the frames the sensors emit during it
+        """
+        self._rng = random.Random(self._seed)
+        self._bag = TileBag()
+        self._board = Board()
+        self._placed: Dict[Tuple[int, int], str] = {}
+        self._tick = 0
+        racks: Dict[SensorRole, List[str]] = {SensorRole.player1: [], SensorRole.player2: []}
+        passes = 0
+
+        for turn_n in range(self._max_turns):
+            playing = SensorRole.player2 if turn_n % 2 else SensorRole.player1
+            drawing = playing.opposite
+
+            # Player 1 draws their opening rack before playing, which GameState confirms as soon as it sees 7 tiles
+            opening_states = []
+            if turn_n == 0:
+                opening_states = self._draw_states(racks[playing])
+
+            play_rack = racks[playing]
+            board_before = self._board_state()
+            placement = self._find_move(play_rack)
+            score = 0 if placement is None else self._board.get_score()
+            placement = placement or []
+
+            board_states = [board_before] * len(opening_states)
+            play_states = list(opening_states)
+            remaining = list(play_rack)
+            for i in range(len(placement) + 1):
+                board_states.append(tuple(sorted(board_before + tuple(placement[:i]))))
+                if i > 0:
+                    remaining.remove(placement[i - 1][2])
+                play_states.append(''.join(remaining))
+            racks[playing] = remaining
+
+            draw_states = self._draw_states(racks[drawing])
+            frames = self._emit_frames(
+                {SensorRole.board: board_states, playing: play_states, drawing: draw_states},
+                clean_prefix={playing: len(opening_states) * self._frames_per_state}
+            )
+
+            passes = passes + 1 if len(placement) == 0 else 0
+            game_over = (self._bag.n_of_tiles == 0 and len(racks[playing]) == 0) or passes >= 2
+            yield SimulatedTurn(turn_n, playing, frames, placement, score, game_over)
+            if game_over:
+                return
+
+    @property
+    def board(self) -> Board:
+        return self._board
+
+    def _board_state(self) -> BoardState:
+        return tuple(sorted((row, col, letter) for (row, col), letter in self._placed.items()))
+
+    def _draw_states(self, rack: List[str]) -> List[RackState]:
+        """
+        Draws tiles one at a time until the rack is full (or the bag is empty), returning the rack after each draw
+        """
+        states = [''.join(rack)]
+        while len(rack) < 7 and self._bag.n_of_tiles > 0:
+            tile, = self._bag.draw(1, self._rng).keys()
+            rack.append(tile.letter)
+            states.append(''.join(rack))
+        return states
+
+    def _find_move(self, rack: List[str]) -> Optional[List[Tuple[int, int, str]]]:
+        """
+        Finds a legal move using tiles from the rack, applies it to the simulator's board and returns the placed tiles in placement order. Blanks are never played. Returns None if no move is found.
+        """
+        playable = [letter for letter in rack if letter != BLANK]
+        anchors = sorted(self._placed) or [None]
+        self._rng.shuffle(anchors)
+
+        for size in range(len(playable), 0, -1):
+            keys = sorted({''.join(sorted(subset)) for subset in combinations(playable, size)})
+            self._rng.shuffle(keys)
+            for anchor in anchors:
+                for key in keys:
+                    if (placement := self._try_anchor(key, anchor)) is not None:
+                        return placement
+        return None
+
+    def _try_anchor(self, key: str, anchor: Optional[Tuple[int, int]]):
+        if anchor is None:
+            for word in Dictionary().anagrams(key):
+                start = CENTRE - self._rng.randrange(len(word))
+                if (placement := self._try_place(word, (CENTRE, start), (0, 1))) is not None:
+                    return placement
+            return None
+
+        letter = self._placed[anchor]
+        directions = [(0, 1), (1, 0)]
+        self._rng.shuffle(directions)
+        for word in Dictionary().anagrams(key + letter):
+            for i, c in enumerate(word):
+                if c != letter:
+                    continue
+                for d_row, d_col in directions:
+                    start = (anchor[0] - i * d_row, anchor[1] - i * d_col)
+                    if (placement := self._try_place(word, start, (d_row, d_col))) is not None:
+                        return placement
+        return None
+
+    def _try_place(self, word: str, start: Tuple[int, int], direction: Tuple[int, int]):
+        d_row, d_col = direction
+        squares = [(start[0] + i * d_row, start[1] + i * d_col) for i in range(len(word))]
+        before = (start[0] - d_row, start[1] - d_col)
+        after = (squares[-1][0] + d_row, squares[-1][1] + d_col)
+        if not all(0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE for row, col in squares):
+            return None
+        if before in self._placed or after in self._placed:
+            return None
+
+        placement = []
+        for (row, col), letter in zip(squares, word):
+            if (row, col) in self._placed:
+                if self._placed[(row, col)] != letter:
+                    return None
+            else:
+                placement.append((row, col, letter))
+        if len(placement) == 0:
+            return None
+
+        move = Move([Tile(letter) for _, _, letter in placement], [Pos(row, col) for row, col, _ in placement])
+        if not move.is_valid or not self._board.apply_move(move):
+            return None
+        if not all(Dictionary().is_valid(word) for word in self._board.get_challenge_words()):
+            self._board.undo_move()
+            return None
+
+        for row, col, letter in placement:
+            self._placed[(row, col)] = letter
+        return placement
+
+    def _emit_frames(self, states: Dict[SensorRole, list], clean_prefix: Dict[SensorRole, int]) -> List[Frame]:
+        """
+        Interleaves the per-sensor state sequences into a single frame stream for one turn. Every sensor emits one frame per tick, finishing with settle_frames clean frames of its final state.
+        """
+        streams = {
+            role: [state for state in states[role] for _ in range(self._frames_per_state)]
+            for role in GameSimulator.ROLES
+        }
+        noisy_len = max(len(stream) for stream in streams.values())
+        total_len = noisy_len + self._settle_frames
+
+        scheduled = []
+        for i in range(total_len):
+            for role in GameSimulator.ROLES:
+                stream = streams[role]
+                payload = stream[min(i, len(stream) - 1)]
+                delivery = i
+                if clean_prefix.get(role, 0) <= i < noisy_len:
+                    payload = self._apply_noise(role, payload)
+                    if self._rng.random() < self._noise.late:
+                        delivery = min(i + self._rng.randint(1, self._noise.max_lateness), noisy_len - 1)
+                scheduled.append((delivery, len(scheduled), role, payload))
+
+        scheduled.sort()
+        frames = [Frame(role, self._tick + delivery, payload) for delivery, _, role, payload in scheduled]
+        self._tick += total_len
+        return frames
+
+    def _apply_noise(self, role: SensorRole, payload):
+        rng = self._rng
+        noise = self._noise
+        items = list(payload)
+
+        if items and rng.random() < noise.misread:
+            i = rng.randrange(len(items))
+            letter = rng.choice(NOISE_LETTERS)
+            items[i] = (items[i][0], items[i][1], letter) if role == SensorRole.board else letter
+
+        if rng.random() < noise.flicker:
+            letter = rng.choice(NOISE_LETTERS)
+            if role == SensorRole.board:
+                row, col = rng.randrange(BOARD_SIZE), rng.randrange(BOARD_SIZE)
+                if all((row, col) != (r, c) for r, c, _ in items):
+                    items.append((row, col, letter))
+            else:
+                items.append(letter)
+
+        if items and rng.random() < noise.occlusion:
+            for _ in range(rng.randint(1, min(3, len(items)))):
+                del items[rng.randrange(len(items))]
+
+        if role == SensorRole.board:
+            return tuple(sorted(items))
+        return ''.join(items)
+
+class SimulationReport():
+    def __init__(self, seed: int) -> None:
+        self.seed = seed
+        self.turns = 0
+        self.frames_sent = 0
+        self.frames_accepted = 0
+        self.score_mismatches: List[int] = []
+        self.failed_turn: Optional[int] = None
+        self.board_matches = True
+        self.elapsed = 0.
+
+    @property
+    def is_success(self):
+        return self.failed_turn is None and not self.score_mismatches and self.board_matches
+
+    @property
+    def frames_per_second(self):
+        return self.frames_sent / self.elapsed if self.elapsed > 0 else 0.
+
+    def __str__(self) -> str:
+        status = 'ok' if self.is_success else f'FAILED (turn={self.failed_turn}, score mismatches={self.score_mismatches}, board matches={self.board_matches})'
+        return f"seed={self.seed} turns={self.turns} frames={self.frames_sent} accepted={self.frames_accepted} elapsed={self.elapsed:.3f}s ({self.frames_per_second:.0f} frames/s) {status}"
+
+class _LocalConnectionHandler():
+    """
+    Stands in for ConnectionHandler when the game state is driven in-process, where there is no board sensor to confirm moves to
+    """
+    def confirm_move(self, match_id, move):
+        return 0
+
+    def set_frame_rate(self, match_id, role, fps):
+        pass
+
+async def run_in_process(simulator: GameSimulator, match_id: str = 'Simulated') -> SimulationReport:
+    """
+    Replays a simulated game directly against a GameState, as fast as possible. The game state's clock is virtual and moves on by TICK_INTERVAL per tick, so snapshot ages are as they would be when streamed in real time.
+    """
+    report = SimulationReport(simulator.seed)
+    clock = VirtualClock()
+    game_state = GameState(match_id, ('Player 1', 'Player 2'), _LocalConnectionHandler(), clock)
+    start = time.perf_counter()
+
+    for turn in simulator.turns():
+        for frame in turn.frames:
+            clock.advance(max(frame.tick * TICK_INTERVAL - clock.now(), 0.))
+            report.frames_sent += 1
+            if game_state.process_delta(frame.role, frame.to_delta()):
+                report.frames_accepted += 1
+
+        res = await game_state.end_turn(player_time=0)
+        report.turns += 1
+        if not res.is_success:
+            report.failed_turn = turn.number
+            break
+        if res.value.score != turn.score:
+            report.score_mismatches.append(turn.number)
+
+    report.elapsed = time.perf_counter() - start
+    report.board_matches = str(game_state.board) == str(simulator.board)
+    return report
+
+async def run_over_tcp(loop: asyncio.AbstractEventLoop, simulator: GameSimulator, addr: str = 'localhost', sensor_port: int = 9189, http_port: int = 9190, mac_base: int = 0x5100, realtime: bool = False, frame_interval: float = 0.1) -> SimulationReport:
+    """
+    Plays a simulated game against a running MatchDataServer, using fake sensor clients for the frames and the HTTP API for match setup and end of turn
+    """
+    # Imported here so that in-process simulation does not require the client modules
+    from board_client import FakeBoardClient
+    from rack_client import FakeRackClient
+
+    logger = get_logger('GameSimulator')
+    report = SimulationReport(simulator.seed)
+    board = FakeBoardClient(loop, mac_base, send_test_frames=False)
+    racks = {
+        SensorRole.player1: FakeRackClient(loop, mac_base + 1, send_test_frames=False),
+        SensorRole.player2: FakeRackClient(loop, mac_base + 2, send_test_frames=False)
+    }
+
+    async def wait_until(condition, timeout=10.):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise TimeoutError("Timed out waiting for simulated sensors")
+            await asyncio.sleep(0.05)
+
+    # ConnectionHandler hands out the most recently registered rack first, so player 2's rack registers before player 1's
+    clients = [board, racks[SensorRole.player2], racks[SensorRole.player1]]
+    connections = []
+    for client in clients:
+        connections.append(asyncio.ensure_future(client.connect(addr=addr, port=sensor_port)))
+        await wait_until(lambda: client.is_registered)
+
+    base_url = f'http://{addr}:{http_port}'
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'{base_url}/setup', params={'p1': f'Sim-{simulator.seed}-1', 'p2': f'Sim-{simulator.seed}-2'}) as res:
+                body = await res.json()
+            if 'error' in body:
+                raise RuntimeError(f"Unable to set up simulated match: {body['error']}")
+            match_id = body['body']['match_id']
+            await wait_until(lambda: all(client.is_assigned for client in clients))
+            logger.info(f"[{match_id}] Simulated sensors assigned, starting game")
+
+            start = time.perf_counter()
+            for turn in simulator.turns():
+                tick = None
+                pending = []
+                for frame in turn.frames:
+                    if tick is not None and frame.tick != tick:
+                        # Yield to the send queues between ticks, so frames are pipelined rather than sent one round trip at a time
+                        await asyncio.sleep(frame_interval if realtime else 0)
+                    tick = frame.tick
+                    report.frames_sent += 1
+                    if frame.role == SensorRole.board:
+                        pending.append(board.queue_move(frame.to_capnp()))
+                    else:
+                        pending.append(racks[frame.role].queue_rack(frame.to_capnp()))
+
+                # Frames superseded in a send queue resolve to None and are not counted as accepted
+                responses = await asyncio.gather(*pending)
+                report.frames_accepted += sum(1 for res in responses if res is not None and res.success)
+
+                params = {'match_id': match_id, 'turn_number': turn.number, 'player_time': 0}
+                async with session.get(f'{base_url}/end-turn', params=params) as res:
+                    body = await res.json()
+                report.turns += 1
+                if 'error' in body:
+                    logger.error(f"[{match_id}] End of turn {turn.number} failed: {body['error']}")
+                    report.failed_turn = turn.number
+                    break
+                if body['body']['score'] != turn.score:
+                    report.score_mismatches.append(turn.number)
+            report.elapsed = time.perf_counter() - start
+    finally:
+        for client in clients:
+            await client.disconnect()
+        await asyncio.gather(*connections, return_exceptions=True)
+
+    return report
+
+async def main(loop):
+    args = parse_args()
+    if args.quiet:
+        logging.disable(logging.INFO)
+    noise = NoiseConfig(args.misread, args.flicker, args.occlusion, args.late)
+
+    reports = []
+    for game in range(args.games):
+        simulator = GameSimulator(args.seed + game, noise)
+        if args.tcp:
+            report = await run_over_tcp(loop, simulator, addr=args.addr, mac_base=0x5100 + 3 * game, realtime=args.realtime)
+        else:
+            report = await run_in_process(simulator, match_id=f'Simulated{game}')
+        print(report)
+        reports.append(report)
+
+    frames = sum(report.frames_sent for report in reports)
+    elapsed = sum(report.elapsed for report in reports)
+    failures = sum(not report.is_success for report in reports)
+    print(f"{len(reports)} games, {failures} failed, {frames} frames in {elapsed:.3f}s ({frames / elapsed if elapsed else 0:.0f} frames/s)")
+
+if __name__ == '__main__':
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(main(loop))
@@ -34,15 +34,16 @@ def addLoggingLevel(levelName, levelNum, methodName=None):
 addLoggingLevel('DEBUG2', logging.DEBUG - 1)
 
 loggers = {}
+handlers = []
 
-def get_logger(name) -> logging.Logger:
-    global loggers
+def get_handlers():
+    """
+    Returns the handlers every logger writes to. They are shared, as each match has several loggers and a handler per logger would hold an open log file each.
+    """
+    global handlers
 
-    if loggers.get(name):
-        return loggers.get(name)
-    
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    if handlers:
+        return handlers
 
     ch = logging.StreamHandler()
     ch.setLevel(logging.DEBUG)
@@ -53,8 +54,20 @@ def get_logger(name) -> logging.Logger:
     formatter = logging.Formatter('%(asctime)s [%(levelname)-s] [%(name)-5s] %(message)s')
     ch.setFormatter(formatter)
     fh.setFormatter(formatter)
-    logger.addHandler(ch)
-    logger.addHandler(fh)
+
+    handlers = [ch, fh]
+    return handlers
+
+def get_logger(name) -> logging.Logger:
+    global loggers
+
+    if loggers.get(name):
+        return loggers.get(name)
+    
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    for handler in get_handlers():
+        logger.addHandler(handler)
 
     loggers[name] = logger
     return logger
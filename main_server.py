@@ -1,22 +1,90 @@
+import argparse
 import asyncio
+import signal
+from typing import Optional
 
 from tcp_server import TCPServer
+from sensor_thread import SensorThread
 from web_server import HTTPServer
 from logger import get_logger
+from matchdata import GameStateStore
+from match_directory import MatchDirectory, Node
+from publisher import Publisher
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Runs the sensor (TCP) and match (HTTP) servers"
+    )
+    parser.add_argument("--workers", type=int, default=0, help="Number of worker processes to shard matches across (0 runs every match in this process)")
+    parser.add_argument("--sensor-port", type=int, default=9189)
+    parser.add_argument("--http-port", type=int, default=9190)
+    parser.add_argument("--directory", help="Match directory database shared by every node at the event, enables redirecting sensors between nodes")
+    parser.add_argument("--node-id", help="Name of this node in the match directory (defaults to host:sensor port)")
+    parser.add_argument("--host", default='localhost', help="Address other nodes' sensors are redirected to for this node's matches")
+    parser.add_argument("--sensor-thread", action='store_true', help="Serve sensors on their own thread and event loop, so that HTTP traffic and sensor frames do not delay each other")
+    parser.add_argument("--packed-transport", action='store_true', help="Accept sensors' requests for the packed transport, which uses less bandwidth but more CPU than the plain stream")
+    parser.add_argument("--publish-url", help="Endpoint of the broadcast platform game events are published to (events are not published if unset)")
+    parser.add_argument("--publish-spill", default='publish_spill.db', help="File events waiting to be published are spilled to, and resumed from after a restart")
+
+    return parser.parse_args()
 
 class MatchDataServer:
-    def __init__(self, loop):
+    def __init__(self, loop, n_of_workers: int = 0, sensor_port: int = 9189, http_port: int = 9190, directory: Optional[MatchDirectory] = None, node: Optional[Node] = None, sensor_thread: bool = False, publisher: Optional[Publisher] = None, packed: bool = False):
+        """
+        @param n_of_workers: Number of worker processes to shard matches across, see match_shards.py. Matches run in this process if 0.
+        @param directory: Directory shared with the other nodes running the event, see match_directory.py
+        @param node: This node's entry in the directory
+        @param sensor_thread: Serve sensors on their own thread, see sensor_thread.py
+        @param publisher: Publisher game events are sent to the broadcast platform through, see publisher.py
+        @param packed: Accept sensors' requests for the packed transport, see transport.py
+        """
         self._loop = loop
-        self._tcp_server = TCPServer(loop)
-        self._http_server = HTTPServer(loop, self._tcp_server)
+        self._n_of_workers = n_of_workers
+        self._publisher = publisher
+        if sensor_thread:
+            self._tcp_server = SensorThread(loop, sensor_port, directory, node, packed)
+        else:
+            self._tcp_server = TCPServer(loop, sensor_port, directory, node, packed=packed)
+        self._http_server = HTTPServer(loop, self._tcp_server, http_port)
         self._logger = get_logger('MainServer')
 
     async def start(self):
         self._logger.info('Starting MatchDataServer')
+        if self._n_of_workers > 0:
+            # Imported here so that single process servers do not need multiprocessing set up
+            from match_shards import ShardPool
+            GameStateStore().use_shards(ShardPool(self._n_of_workers, self._publisher))
+        elif self._publisher is not None:
+            GameStateStore().use_publisher(self._publisher)
+        if self._publisher is not None:
+            self._publisher.resume()
+        GameStateStore().admission.start()
         await asyncio.gather(self._tcp_server.start(), self._http_server.start())
 
+    async def close(self):
+        """
+        Closes the publisher, which spills the events it has not published yet for the next run to resume
+        """
+        self._logger.info('Stopping MatchDataServer')
+        if self._publisher is not None:
+            await self._publisher.close()
+
 if __name__ == '__main__':
+    args = parse_args()
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    server = MatchDataServer(loop)
-    loop.run_until_complete(server.start())
\ No newline at end of file
+    directory, node = None, None
+    if args.directory is not None:
+        directory = MatchDirectory(args.directory)
+        node = Node(args.node_id or f'{args.host}:{args.sensor_port}', args.host, args.sensor_port, args.http_port)
+    publisher = Publisher(args.publish_url, args.publish_spill) if args.publish_url is not None else None
+    server = MatchDataServer(loop, args.workers, args.sensor_port, args.http_port, directory, node, args.sensor_thread, publisher, args.packed_transport)
+    serving = asyncio.ensure_future(server.start(), loop=loop)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, serving.cancel)
+    try:
+        loop.run_until_complete(serving)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
@@ -0,0 +1,185 @@
+"""
+Per-match serialisation of game state changes.
+
+Each match's GameState is owned by a MatchActor: a single task which takes frames and commands (end of turn, challenges, blank updates) off a queue and applies them one at a time, in the order they arrived. Frames give way to other matches' commands, and are coalesced when the loop is overloaded (see admission.py). Sensor callbacks and HTTP handlers only enqueue work, so a slow operation in one match (e.g. logging the board at the end of a turn) delays that match's queue rather than every connection on the loop. As all access to a GameState goes through its actor, matches could later be moved onto worker threads or processes without changing the callers.
+"""
+
+import asyncio
+import inspect
+from collections import deque
+from time import monotonic, perf_counter, thread_time
+from typing import Any, Callable, Deque, Dict, Optional
+
+from admission import AdmissionController, Priority
+from logger import get_logger
+from usage import CpuTimer, UsageTracker
+
+class MatchActor():
+    MAX_QUEUED = 256
+    MAX_QUEUED_COMMANDS = 32
+    __slots__ = ('_match_id', '_game_state', '_max_queued', '_max_queued_commands', '_admission', '_queue', '_latest_frames', '_n_of_commands', '_wakeup', '_task', '_logger', '_stats', '_total_latency', '_max_latency', '_usage')
+
+    def __init__(self, match_id: str, game_state, max_queued: int = MAX_QUEUED, admission: Optional[AdmissionController] = None, max_queued_commands: int = MAX_QUEUED_COMMANDS):
+        """
+        @param game_state: GameState owned by the actor, which should not be accessed other than through it
+        @param max_queued: Number of frames and commands which may be waiting. Frames arriving at a full queue are dropped, as the sensor sends a newer one shortly, while commands are queued regardless so that a clock press never waits for space behind frames.
+        @param max_queued_commands: Number of commands which may be waiting. Players send a command every few seconds at most, so a longer queue means a client is flooding the match, and further commands are rejected.
+        @param admission: Controller shared by the process's actors, which holds every match's frames back while a command is waiting (see admission.py). The actor has its own by default.
+        """
+        self._match_id = match_id
+        self._game_state = game_state
+        self._max_queued = max_queued
+        self._max_queued_commands = max_queued_commands
+        self._admission = admission or AdmissionController()
+        self._queue: Deque[list] = deque() # [time queued, role or args, delta or command, None or future]
+        self._latest_frames: Dict[Any, list] = {} # Newest frame of each role queued since the last command, which frames are coalesced into
+        self._n_of_commands = 0
+        self._wakeup: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Future] = None
+        self._logger = get_logger(f'{__class__.__name__}-{match_id}')
+        self._stats = {'frames': 0, 'rejected_frames': 0, 'dropped_frames': 0, 'coalesced_frames': 0, 'shed_frames': 0, 'commands': 0, 'rejected_commands': 0, 'max_queue_depth': 0}
+        self._total_latency = 0.
+        self._max_latency = 0.
+        self._usage = UsageTracker()
+
+    def post_frame(self, role, delta) -> bool:
+        """
+        Queues a sensor frame without waiting for it to be processed. Returns False if it was dropped because the queue is full.
+        """
+        if self._admission.is_overloaded and (queued := self._latest_frames.get(role)) is not None:
+            # Each frame is a full snapshot of its sensor, so the newer one takes the queued frame's place
+            queued[2] = delta
+            self._stats['coalesced_frames'] += 1
+            self._admission.on_coalesced()
+            return True
+
+        if len(self._queue) >= self._max_queued:
+            self._stats['dropped_frames'] += 1
+            self._admission.on_dropped()
+            self._logger.warning(f"Queue full, dropping frame from {role}")
+            return False
+
+        frame = [monotonic(), role, delta, None]
+        self._queue.append(frame)
+        self._latest_frames[role] = frame
+        self._admission.on_queued(Priority.frames)
+        self._on_queued()
+        return True
+
+    async def call(self, command: Callable[..., Any], *args):
+        """
+        Runs command(game_state, *args) on the actor once the work queued before it is done, and returns its result. The command may be a coroutine function. Raises asyncio.QueueFull if max_queued_commands commands are already waiting.
+        """
+        if self._n_of_commands >= self._max_queued_commands:
+            self._stats['rejected_commands'] += 1
+            self._logger.warning(f"{self._n_of_commands} commands queued, rejecting {getattr(command, '__name__', 'command')}")
+            raise asyncio.QueueFull(f"Match {self._match_id} has too many commands queued")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append([monotonic(), args, command, future])
+        # Frames queued before the command must not be replaced by ones which arrive after it
+        self._latest_frames.clear()
+        self._n_of_commands += 1
+        self._admission.on_queued(Priority.control)
+        self._on_queued()
+        return await future
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def stats(self):
+        n_of_items = self._stats['frames'] + self._stats['commands']
+        return {
+            **self._stats,
+            'queue_depth': self.queue_depth,
+            'mean_queue_latency': self._total_latency / n_of_items if n_of_items else 0.,
+            'max_queue_latency': self._max_latency
+        }
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Commands left queued must not hold back other matches' frames
+        for _, _, _, future in self._queue:
+            if future is not None:
+                future.cancel()
+        self._admission.on_removed(Priority.control, self._n_of_commands)
+        self._admission.on_removed(Priority.frames, len(self._queue) - self._n_of_commands)
+        self._queue.clear()
+        self._latest_frames.clear()
+        self._n_of_commands = 0
+
+    def _on_queued(self):
+        self._stats['max_queue_depth'] = max(self.queue_depth, self._stats['max_queue_depth'])
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            # Frames wait while another match has a command waiting, but not when they are ahead of this match's own
+            if not self._queue or (self._queue[0][3] is None and self._n_of_commands == 0 and not self._admission.frames_may_run):
+                self._wakeup = asyncio.get_running_loop().create_future()
+                if self._queue:
+                    self._admission.wait_for_commands(self._wakeup)
+                await self._wakeup
+                self._wakeup = None
+                continue
+
+            queued = self._queue.popleft()
+            queued_at, arg, item, future = queued
+            # Frames carry their role, and commands their arguments
+            if future is None:
+                if self._latest_frames.get(arg) is queued:
+                    del self._latest_frames[arg]
+                elif self._admission.is_overloaded and self._n_of_commands == 0 and arg in self._latest_frames:
+                    # Superseded by a newer frame from the same sensor, queued before the loop was overloaded
+                    self._stats['shed_frames'] += 1
+                    self._admission.on_shed()
+                    continue
+                self._on_started(Priority.frames, queued_at)
+                cpu_start, start = thread_time(), perf_counter()
+                self._process_frame(arg, item)
+                self._usage.record(self._match_id, 'frames', thread_time() - cpu_start, perf_counter() - start, role=arg)
+                # Lets other matches and the HTTP handlers run between frames
+                await asyncio.sleep(0)
+            else:
+                self._n_of_commands -= 1
+                self._on_started(Priority.control, queued_at)
+                await self._run_command(item, arg, future)
+
+    def _on_started(self, priority: Priority, queued_at: float):
+        latency = monotonic() - queued_at
+        self._total_latency += latency
+        self._max_latency = max(latency, self._max_latency)
+        self._admission.on_started(priority, latency)
+
+    def _process_frame(self, role, delta):
+        self._stats['frames'] += 1
+        try:
+            if not self._game_state.process_delta(role, delta):
+                self._stats['rejected_frames'] += 1
+        except Exception as err:
+            self._logger.error(f"Error processing frame from {role}: {err}")
+
+    async def _run_command(self, command, args, future: asyncio.Future):
+        self._stats['commands'] += 1
+        # Other matches run while the command awaits, so only its own steps are charged to it
+        timer, start = CpuTimer(), perf_counter()
+        try:
+            res = timer.run(command, self._game_state, *args)
+            if inspect.isawaitable(res):
+                res = await timer.wait(res)
+        except Exception as err:
+            if not future.done():
+                future.set_exception(err)
+            return
+        finally:
+            self._usage.record(self._match_id, getattr(command, '__name__', 'command'), timer.cpu, perf_counter() - start)
+
+        if not future.done():
+            future.set_result(res)
@@ -0,0 +1,89 @@
+"""
+Commands which HTTP requests and server tasks run on a match's actor (see match_actor.py).
+
+Each command is a module level function taking the match's GameState followed by plain arguments, and returns a plain (picklable) value. This lets the same commands run on an in-process MatchActor or be sent to the worker process which owns the match (see match_shards.py).
+"""
+
+from typing import Any, Dict, List
+
+from util import Result
+from logger import get_logger
+from board_codec import PackedBoard
+import matchdata as md
+
+logger = get_logger('MatchCommands')
+
+def validate_turn(game_state: 'md.GameState', turn_number: int, turn_modifier: int = 0) -> Result[None]:
+    if game_state.turn_number + turn_modifier != turn_number:
+        logger.error(f"[{game_state.match_id}] Received request with turn number {turn_number} that does not match game state turn number {game_state.turn_number} + {turn_modifier}")
+        return Result.failure("Turn out of sync")
+    return Result.success(None)
+
+async def end_turn(game_state: 'md.GameState', turn_number: int, player_time) -> Result[Dict[str, Any]]:
+    if not (res := validate_turn(game_state, turn_number)).is_success:
+        return res
+
+    logger.info(f"[{game_state.match_id}] Received end turn event")
+    res = await game_state.end_turn(player_time)
+    return Result.success(res.value.to_dict()) if res.is_success else Result.failure(res.error)
+
+def get_challengeable_words(game_state: 'md.GameState', turn_number: int) -> Result[Dict[str, Any]]:
+    if not (res := validate_turn(game_state, turn_number, turn_modifier=-1)).is_success:
+        return res
+
+    challenge_words = list(game_state.board.get_challenge_words())
+    logger.info(f"[{game_state.match_id}] Challenge request initiated, available words = {challenge_words}")
+
+    if len(challenge_words) == 0:
+        return Result.failure("No challenge words")
+    return Result.success({"words": challenge_words})
+
+def challenge(game_state: 'md.GameState', turn_number: int, words: List[str]) -> Result[Dict[str, Any]]:
+    if not (res := validate_turn(game_state, turn_number)).is_success:
+        return res
+
+    match_id = game_state.match_id
+    if not words:
+        return Result.failure("No challenge words provided")
+    elif not all(word in game_state.board.get_challenge_words() for word in words):
+        logger.error(f'[{match_id}] Received challenge with words {words} that do not match challengable words {game_state.board.get_challenge_words()}')
+        return Result.failure("Invalid challenge words")
+
+    logger.info(f"[{match_id}] Received challenge request on {words}")
+
+    successful = any(not md.Dictionary().is_valid(word) for word in words)
+
+    previous_score = game_state.board.get_score()
+
+    if successful:
+        logger.info(f"[{match_id}] Challenge was successful, undoing previous move")
+        game_state.on_successful_challenge()
+    else:
+        logger.info(f"[{match_id}] Challenge was unsuccessful, applying {len(words) * 5}-point penalty")
+
+    return Result.success({
+        "successful": successful,
+        "challenger_penalty": len(words) * 5,
+        "undone_move_score": previous_score
+    })
+
+def set_blanks(game_state: 'md.GameState', turn_number: int, blanks: List[str]) -> Result[Dict[str, Any]]:
+    # Blanks are set on the previous turn's play
+    if not (res := validate_turn(game_state, turn_number, turn_modifier=-1)).is_success:
+        return res
+
+    match_id = game_state.match_id
+    if game_state.board.set_blanks(''.join(blanks)):
+        logger.info(f"[{match_id}] Updated blank tile(s) of previous play to {blanks}")
+        logger.info(f"[{match_id}] Updated board state:\n{game_state.board}")
+        return Result.success({})
+    return Result.failure("Unable to set blanks")
+
+def get_packed_board(game_state: 'md.GameState') -> PackedBoard:
+    return PackedBoard.from_board(game_state.board)
+
+def sync(game_state: 'md.GameState') -> None:
+    """
+    Does nothing, awaiting it waits for all the work queued on the actor before it
+    """
+    return None
@@ -0,0 +1,114 @@
+"""
+Directory of which MatchDataServer node owns each match, shared by every node at an event.
+
+Nodes record the matches they assign and the sensors in them, so a sensor which reconnects to the wrong node (e.g. after a network change, or because sensors are configured with a single address) can be redirected to the node running its match. The directory is a SQLite database, which several nodes on one host or a shared file system can use directly; it stands in for a networked service with the same interface.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+from logger import get_logger
+
+class Node():
+    def __init__(self, node_id: str, host: str, sensor_port: int, http_port: int) -> None:
+        self.node_id = node_id
+        self.host = host
+        self.sensor_port = sensor_port
+        self.http_port = http_port
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Node) and (self.node_id, self.host, self.sensor_port, self.http_port) == (other.node_id, other.host, other.sensor_port, other.http_port)
+
+    def __str__(self) -> str:
+        return f"{self.node_id} ({self.host}:{self.sensor_port})"
+
+class MatchDirectory():
+    def __init__(self, path: Union[str, Path] = ':memory:', timeout: float = 5.):
+        """
+        @param path: SQLite database shared by the nodes. The default in-memory database is only visible to this process, which is enough for a single node.
+        @param timeout: Seconds to wait for another node's write to finish
+        """
+        # Shared by the sensor and HTTP threads when sensors are served on their own thread (see sensor_thread.py)
+        self._db = sqlite3.connect(str(path), timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._logger = get_logger(__class__.__name__)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, host TEXT NOT NULL, sensor_port INTEGER NOT NULL, http_port INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS matches (match_id TEXT PRIMARY KEY, node_id TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS sensors (mac_addr INTEGER PRIMARY KEY, match_id TEXT NOT NULL);
+        ''')
+
+    def register_node(self, node: Node):
+        """
+        Adds the node, or updates its address if it has restarted elsewhere
+        """
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)', (node.node_id, node.host, node.sensor_port, node.http_port))
+        self._logger.info(f"Registered node {node}")
+
+    def claim_match(self, match_id: str, node_id: str, mac_addrs: Iterable[int]) -> bool:
+        """
+        Records that the node owns the match and its sensors. Returns False if another node already owns a match with this ID.
+        """
+        with self._transaction():
+            try:
+                self._db.execute('INSERT INTO matches VALUES (?, ?)', (match_id, node_id))
+            except sqlite3.IntegrityError:
+                self._logger.error(f"[{match_id}] Match is already owned by node {self._get_match_node_id(match_id)}")
+                return False
+            # Sensors move with their newest match
+            self._db.executemany('INSERT OR REPLACE INTO sensors VALUES (?, ?)', [(mac_addr, match_id) for mac_addr in mac_addrs])
+        return True
+
+    def release_match(self, match_id: str):
+        with self._transaction():
+            self._db.execute('DELETE FROM sensors WHERE match_id = ?', (match_id,))
+            self._db.execute('DELETE FROM matches WHERE match_id = ?', (match_id,))
+
+    def get_match_node(self, match_id: str) -> Optional[Node]:
+        return self._get_node('SELECT nodes.* FROM matches JOIN nodes USING (node_id) WHERE match_id = ?', match_id)
+
+    def get_sensor_node(self, mac_addr: int) -> Optional[Node]:
+        """
+        Returns the node running the match the sensor is assigned to, or None if it is not in a match
+        """
+        return self._get_node('SELECT nodes.* FROM sensors JOIN matches USING (match_id) JOIN nodes USING (node_id) WHERE mac_addr = ?', mac_addr)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _get_node(self, query: str, key) -> Optional[Node]:
+        with self._lock:
+            row = self._db.execute(query, (key,)).fetchone()
+        return None if row is None else Node(*row)
+
+    def _get_match_node_id(self, match_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute('SELECT node_id FROM matches WHERE match_id = ?', (match_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def _transaction(self):
+        return _Transaction(self._db, self._lock)
+
+class _Transaction():
+    def __init__(self, db: sqlite3.Connection, lock: threading.RLock):
+        self._db = db
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._db.execute('BEGIN IMMEDIATE')
+        except Exception:
+            self._lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._db.execute('ROLLBACK' if exc_type is not None else 'COMMIT')
+        finally:
+            self._lock.release()
+        return False
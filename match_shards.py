@@ -0,0 +1,459 @@
+"""
+Sharding of matches across worker processes.
+
+The front end process keeps every sensor connection and the HTTP server, but each match's GameState lives in one of N worker processes, chosen by consistent hashing of the match ID. The front end talks to a match through a RemoteMatchActor, which has the same interface as MatchActor: frames are batched and sent to the owning worker over a pipe, and commands (see match_commands.py) are sent by reference along with their arguments. Moves confirmed and frame rates chosen by a worker's GameState are sent back to the front end, which owns the sensors, as are the events it publishes (the front end owns the publisher's connections and spill file).
+
+Frames are sent as tuples of tile codes and square indices rather than Pos and Tile objects, keeping the messages small and cheap to pickle.
+
+Messages are pickled and sent over a socket pair, which each side only reads and writes when it is ready, so neither event loop ever blocks on the other process. Messages sent while the socket is full are buffered, and frames for a worker with more than MAX_BUFFERED bytes waiting to be written are dropped, as the sensor sends a newer frame shortly. If a worker exits, its matches' pending commands fail and their frames are dropped.
+
+Each worker forwards the CPU and wall time its matches use to the front end every USAGE_INTERVAL seconds (see usage.py), where it is charged to the matches and their sensors alongside the front end's own work.
+
+Each worker has its own AdmissionController (see admission.py), so commands take priority over the frames of the matches in the same worker, and the front end's /debug/admission only shows its own loop's lag.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import pickle
+import socket
+import struct
+from itertools import count
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logger import get_logger
+from board_codec import POSITIONS, TILES_BY_CODE, TILE_CODES, BOARD_SIZE
+from admission import AdmissionController
+from match_actor import MatchActor
+from usage import UsageTracker
+from matchdata import GameState, SensorRole
+from scrabble import Move
+
+class HashRing():
+    N_OF_REPLICAS = 64
+
+    def __init__(self, n_of_nodes: int, n_of_replicas: int = N_OF_REPLICAS):
+        """
+        Consistent hash ring mapping keys onto nodes 0..n_of_nodes-1. Each node is placed on the ring n_of_replicas times to even out the share of keys each one gets.
+        """
+        points = sorted((HashRing._hash(f'{node}-{replica}'), node) for node in range(n_of_nodes) for replica in range(n_of_replicas))
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key: str) -> int:
+        i = bisect.bisect(self._points, HashRing._hash(key))
+        return self._nodes[i % len(self._nodes)]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+class _MessageChannel():
+    HEADER = struct.Struct('!I')
+    READ_SIZE = 1 << 16
+    CLOSE_TIMEOUT = 1.
+
+    def __init__(self, connection, on_message: Callable[[tuple], None], on_closed: Callable[[], None]):
+        """
+        Length prefixed, pickled messages over one end of a multiprocessing Pipe, whose Connection is closed once its socket is taken over. Must be created from the event loop which reads and writes it.
+
+        @param on_message: Called with each message received
+        @param on_closed: Called once if the other end closes the connection, or it fails
+        """
+        self._socket = socket.socket(fileno=os.dup(connection.fileno()))
+        connection.close()
+        self._socket.setblocking(False)
+        self._loop = asyncio.get_running_loop()
+        self._on_message = on_message
+        self._on_closed = on_closed
+        self._inbox = bytearray()
+        self._outbox = bytearray()
+        self._is_writing = False
+        self._is_closed = False
+        self._logger = get_logger(__class__.__name__)
+        self._loop.add_reader(self._socket.fileno(), self._on_readable)
+
+    @property
+    def is_closed(self):
+        return self._is_closed
+
+    @property
+    def n_of_buffered_bytes(self):
+        return len(self._outbox)
+
+    def send(self, msg: tuple) -> bool:
+        """
+        Writes as much of the message as the socket takes without blocking, and buffers the rest until it is writable. Returns False if the channel is closed.
+        """
+        if self._is_closed:
+            return False
+        data = pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+        self._outbox += _MessageChannel.HEADER.pack(len(data))
+        self._outbox += data
+        if not self._is_writing:
+            self._on_writable()
+            if self._outbox and not self._is_closed:
+                self._is_writing = True
+                self._loop.add_writer(self._socket.fileno(), self._on_writable)
+        return True
+
+    def close(self):
+        """
+        Closes the channel after writing what is still buffered, waiting at most CLOSE_TIMEOUT seconds for the other end to read it
+        """
+        if self._is_closed:
+            return
+        self._stop()
+        try:
+            self._socket.settimeout(_MessageChannel.CLOSE_TIMEOUT)
+            self._socket.sendall(self._outbox)
+        except OSError:
+            pass
+        self._outbox.clear()
+        self._socket.close()
+
+    def _stop(self):
+        self._is_closed = True
+        self._loop.remove_reader(self._socket.fileno())
+        if self._is_writing:
+            self._is_writing = False
+            self._loop.remove_writer(self._socket.fileno())
+
+    def _fail(self):
+        self._stop()
+        self._outbox.clear()
+        self._socket.close()
+        self._on_closed()
+
+    def _on_writable(self):
+        try:
+            n = self._socket.send(self._outbox)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._fail()
+            return
+        del self._outbox[:n]
+        if not self._outbox and self._is_writing:
+            self._is_writing = False
+            self._loop.remove_writer(self._socket.fileno())
+
+    def _on_readable(self):
+        try:
+            data = self._socket.recv(_MessageChannel.READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._fail()
+            return
+
+        self._inbox += data
+        header_size = _MessageChannel.HEADER.size
+        while not self._is_closed and len(self._inbox) >= header_size:
+            size, = _MessageChannel.HEADER.unpack_from(self._inbox)
+            if len(self._inbox) < header_size + size:
+                break
+            msg = pickle.loads(self._inbox[header_size:header_size + size])
+            del self._inbox[:header_size + size]
+            try:
+                self._on_message(msg)
+            except Exception:
+                # Carry on with the messages after it, which may not be followed by more data
+                self._logger.exception(f"Unable to handle message {msg[0]}")
+
+def _encode_delta(role: SensorRole, delta) -> Tuple[Tuple[int, int], ...]:
+    """
+    Encodes a board delta (Pos -> Tile) as (square index, tile code) pairs, or a rack histogram (Tile -> count) as (tile code, count) pairs
+    """
+    if role == SensorRole.board:
+        return tuple((pos.row * BOARD_SIZE + pos.col, TILE_CODES[tile]) for pos, tile in delta.items())
+    return tuple((TILE_CODES[tile], n) for tile, n in delta.items())
+
+def _decode_delta(role: SensorRole, items: Tuple[Tuple[int, int], ...]):
+    if role == SensorRole.board:
+        return {POSITIONS[i]: TILES_BY_CODE[code] for i, code in items}
+    return {TILES_BY_CODE[code]: n for code, n in items}
+
+def _encode_move(move: Move) -> Tuple[Tuple[int, int], ...]:
+    return tuple((TILE_CODES[tile], pos.row * BOARD_SIZE + pos.col) for tile, pos in move)
+
+def _decode_move(items: Tuple[Tuple[int, int], ...]) -> Move:
+    return Move([TILES_BY_CODE[code] for code, _ in items], [POSITIONS[i] for _, i in items])
+
+class RemoteMatchActor():
+    def __init__(self, pool: 'ShardPool', worker: int, match_id: str):
+        """
+        Front end handle to a match owned by a worker process, used in the same way as a MatchActor
+        """
+        self._pool = pool
+        self._worker = worker
+        self._match_id = match_id
+        self._stats = {'frames': 0, 'rejected_frames': 0, 'commands': 0}
+        self._total_call_latency = 0.
+        self._max_call_latency = 0.
+
+    @property
+    def worker(self):
+        return self._worker
+
+    def post_frame(self, role, delta) -> bool:
+        """
+        Returns False if the frame was dropped, as the worker has exited or is not keeping up
+        """
+        self._stats['frames'] += 1
+        if not self._pool.post_frame(self._worker, self._match_id, role, delta):
+            self._stats['rejected_frames'] += 1
+            return False
+        return True
+
+    async def call(self, command: Callable[..., Any], *args):
+        start = monotonic()
+        res = await self._pool.call(self._worker, self._match_id, command, args)
+        latency = monotonic() - start
+        self._stats['commands'] += 1
+        self._total_call_latency += latency
+        self._max_call_latency = max(latency, self._max_call_latency)
+        return res
+
+    @property
+    def stats(self):
+        n_of_commands = self._stats['commands']
+        return {
+            **self._stats,
+            'worker': self._worker,
+            'mean_call_latency': self._total_call_latency / n_of_commands if n_of_commands else 0.,
+            'max_call_latency': self._max_call_latency
+        }
+
+    def close(self):
+        pass
+
+class ShardPool():
+    MAX_BUFFERED = 1 << 22
+
+    def __init__(self, n_of_workers: int, publisher=None):
+        """
+        Starts n_of_workers worker processes and routes each match to one of them. Must be created and used from the front end's event loop.
+
+        @param publisher: Publisher the matches' events are published through, see publisher.py
+        """
+        self._publisher = publisher
+        self._ring = HashRing(n_of_workers)
+        self._logger = get_logger(__class__.__name__)
+        self._channels: List[_MessageChannel] = []
+        self._processes = []
+        self._outbox: List[List[tuple]] = [[] for _ in range(n_of_workers)]
+        self._flush_scheduled = False
+        self._calls: List[Dict[int, asyncio.Future]] = [{} for _ in range(n_of_workers)]
+        self._call_ids = count(1)
+        self._connection_handlers: Dict[str, Any] = {}
+        self._loop = asyncio.get_running_loop()
+
+        # Spawned rather than forked, so workers do not inherit the front end's event loop and sockets
+        context = multiprocessing.get_context('spawn')
+        for worker in range(n_of_workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=_run_worker, args=(worker, worker_connection), daemon=True, name=f'MatchShard-{worker}')
+            process.start()
+            worker_connection.close()
+            self._channels.append(_MessageChannel(connection, lambda msg, worker=worker: self._handle(worker, msg), lambda worker=worker: self._on_closed(worker)))
+            self._processes.append(process)
+        self._logger.info(f"Started {n_of_workers} match worker processes")
+
+    @property
+    def n_of_workers(self):
+        return len(self._processes)
+
+    def get_worker(self, match_id: str) -> int:
+        return self._ring.get_node(match_id)
+
+    def is_alive(self, worker: int) -> bool:
+        return not self._channels[worker].is_closed
+
+    def create_match(self, match_id: str, player_names: Tuple[str, str], connection_handler) -> RemoteMatchActor:
+        """
+        Creates the match's game state on its worker. connection_handler receives the worker's confirm_move and set_frame_rate calls for the match.
+        """
+        worker = self.get_worker(match_id)
+        self._connection_handlers[match_id] = connection_handler
+        self._send(worker, ('create', match_id, player_names, self._publisher is not None))
+        self._logger.info(f"[{match_id}] Assigned to worker {worker}")
+        return RemoteMatchActor(self, worker, match_id)
+
+    def post_frame(self, worker: int, match_id: str, role, delta) -> bool:
+        """
+        Frames are batched until the front end next yields to the event loop, so that a burst of frames costs one message per worker. Returns False if the frame was dropped, as the worker has exited or more than MAX_BUFFERED bytes are waiting to be written to it.
+        """
+        channel = self._channels[worker]
+        if channel.is_closed or channel.n_of_buffered_bytes > ShardPool.MAX_BUFFERED:
+            return False
+        self._outbox[worker].append((match_id, role, _encode_delta(role, delta)))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+        return True
+
+    async def call(self, worker: int, match_id: str, command: Callable[..., Any], args: tuple):
+        call_id = next(self._call_ids)
+        future = self._loop.create_future()
+        self._calls[worker][call_id] = future
+        if not self._send(worker, ('call', call_id, match_id, command, args)):
+            del self._calls[worker][call_id]
+            raise RuntimeError(f"Match worker {worker} has exited")
+        return await future
+
+    def close(self):
+        for channel in self._channels:
+            channel.send(('stop',))
+            channel.close()
+        for process in self._processes:
+            process.join(timeout=2.)
+        for worker in range(self.n_of_workers):
+            self._fail_calls(worker, RuntimeError("Match worker pool closed"))
+
+    def _send(self, worker: int, msg: tuple) -> bool:
+        # Frames already batched for the worker must arrive before the message
+        if self._outbox[worker]:
+            self._flush()
+        return self._channels[worker].send(msg)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        for worker, frames in enumerate(self._outbox):
+            if frames:
+                self._outbox[worker] = []
+                self._channels[worker].send(('frames', frames))
+
+    def _on_closed(self, worker: int):
+        self._logger.error(f"Match worker {worker} exited, failing its {len(self._calls[worker])} pending calls")
+        self._outbox[worker] = []
+        self._fail_calls(worker, RuntimeError(f"Match worker {worker} has exited"))
+
+    def _fail_calls(self, worker: int, error: Exception):
+        calls, self._calls[worker] = self._calls[worker], {}
+        for future in calls.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _handle(self, worker: int, msg: tuple):
+        match msg:
+            case ('result', call_id, value):
+                if (future := self._calls[worker].pop(call_id, None)) is not None and not future.done():
+                    future.set_result(value)
+            case ('error', call_id, error):
+                if (future := self._calls[worker].pop(call_id, None)) is not None and not future.done():
+                    future.set_exception(RuntimeError(f"Match worker {worker}: {error}"))
+            case ('confirm_move', match_id, move):
+                self._connection_handlers[match_id].confirm_move(match_id, _decode_move(move))
+            case ('set_frame_rate', match_id, role, fps):
+                self._connection_handlers[match_id].set_frame_rate(match_id, role, fps)
+            case ('publish', match_id, event):
+                self._publisher.publish(match_id, event)
+            case ('usage', records):
+                usage = UsageTracker()
+                for match_id, kind, role, calls, cpu, wall in records:
+                    usage.record(match_id, kind, cpu, wall, role=role, calls=calls)
+            case _:
+                self._logger.error(f"Unexpected message from match worker {worker}: {msg[0]}")
+
+class _WorkerConnectionHandler():
+    def __init__(self, send: Callable[[tuple], bool]):
+        """
+        Stands in for ConnectionHandler inside a worker, forwarding the calls a GameState makes on it to the front end
+
+        @param send: Sends a message to the front end without blocking
+        """
+        self._send = send
+
+    def confirm_move(self, match_id, move: Move) -> int:
+        # The front end numbers the move when it queues it for the board
+        self._send(('confirm_move', match_id, _encode_move(move)))
+        return 0
+
+    def set_frame_rate(self, match_id, role, fps: float):
+        self._send(('set_frame_rate', match_id, role, fps))
+
+class _WorkerPublisher():
+    def __init__(self, send: Callable[[tuple], bool]):
+        """
+        Stands in for Publisher inside a worker, forwarding events to the front end's publisher
+        """
+        self._send = send
+
+    def publish(self, match_id, event) -> int:
+        # The front end's publisher numbers the event
+        self._send(('publish', match_id, event))
+        return 0
+
+class _ShardWorker():
+    USAGE_INTERVAL = 1.
+
+    def __init__(self, index: int, connection):
+        self._index = index
+        self._connection = connection
+        self._channel: Optional[_MessageChannel] = None
+        self._connection_handler = _WorkerConnectionHandler(self._send)
+        self._publisher = _WorkerPublisher(self._send)
+        self._actors: Dict[str, MatchActor] = {}
+        self._admission = AdmissionController()
+        self._stopped: Optional[asyncio.Event] = None
+        self._logger = get_logger(f'{__class__.__name__}-{index}')
+
+    async def run(self):
+        self._stopped = asyncio.Event()
+        self._channel = _MessageChannel(self._connection, self._handle, self._on_closed)
+        self._admission.start()
+        UsageTracker().forward()
+        forwarding = asyncio.ensure_future(self._forward_usage())
+        await self._stopped.wait()
+        forwarding.cancel()
+        for actor in self._actors.values():
+            actor.close()
+        self._admission.close()
+        self._send_usage()
+        self._channel.close()
+
+    def _send(self, msg: tuple) -> bool:
+        return self._channel.send(msg)
+
+    async def _forward_usage(self):
+        while True:
+            await asyncio.sleep(_ShardWorker.USAGE_INTERVAL)
+            self._send_usage()
+
+    def _send_usage(self):
+        if records := UsageTracker().take_forwarded():
+            self._send(('usage', records))
+
+    def _on_closed(self):
+        self._logger.warning("Front end closed the connection, stopping")
+        self._stopped.set()
+
+    def _handle(self, msg: tuple):
+        match msg:
+            case ('frames', frames):
+                for match_id, role, delta in frames:
+                    self._actors[match_id].post_frame(role, _decode_delta(role, delta))
+            case ('call', call_id, match_id, command, args):
+                asyncio.ensure_future(self._call(call_id, self._actors[match_id], command, args))
+            case ('create', match_id, player_names, publish):
+                game_state = GameState(match_id, player_names, self._connection_handler, publisher=self._publisher if publish else None)
+                self._actors[match_id] = MatchActor(match_id, game_state, admission=self._admission)
+            case ('stop',):
+                self._stopped.set()
+
+    async def _call(self, call_id: int, actor: MatchActor, command: Callable[..., Any], args: tuple):
+        try:
+            res = await actor.call(command, *args)
+        except Exception as err:
+            self._send(('error', call_id, repr(err)))
+            return
+        self._send(('result', call_id, res))
+
+def _run_worker(index: int, connection):
+    asyncio.run(_ShardWorker(index, connection).run())
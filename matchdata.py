@@ -2,7 +2,7 @@ from enum import Enum
 from pathlib import Path
 import random
 import string
-from typing import Dict, Tuple, Optional
+from typing import Any, Dict, Tuple, Optional
 
 from util import Singleton, Result
 from logger import get_logger
@@ -10,6 +10,11 @@ from logger import get_logger
 from tile_bag import TileBag
 from rack_delta_resolver import RackDeltaResolver, RackState
 from board_delta_resolver import BoardDeltaResolver
+from speculative_resolver import SpeculativeResolver
+from bitboard import BitBoard
+from clock import Clock
+from match_actor import MatchActor
+from admission import AdmissionController
 
 from scrabble.src.board_pos import Pos
 from scrabble.src.board import Board
@@ -40,27 +45,69 @@ class GameStateStore(metaclass=Singleton):
     _VALID_MATCH_ID_CHARACTERS = string.ascii_letters + string.digits
     def __init__(self):
         self._game_state_mapping: Dict[str, GameState] = {}
+        self._actors: Dict[str, MatchActor] = {}
+        self._shards = None
+        self._publisher = None
+        self._admission = AdmissionController()
 
     def generate_new_match_id(self):
         def create_random_id():
             return ''.join(random.choices(GameStateStore._VALID_MATCH_ID_CHARACTERS, k=8))
 
-        while (match_id := create_random_id()) in self._game_state_mapping:
+        while (match_id := create_random_id()) in self._actors:
             match_id = create_random_id()
         
         return match_id
 
 
     def create_new_match(self, match_id: str, player_names: Tuple[str, str], connection_handler):
-        assert match_id not in self._game_state_mapping, f"Cannot start new match with match_id={match_id}, this id is already taken"
+        assert match_id not in self._actors, f"Cannot start new match with match_id={match_id}, this id is already taken"
 
-        self._game_state_mapping[match_id] = GameState(match_id, player_names, connection_handler)
+        if self._shards is not None:
+            self._actors[match_id] = self._shards.create_match(match_id, player_names, connection_handler)
+            return
+
+        game_state = GameState(match_id, player_names, connection_handler, publisher=self._publisher)
+        self._game_state_mapping[match_id] = game_state
+        self._actors[match_id] = MatchActor(match_id, game_state, admission=self._admission)
+
+    def use_shards(self, shards):
+        """
+        Creates new matches in worker processes rather than in this process, see match_shards.py
+
+        @param shards: ShardPool owning the worker processes
+        """
+        self._shards = shards
+
+    def use_publisher(self, publisher):
+        """
+        Publishes the events of matches created from now on to the broadcast platform, see publisher.py. Sharded matches publish through the ShardPool's publisher instead.
+        """
+        self._publisher = publisher
+
+    @property
+    def admission(self) -> AdmissionController:
+        """
+        Controller shared by the actors of the matches owned by this process, see admission.py
+        """
+        return self._admission
 
     def get_game_state(self, match_id):
+        """
+        Returns the match's game state if it is owned by this process (i.e. matches are not sharded)
+        """
         return self._game_state_mapping.get(match_id)
+
+    def get_actor(self, match_id) -> Optional[MatchActor]:
+        """
+        Returns the actor through which the match's game state should be changed, see match_actor.py
+        """
+        return self._actors.get(match_id)
     
 
 class EndOfTurn():
+    __slots__ = ('score', 'n_of_blanks', 'end_of_game_bonus')
+
     def __init__(self, score: int, n_of_blanks: int, end_of_game_bonus: Optional[int] = None) -> None:
         self.score = score
         self.n_of_blanks = n_of_blanks
@@ -78,23 +125,81 @@ class EndOfTurn():
         return res
 
 class PlayerInfo():
+    __slots__ = ('name', 'score', 'time')
+
     def __init__(self, name: str) -> None:
         self.name = name
         self.score = 0
         self.time = 0
 
+class FrameRate(Enum):
+    """
+    Rates (in frames per second) the server asks sensors to stream at. Every sensor's latest snapshot is used at the end of each turn, so even the idle rate must keep snapshots younger than the resolvers' MAX_SNAPSHOT_AGE_IN_MS.
+    """
+    idle = 1.
+    stable = 2.
+    active = 10.
+
+    @property
+    def fps(self):
+        return self.value
+
+class FrameRateController():
+    STABLE_AFTER_N_FRAMES = 3
+    __slots__ = ('_rates', '_last_views', '_n_of_unchanged')
+
+    def __init__(self) -> None:
+        """
+        Tracks how each sensor's view of a match has been changing, and the frame rate it was last asked to stream at
+        """
+        # Indexed by role.value - 1, as a list of three items is a fraction of the size of a dict
+        self._rates = [FrameRate.active] * len(SensorRole)
+        self._last_views = [None] * len(SensorRole)
+        self._n_of_unchanged = [0] * len(SensorRole)
+
+    def observe(self, role: SensorRole, view) -> bool:
+        """
+        Records the view in an accepted frame. Returns True if the sensor's view has been unchanged for long enough to be considered stable.
+        """
+        i = role.value - 1
+        if view == self._last_views[i]:
+            self._n_of_unchanged[i] += 1
+        else:
+            self._last_views[i] = view
+            self._n_of_unchanged[i] = 0
+        return self._n_of_unchanged[i] >= FrameRateController.STABLE_AFTER_N_FRAMES
+
+    def set_rate(self, role: SensorRole, rate: FrameRate) -> bool:
+        """
+        Returns True if the rate differs from the one the sensor was last given, i.e. the sensor needs to be told
+        """
+        if self._rates[role.value - 1] == rate:
+            return False
+        self._rates[role.value - 1] = rate
+        return True
+
+    def get_rate(self, role: SensorRole) -> FrameRate:
+        return self._rates[role.value - 1]
+
 class GameState():
-    def __init__(self, match_id: str, player_names: Tuple[str, str], connection_handler) -> None:
+    __slots__ = ('_match_id', '_connection_handler', '_publisher', '_bag', '_board', '_logger', '_delta_resolvers', '_player_info', '_turn_n', '_frame_rates', '_speculation')
+
+    def __init__(self, match_id: str, player_names: Tuple[str, str], connection_handler, clock: Optional[Clock] = None, publisher=None) -> None:
+        """
+        @param clock: Clock the resolvers measure snapshot ages with, the system's by default. Replays pass a VirtualClock (see clock.py).
+        @param publisher: Publisher (see publisher.py) the match's events are sent to the broadcast platform through, or None if they are not published
+        """
         self._match_id = match_id
         self._connection_handler = connection_handler
+        self._publisher = publisher
         self._bag = TileBag()
-        self._board = Board()
+        self._board = BitBoard()
         base_logger_name = f'{__class__.__name__}-{match_id}'
         self._logger = get_logger(base_logger_name)
         self._delta_resolvers = {
-            SensorRole.board: BoardDeltaResolver(self._board, get_logger(f'{base_logger_name}-board')),
-            SensorRole.player1: RackDeltaResolver(self._bag, get_logger(f'{base_logger_name}-rackP1')),
-            SensorRole.player2: RackDeltaResolver(self._bag, get_logger(f'{base_logger_name}-rackP2'))
+            SensorRole.board: BoardDeltaResolver(self._board, get_logger(f'{base_logger_name}-board'), clock),
+            SensorRole.player1: RackDeltaResolver(self._bag, get_logger(f'{base_logger_name}-rackP1'), clock),
+            SensorRole.player2: RackDeltaResolver(self._bag, get_logger(f'{base_logger_name}-rackP2'), clock)
         }    
         p1_name, p2_name = player_names
         self._player_info = {
@@ -102,6 +207,12 @@ class GameState():
             SensorRole.player2: PlayerInfo(p2_name)
         }
         self._turn_n = 0
+        self._frame_rates = FrameRateController()
+        self._speculation = SpeculativeResolver(self._board, get_logger(f'{base_logger_name}-speculation'))
+
+    @property
+    def match_id(self):
+        return self._match_id
 
     @property
     def turn_number(self):
@@ -121,7 +232,10 @@ class GameState():
                 self._logger.error(f"Player 1's rack was invalid after drawing at the start of game - should be impossible (rack={resolver.current_rack})")
             else:
                 self._logger.info(f"Confirmed player 1's initial rack state {resolver.current_rack}")
-                # TODO: Propagate update to Woogles
+                self._publish({'type': 'rack', 'turn': 0, 'player': SensorRole.player1.name, 'rack': GameState._format_rack(resolver.current_rack)})
+
+        if res:
+            self._update_frame_rates(role, delta)
 
         self._logger.debug2(f"Finished processing delta {delta} from role {role}")
         return res
@@ -144,8 +258,11 @@ class GameState():
         playing_rack = self._get_playing_rack()
         playing_rack_delta = playing_rack.delta
         board_delta = self._board_resolver.delta
+        # A candidate built from these exact deltas has already been matched, validated and applied once, so it only needs committing
+        candidate = self._speculation.take(board_delta, playing_rack_delta)
 
-        if any(not resolver.end_turn() for resolver in self._delta_resolvers.values()):
+        if (not self._board_resolver.end_turn(candidate.move if candidate is not None else None)
+                or any(not self._delta_resolvers[role].end_turn() for role in (SensorRole.player1, SensorRole.player2))):
             self._logger.error("Unable to resolve end of turn deltas due to resolver error")
             return Result.failure("Game State error")
         
@@ -154,15 +271,15 @@ class GameState():
         move = None
         if n_of_tiles_from_rack > 0 and n_of_tiles_played == 0:
             self._logger.info(f"Player {self._get_playing_player()} exchanged tiles {playing_rack_delta}")
-            # TODO: Send info to Woogles
+            play = {'type': 'exchange', 'tiles': GameState._format_rack(playing_rack_delta)}
         elif n_of_tiles_from_rack == 0 and n_of_tiles_played == 0:
             self._logger.info(f"Player {self._get_playing_player()} passed")
-            # TODO: Send info to Woogles
-        elif GameState._resolve_deltas(playing_rack_delta, board_delta):
-            move = BoardDeltaResolver.delta_to_move(board_delta)
+            play = {'type': 'pass'}
+        elif candidate is not None or GameState._resolve_deltas(playing_rack_delta, board_delta):
+            move = candidate.move if candidate is not None else BoardDeltaResolver.delta_to_move(board_delta)
             self._logger.info(f"Player {self._get_playing_player()} played move {move}")
-            await self._connection_handler.confirm_move(self._match_id, move)
-            # TODO: Send info to Woogles
+            self._connection_handler.confirm_move(self._match_id, move) # Delivered to the board in the background
+            play = {'type': 'move', 'tiles': [{'row': pos.row, 'col': pos.col, 'letter': tile.letter} for tile, pos in move]}
         else:
             self._logger.error(f"Could not resolve rack play delta {playing_rack_delta} and tiles in board delta {board_delta}")
             return Result.failure("Game State error")
@@ -182,11 +299,18 @@ class GameState():
             )
 
         self._player_info[self._get_playing_player()].time = player_time
+        self._publish({
+            'turn': self._turn_n,
+            'player': self._get_playing_player().name,
+            **play,
+            **end_of_turn_info.to_dict(),
+            'time': player_time,
+            'racks': {role.name: GameState._format_rack(self._delta_resolvers[role].current_rack) for role in (SensorRole.player1, SensorRole.player2)}
+        })
         self._turn_n += 1        
         self._logger.info(f"Board State:\n{self._board}")
         self._logger.info(f"P1 Rack State: {self._delta_resolvers[SensorRole.player1].current_rack}")
         self._logger.info(f"P2 Rack State: {self._delta_resolvers[SensorRole.player2].current_rack}")
-        # TODO: Send rack info to woogles
 
         return Result.success(end_of_turn_info)
     
@@ -195,6 +319,7 @@ class GameState():
         Performs the required state changes associated with a successful challenge, i.e. undoing the move on the board and resetting the relevant player's rack. Returns the score associated with the undone play.
         """
         move_info = self._board.undo_move()
+        self._speculation.invalidate()
         played_tiles = {}
         for tile, _ in move_info.move:
             played_tiles.setdefault(tile, 0)
@@ -204,12 +329,73 @@ class GameState():
             raise RuntimeError("Unable to undo challenge (should never happen)")
         
         self._logger.info(f"Challenged move has been undone:\n{self._board}")
+        self._publish({'type': 'challenge', 'turn': self._turn_n - 1, 'undone_score': move_info.score})
         return move_info.score
     
     @property
     def board(self):
         return self._board
 
+    def get_frame_rate(self, role: SensorRole) -> FrameRate:
+        return self._frame_rates.get_rate(role)
+
+    @property
+    def speculative_score(self) -> Optional[int]:
+        """
+        Score of the move the playing player currently has on the board, if it has been fully placed
+        """
+        candidate = self._speculation.candidate
+        return None if candidate is None else candidate.score
+
+    @property
+    def speculation_stats(self):
+        return self._speculation.stats
+
+    @property
+    def validation_stats(self):
+        return self._board_resolver.stats
+
+    def _publish(self, event: Dict[str, Any]):
+        if self._publisher is not None:
+            self._publisher.publish(self._match_id, event)
+
+    def _update_frame_rates(self, role: SensorRole, view):
+        """
+        Lowers the frame rate of sensors whose view is stable, and raises it when the view changes or the playing player looks to have finished placing their move (so the end-of-turn snapshots are fresh)
+        """
+        if not self._frame_rates.observe(role, view):
+            self._set_frame_rate(role, FrameRate.active)
+        elif role == self._get_playing_player().opposite:
+            rack = self._get_drawing_rack()
+            finished_drawing = rack.n_of_tiles == self._bag.get_expected_tiles_on_rack(rack.previous_rack)
+            self._set_frame_rate(role, FrameRate.idle if finished_drawing else FrameRate.stable)
+        elif self._is_move_placed():
+            self._set_frame_rate(SensorRole.board, FrameRate.active)
+            self._set_frame_rate(self._get_playing_player(), FrameRate.active)
+        else:
+            self._set_frame_rate(role, FrameRate.stable)
+
+    def _set_frame_rate(self, role: SensorRole, rate: FrameRate):
+        if self._frame_rates.set_rate(role, rate):
+            self._logger.debug(f"Setting {role} frame rate to {rate.fps} fps ({rate.name})")
+            self._connection_handler.set_frame_rate(self._match_id, role, rate.fps)
+
+    def _is_move_placed(self):
+        """
+        Returns True if the tiles missing from the playing player's rack are all on the board, in which case the speculative candidate is brought up to date with the placed move
+        """
+        board_delta = self._board_resolver.delta
+        playing_rack = self._get_playing_rack()
+        if len(board_delta) == 0 or playing_rack.state != RackState.Playing:
+            return False
+
+        rack_delta = playing_rack.delta
+        if not GameState._resolve_deltas(rack_delta, board_delta):
+            return False
+
+        self._speculation.update(board_delta, rack_delta)
+        return True
+
     @property
     def _board_resolver(self) -> BoardDeltaResolver:
         return self._delta_resolvers[SensorRole.board]
@@ -223,6 +409,10 @@ class GameState():
     def _get_drawing_rack(self) -> RackDeltaResolver:
         return self._delta_resolvers[self._get_playing_player().opposite]
     
+    @staticmethod
+    def _format_rack(rack: Dict[Tile, int]) -> str:
+        return ''.join(sorted(tile.letter * count for tile, count in rack.items()))
+
     @staticmethod
     def _resolve_deltas(rack_delta: Dict[Tile, int], board_delta: Dict[Pos, Tile]):
         board_hist = {}
@@ -238,6 +428,19 @@ class Dictionary(metaclass=Singleton):
         with open(path) as f:
             words = f.read().splitlines()
             self._valid_words = frozenset(words)
+        self._anagram_index: Optional[Dict[str, Tuple[str, ...]]] = None
 
     def is_valid(self, word: str):
-        return word in self._valid_words
\ No newline at end of file
+        return word in self._valid_words
+
+    def anagrams(self, letters: str) -> Tuple[str, ...]:
+        """
+        Returns every valid word which uses exactly the given letters (in any order), sorted alphabetically. The index is built on first use, as it is only needed by the game simulator
+        """
+        if self._anagram_index is None:
+            index: Dict[str, list] = {}
+            for word in self._valid_words:
+                index.setdefault(''.join(sorted(word)), []).append(word)
+            self._anagram_index = {key: tuple(sorted(words)) for key, words in index.items()}
+
+        return self._anagram_index.get(''.join(sorted(letters.upper())), ())
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""
+Publishing of game events (moves, passes, exchanges, racks, challenges) to the broadcast platform.
+
+GameState only hands events to the Publisher, which queues them and returns straight away, so a slow or unreachable platform never delays the end of a turn. Each match has its own queue, numbered from 1, which is delivered strictly in order by a background task: events published at about the same time are sent together in one request, and a failed request is retried with backoff before anything newer is sent. Requests from every match share a pool of keep-alive connections.
+
+A match holds at most MAX_IN_MEMORY unpublished events, after which newer ones are written to a SQLite spill file and read back once the queue has drained. Events still queued when the publisher is closed are spilled too, and a publisher opened on the same file resumes publishing them. Delivery is at least once: a request which timed out may still have been received, so the platform should ignore events whose seq it has already seen for the match.
+"""
+
+import asyncio
+import json
+import sqlite3
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import aiohttp
+from aiohttp import web
+
+from backoff import ReconnectPolicy
+from clock import Clock
+from logger import get_logger
+
+class EventSpill():
+    def __init__(self, path: Union[str, Path] = ':memory:'):
+        """
+        Events waiting to be published which are not held in memory, keyed by match and seq
+
+        @param path: SQLite database, which should be on persistent storage for events to survive a restart
+        """
+        self._db = sqlite3.connect(str(path), isolation_level=None)
+        self._db.executescript('''
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS events (match_id TEXT NOT NULL, seq INTEGER NOT NULL, body TEXT NOT NULL, PRIMARY KEY (match_id, seq));
+        ''')
+
+    def append(self, rows: List[Tuple[str, int, str]]):
+        """
+        @param rows: (match_id, seq, JSON encoded event) of each event
+        """
+        self._db.execute('BEGIN')
+        self._db.executemany('INSERT OR REPLACE INTO events VALUES (?, ?, ?)', rows)
+        self._db.execute('COMMIT')
+
+    def load(self, match_id: str, after_seq: int, limit: int) -> List[Tuple[int, str]]:
+        """
+        Returns the (seq, JSON encoded event) of the match's oldest events after after_seq
+        """
+        return self._db.execute('SELECT seq, body FROM events WHERE match_id = ? AND seq > ? ORDER BY seq LIMIT ?', (match_id, after_seq, limit)).fetchall()
+
+    def delete_through(self, match_id: str, seq: int):
+        self._db.execute('DELETE FROM events WHERE match_id = ? AND seq <= ?', (match_id, seq))
+
+    def get_pending(self) -> Dict[str, Tuple[int, int, int]]:
+        """
+        Returns the first seq, last seq and number of events spilled for each match
+        """
+        rows = self._db.execute('SELECT match_id, MIN(seq), MAX(seq), COUNT(*) FROM events GROUP BY match_id').fetchall()
+        return {match_id: (first, last, n) for match_id, first, last, n in rows}
+
+    def close(self):
+        self._db.close()
+
+class MatchPublisher():
+    __slots__ = ('_publisher', '_match_id', '_pending', '_n_of_spilled', '_loaded_through', '_published_through', '_next_seq', '_task', '_policy')
+
+    def __init__(self, publisher: 'Publisher', match_id: str, published_through: int = 0, n_of_spilled: int = 0):
+        """
+        Ordered queue of one match's events, see Publisher
+
+        @param published_through: Seq of the last event already published, e.g. when resuming from the spill
+        @param n_of_spilled: Number of the match's events in the spill
+        """
+        self._publisher = publisher
+        self._match_id = match_id
+        self._pending: Deque[Tuple[int, Dict[str, Any]]] = deque() # (seq, event) of events held in memory, oldest first
+        self._n_of_spilled = n_of_spilled # Events newer than every pending one, waiting in the spill
+        self._loaded_through = 0 # Seq of the newest pending event which was read back from the spill, and must be deleted from it once published
+        self._published_through = published_through
+        self._next_seq = published_through + n_of_spilled + 1
+        self._task: Optional[asyncio.Future] = None
+        self._policy = ReconnectPolicy(Publisher.RETRY_DELAY, Publisher.MAX_RETRY_DELAY)
+
+    @property
+    def queue_depth(self):
+        return len(self._pending) + self._n_of_spilled
+
+    def push(self, event: Dict[str, Any]) -> int:
+        seq = self._next_seq
+        self._next_seq += 1
+        # Once anything has been spilled, newer events follow it into the spill so that order is kept
+        if self._n_of_spilled > 0 or len(self._pending) >= Publisher.MAX_IN_MEMORY:
+            self._publisher._spill_later(self._match_id, seq, event)
+            self._n_of_spilled += 1
+        else:
+            self._pending.append((seq, event))
+        self.start()
+        return seq
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._deliver())
+
+    def stop(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Stops delivery, and returns the pending events which are not already in the spill
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        return [(seq, event) for seq, event in self._pending if seq > self._loaded_through]
+
+    async def _deliver(self):
+        publisher = self._publisher
+        # Lets events published at about the same time (e.g. the end of a turn) go in one request
+        await publisher._clock.sleep(Publisher.LINGER)
+        while self._pending or self._n_of_spilled > 0:
+            if not self._pending:
+                self._load_spilled()
+                continue
+
+            batch = [self._pending[i] for i in range(min(Publisher.MAX_BATCH, len(self._pending)))]
+            try:
+                is_done = await publisher._post(self._match_id, batch)
+            except Exception:
+                # Retried like a failed request, as ending the task would leave the match's events unpublished until the next one
+                publisher._stats['failed_requests'] += 1
+                publisher._logger.exception(f"[{self._match_id}] Unexpected error publishing events {batch[0][0]}-{batch[-1][0]}, retrying")
+                is_done = False
+            if not is_done:
+                await publisher._clock.sleep(self._policy.next_delay())
+                continue
+
+            self._policy.reset()
+            for _ in batch:
+                self._pending.popleft()
+            self._published_through = batch[-1][0]
+            if batch[0][0] <= self._loaded_through:
+                publisher._spill.delete_through(self._match_id, min(self._published_through, self._loaded_through))
+
+    def _load_spilled(self):
+        self._publisher._flush_spill()
+        rows = self._publisher._spill.load(self._match_id, self._published_through, Publisher.MAX_IN_MEMORY)
+        if not rows:
+            self._publisher._logger.error(f"[{self._match_id}] Expected {self._n_of_spilled} spilled events after {self._published_through}, found none")
+            self._n_of_spilled = 0
+            return
+        self._pending.extend((seq, json.loads(body)) for seq, body in rows)
+        self._n_of_spilled -= len(rows)
+        self._loaded_through = rows[-1][0]
+
+class Publisher():
+    MAX_BATCH = 64
+    LINGER = 0.02
+    MAX_IN_MEMORY = 256
+    MAX_CONNECTIONS = 8
+    REQUEST_TIMEOUT = 5.
+    RETRY_DELAY = 0.5
+    MAX_RETRY_DELAY = 30.
+
+    def __init__(self, url: str, spill_path: Union[str, Path] = ':memory:', clock: Optional[Clock] = None):
+        """
+        @param url: Endpoint events are POSTed to, as {"match_id": ..., "events": [{"seq": ..., "type": ..., ...}, ...]}
+        @param spill_path: SQLite file events which are not held in memory are written to, see EventSpill. Events spilled by a previous publisher are published once resume is called.
+        @param clock: Clock batching and retries are timed with, the system's by default
+        """
+        self._url = url
+        self._clock = clock or Clock()
+        self._spill = EventSpill(spill_path)
+        self._spill_outbox: List[Tuple[str, int, str]] = []
+        self._spill_scheduled = False
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._matches: Dict[str, MatchPublisher] = {}
+        self._logger = get_logger(__class__.__name__)
+        self._stats = {'events': 0, 'published': 0, 'requests': 0, 'failed_requests': 0, 'rejected': 0, 'spilled': 0}
+
+        for match_id, (first, _, n_of_spilled) in self._spill.get_pending().items():
+            self._matches[match_id] = MatchPublisher(self, match_id, first - 1, n_of_spilled)
+            self._logger.info(f"[{match_id}] {n_of_spilled} events left unpublished by a previous run")
+
+    def publish(self, match_id: str, event: Dict[str, Any]) -> int:
+        """
+        Queues a JSON serialisable event for the match without waiting for it to be sent, and returns its seq. Must be called from the publisher's event loop.
+        """
+        if (match := self._matches.get(match_id)) is None:
+            match = self._matches[match_id] = MatchPublisher(self, match_id)
+        self._stats['events'] += 1
+        return match.push(event)
+
+    def resume(self):
+        """
+        Starts publishing the events spilled by a previous publisher
+        """
+        for match in self._matches.values():
+            if match.queue_depth > 0:
+                match.start()
+
+    def get_queue_depth(self, match_id: str) -> int:
+        match = self._matches.get(match_id)
+        return 0 if match is None else match.queue_depth
+
+    @property
+    def stats(self):
+        return {**self._stats, 'queued': sum(match.queue_depth for match in self._matches.values())}
+
+    async def close(self):
+        """
+        Stops publishing, and spills every queued event so that a later publisher on the same spill file can resume
+        """
+        for match_id, match in self._matches.items():
+            self._spill_outbox.extend((match_id, seq, json.dumps(event)) for seq, event in match.stop())
+        self._flush_spill()
+        self._spill.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _post(self, match_id: str, batch: List[Tuple[int, Dict[str, Any]]]) -> bool:
+        """
+        Sends a batch of the match's events. Returns False if it should be retried.
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=Publisher.MAX_CONNECTIONS),
+                timeout=aiohttp.ClientTimeout(total=Publisher.REQUEST_TIMEOUT)
+            )
+
+        try:
+            body = json.dumps({'match_id': match_id, 'events': [{'seq': seq, **event} for seq, event in batch]})
+        except (TypeError, ValueError) as err:
+            # No retry would encode them either
+            self._stats['rejected'] += len(batch)
+            self._logger.error(f"[{match_id}] Dropping events {batch[0][0]}-{batch[-1][0]}, which are not JSON serialisable: {err}")
+            return True
+
+        self._stats['requests'] += 1
+        try:
+            async with self._session.post(self._url, data=body, headers={'Content-Type': 'application/json'}) as res:
+                status = res.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            self._stats['failed_requests'] += 1
+            self._logger.warning(f"[{match_id}] Publishing events {batch[0][0]}-{batch[-1][0]} failed, retrying: {err!r}")
+            return False
+
+        if status < 300:
+            self._stats['published'] += len(batch)
+            return True
+        if 400 <= status < 500 and status not in (408, 429):
+            # Sending the same events again would be rejected again
+            self._stats['rejected'] += len(batch)
+            self._logger.error(f"[{match_id}] Platform rejected events {batch[0][0]}-{batch[-1][0]} with status {status}")
+            return True
+
+        self._stats['failed_requests'] += 1
+        self._logger.warning(f"[{match_id}] Platform responded to events {batch[0][0]}-{batch[-1][0]} with status {status}, retrying")
+        return False
+
+    def _spill_later(self, match_id: str, seq: int, event: Dict[str, Any]):
+        """
+        Spilled events are written once the caller yields to the event loop, so that a burst of them costs one transaction
+        """
+        self._stats['spilled'] += 1
+        self._spill_outbox.append((match_id, seq, json.dumps(event)))
+        if not self._spill_scheduled:
+            self._spill_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_spill)
+
+    def _flush_spill(self):
+        self._spill_scheduled = False
+        if self._spill_outbox:
+            rows, self._spill_outbox = self._spill_outbox, []
+            self._spill.append(rows)
+
+class StubReceiver():
+    def __init__(self, port: int = 0):
+        """
+        Stands in for the broadcast platform in tests and benchmarks, recording the events POSTed to it
+
+        @param port: Port to listen on, a free one is chosen if 0
+        """
+        self.events: Dict[str, List[Dict[str, Any]]] = {}
+        self.n_of_requests = 0
+        self.n_of_failures = 0 # Number of upcoming requests to fail with a 503
+        self.delay = 0. # Seconds to wait before responding
+        self._port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self):
+        return f'http://localhost:{self._port}/events'
+
+    async def start(self) -> str:
+        """
+        Starts listening, and returns the URL events should be published to
+        """
+        app = web.Application()
+        app.router.add_post('/events', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, 'localhost', self._port)
+        await site.start()
+        self._port = self._runner.addresses[0][1]
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request):
+        self.n_of_requests += 1
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        if self.n_of_failures > 0:
+            self.n_of_failures -= 1
+            return web.Response(status=503)
+
+        body = await request.json()
+        received = self.events.setdefault(body['match_id'], [])
+        for event in body['events']:
+            # Events are delivered at least once, so resent ones are ignored
+            if not received or event['seq'] > received[-1]['seq']:
+                received.append(event)
+        return web.json_response({'received': len(body['events'])})
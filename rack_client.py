@@ -21,18 +21,27 @@ async def main(loop):
     await client.connect(addr='localhost')
 
 class FakeRackClient(Client):
-    def __init__(self, loop: asyncio.AbstractEventLoop, mac: int):
+    def __init__(self, loop: asyncio.AbstractEventLoop, mac: int, send_test_frames: bool = True, packed: bool = False, quiet_pulse: bool = False):
+        """
+        @param send_test_frames: If set to False, the client only sends the frames it is given (used by the game simulator)
+        @param packed: Request the packed transport from the server
+        @param quiet_pulse: Only pulse the server when no frames have been acknowledged recently
+        """
         self._logger = get_logger(__class__.__name__)
         self._loop = loop
         self._mac = mac # getnode()
         self._data_feed = None
-        super().__init__(loop, self._logger)
+        self._is_registered = False
+        self._send_test_frames = send_test_frames
+        self._last_frame = None # (seq, frame) of the newest frame, resent on reconnection if the server did not receive it
+        self._frame_interval = 10. # Seconds between test frames, set by the server through setFrameRate
+        super().__init__(loop, self._logger, packed=packed, quiet_pulse=quiet_pulse)
 
     async def on_connect(self, server):
         client = RackImpl(self)
         self._logger.info(f"Registering with server (MAC: {hex(self._mac)})")
         res = await self.handle_request(
-            server.register(self._mac, {'rack': client}), 
+            server.register(self._mac, {'rack': client}, self._resume_state()), 
             timeout=2.0
         )
 
@@ -48,32 +57,76 @@ class FakeRackClient(Client):
             case 'rack':
                 self._logger.info(f"Registered successfully, reassigned to match")
                 self._data_feed = data_feed.rack
+                self._resume(res.resume)
             case 'none':
                 self._logger.info(f"Registered successfully, not assigned to match")
+            case 'retryAfter':
+                self._logger.info(f"Server deferred registration, retrying in {data_feed.retryAfter} ms")
+                self._reconnect_policy.defer(data_feed.retryAfter / 1000)
+                return False
+            case 'redirect':
+                self.redirect(data_feed.redirect.host, data_feed.redirect.port)
+                return False
 
         # For testing
         async def test_send_rack():
             while self._retry_task:
-                await asyncio.sleep(10)
+                await asyncio.sleep(self._frame_interval)
                 if self._data_feed is not None:
                     await self.send_rack("tiles"),
 
-        self.add_task(test_send_rack)
+        self._is_registered = True
+        if self._send_test_frames:
+            self.add_task(test_send_rack)
         return True
 
+    @property
+    def is_registered(self):
+        return self._is_registered
+
+    @property
+    def is_assigned(self):
+        return self._data_feed is not None
+
     async def on_disconnect(self):
         self._logger.debug("Resetting data feed")
         self._data_feed = None
+        self._is_registered = False
 
-    async def send_rack(self, tiles):
+    def queue_rack(self, tiles) -> asyncio.Future:
+        """
+        Queues a rack to be pipelined with other frames, see Client.queue_request
+        """
         assert self._is_connected
+        data_feed = self._data_feed
+        def make_request(seq):
+            self._last_frame = (seq, tiles)
+            return data_feed.sendRack(tiles, seq)
+        return self.queue_request('rack', make_request, timeout=1.)
+
+    def set_frame_rate(self, fps):
+        self._logger.info(f"Server set frame rate to {fps:.1f} fps")
+        self._frame_interval = 1 / fps
+
+    def _resume_state(self):
+        return {'lastConfirmedMove': 0, 'lastAckedFrame': self.last_acked('rack')}
+
+    def _resume(self, info):
+        """
+        Restores the frame rate, and resends the newest frame if the server did not receive it before the connection dropped
+        """
+        if info.frameRate > 0:
+            self.set_frame_rate(info.frameRate)
+
+        if self._last_frame is not None and self._last_frame[0] > info.lastFrameSeq:
+            self._logger.info(f"Resending rack frame {self._last_frame[0]}, server last received {info.lastFrameSeq}")
+            self.queue_rack(self._last_frame[1])
+
+    async def send_rack(self, tiles):
         self._logger.debug2(f"Sending rack {tiles} to server")
-        res = await self.handle_request(
-            self._data_feed.sendRack(tiles),
-            timeout=1.
-        )
+        res = await self.queue_rack(tiles)
         if res is None:
-            self._logger.error(f"Did not obtain response for sendRack {tiles}")
+            self._logger.warning(f"Did not obtain response for sendRack {tiles} (superseded or timed out)")
         else:
             res = res.success
             self._logger.debug2(f"Obtained response {res} for sendRack")
@@ -90,6 +143,10 @@ class RackImpl(game_capture_capnp.Rack.Server):
         self._client._data_feed = dataFeed
         return True
 
+    def setFrameRate(self, framesPerSecond, **kwargs):
+        self._client.set_frame_rate(framesPerSecond)
+        return True
+
 if __name__ == '__main__':
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
@@ -0,0 +1,78 @@
+"""
+Decoding of RackFeed.sendRack strings into tile histograms.
+
+Racks change rarely compared to the rate sensors send them, so decoded histograms are memoised in a bounded LRU cache keyed by the raw string. Invalid strings are cached as well (as failed results), so a sensor repeatedly sending a bad rack does not pay for re-validation either. Strings longer than a rack are rejected before the lookup, so a misbehaving sensor cannot evict useful entries with them.
+"""
+
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Mapping, Dict
+
+from util import Singleton, Result
+from board_codec import get_tile
+from scrabble import Tile
+
+class RackDecoder(metaclass=Singleton):
+    DEFAULT_MAX_SIZE = 4096
+    MAX_RACK_SIZE = 7
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self._cache: OrderedDict[str, Result[Mapping[Tile, int]]] = OrderedDict()
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        self._rejected = 0
+
+    def decode(self, tiles: str) -> Result[Mapping[Tile, int]]:
+        """
+        Returns the histogram of the tiles in the rack string, or an error if it contains an invalid letter. Successful histograms are read-only, as they are shared between every frame with the same rack.
+        """
+        if len(tiles) > RackDecoder.MAX_RACK_SIZE:
+            self._rejected += 1
+            return Result.failure(f"they contain {len(tiles)} tiles, more than a rack holds")
+
+        if (res := self._cache.get(tiles)) is not None:
+            self._hits += 1
+            self._cache.move_to_end(tiles)
+            return res
+
+        self._misses += 1
+        res = RackDecoder._decode(tiles)
+        self._cache[tiles] = res
+        if len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+        return res
+
+    def clear(self):
+        self._cache.clear()
+        self._hits = 0
+        self._misses = 0
+        self._rejected = 0
+
+    @property
+    def hit_rate(self):
+        total = self._hits + self._misses
+        return self._hits / total if total else 0.
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            'size': len(self._cache),
+            'max_size': self._max_size,
+            'hits': self._hits,
+            'misses': self._misses,
+            'rejected': self._rejected,
+            'hit_rate': self.hit_rate
+        }
+
+    @staticmethod
+    def _decode(tiles: str) -> Result[Mapping[Tile, int]]:
+        histogram = {}
+        for letter in tiles.upper():
+            if (tile := get_tile(ord(letter))) is None:
+                return Result.failure(f"they contain invalid letter '{letter}'")
+
+            histogram.setdefault(tile, 0)
+            histogram[tile] += 1
+
+        return Result.success(MappingProxyType(histogram))
@@ -1,10 +1,11 @@
 from enum import Enum
-import time
 import inspect
-from typing import Dict
+from typing import Dict, Mapping, Optional
 from logging import Logger
 
 from tile_bag import TileBag
+from clock import Clock
+from snapshot_window import SnapshotWindow
 from scrabble import Tile
 
 class RackState(Enum):
@@ -22,16 +23,23 @@ class RackDeltaResolver():
     MAX_SNAPSHOT_AGE_IN_MS = 3000
     MIN_ACCEPTABLE_CONFIDENCE = 2
 
-    def __init__(self, bag: TileBag, logger: Logger) -> None:
+    __slots__ = ('_prev_snapshot', '_curr_snapshot', '_window', '_state', '_confidence', '_bag', '_logger', '_clock')
+
+    def __init__(self, bag: TileBag, logger: Logger, clock: Optional[Clock] = None) -> None:
+        """
+        @param clock: Clock snapshot ages are measured with, the system's by default
+        """
         self._prev_snapshot: Dict[Tile, int] = {}
-        self._curr_snapshot: Dict[Tile, int] = {}
+        self._curr_snapshot: Dict[Tile, int] = {} # Snapshot with the most votes in the window
+        # Recent accepted snapshots, which vote on the current one so that a single misread frame does not replace it
+        self._window: SnapshotWindow[Mapping[Tile, int]] = SnapshotWindow(RackDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS / 1000)
         self._state = RackState.Drawing
         self._confidence = 0
-        self._last_update = 0
         self._bag = bag
         self._logger = logger
+        self._clock = clock or Clock()
 
-    def process_delta(self, rack: Dict[Tile, int]):        
+    def process_delta(self, rack: Mapping[Tile, int]):        
         match self._state:
             case RackState.Drawing:
                 res = self._validate_drawing_delta(rack)
@@ -40,15 +48,19 @@ class RackDeltaResolver():
 
         if not res:
             return False
-        
-        self._last_update = time.time()
-        if rack == self._curr_snapshot:
-            self._confidence += 1
 
-        self._curr_snapshot = rack
+        self._window.add(frozenset(rack.items()), rack, self._clock.now())
+        self._curr_snapshot = self._window.leader
         return True
     
     def end_turn(self):
+        now = self._clock.now()
+        if (vote := self._window.vote(now)) is None:
+            age = (now - self._window.last_update) * 1000
+            self._logger.error(f"Most recent update {self._curr_snapshot} received {age:.2f} ms ago is too old to use in end-of-turn resolution")
+            return False
+        self._curr_snapshot, self._confidence = vote
+
         if self._state == RackState.Drawing:
             tiles_drawn = RackDeltaResolver._get_delta(self._curr_snapshot, self._prev_snapshot)
             if not self._bag.remove_tiles(tiles_drawn):
@@ -60,17 +72,14 @@ class RackDeltaResolver():
             if expected_n != self.n_of_tiles:
                 self._logger.error(f"Incorrect # of tiles on rack at the end of drawing turn ({self.n_of_tiles}), expected {expected_n}")
                 return False
-            
-        if (age := (time.time() - self._last_update) * 1000) > RackDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS:
-            self._logger.error(f"Most recent update {self._curr_snapshot} received {age:.2f} ms ago is too old to use in end-of-turn resolution")
-            return False
-        
+
         if self._confidence < RackDeltaResolver.MIN_ACCEPTABLE_CONFIDENCE:
             self._logger.warning(f"Using snapshot {self._curr_snapshot} with low confidence {self._confidence} in end-of-turn resolution")
 
         self._state = self._state.switch()
         self._prev_snapshot = self._curr_snapshot
-        self._confidence = 0
+        # The rack is unchanged by ending the turn, so frames of the snapshot used keep voting for it
+        self._window.retain_leader()
         return True
     
     def set_expected_drawn_tiles(self, tile_hist: Dict[Tile, int]):
@@ -84,6 +93,7 @@ class RackDeltaResolver():
             self._logger.error(f"Too many expected tiles given, previous rack = {self._prev_snapshot}, expected draw = {tile_hist}")
             return False
     
+        self._prev_snapshot = dict(self._prev_snapshot) # Snapshots may be shared read-only histograms (see RackDecoder)
         for tile, count in tile_hist.items():
             self._prev_snapshot.setdefault(tile, 0)
             self._prev_snapshot[tile] += count
@@ -116,7 +126,10 @@ class RackDeltaResolver():
     
     @property
     def confidence(self):
-        return self.confidence
+        """
+        Number of votes the snapshot used at the end of the last turn had
+        """
+        return self._confidence
     
     @property
     def state(self):
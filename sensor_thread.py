@@ -0,0 +1,193 @@
+"""
+Runs the sensor side of the server on its own thread and event loop.
+
+On a shared loop, pycapnp's polling and synchronous callbacks compete with the HTTP handlers, so a burst of HTTP requests delays sensor frames and a burst of frames delays HTTP responses. With a SensorThread, TCPServer (and so every SocketHandler, MatchServerImpl and feed) runs on the sensor thread's loop, while the match actors and the HTTP server stay on the main loop.
+
+The two sides only meet through thread-safe queues. Feeds hand validated frames to a MatchBridge, which queues them and has the main loop drain them in batches. As the main loop admits a frame after its feed has returned, a feed learns whether its match is accepting frames from the bridge instead: frames are rejected while the bridge holds MAX_QUEUED of the match's frames, or while the match's actor dropped the last one handed over to it. Commands are scheduled on the other side's loop: HTTP requests reach the sensor side through SensorThread, the sensor side reaches match actors through the bridge, and game states' calls to ConnectionHandler are forwarded by a _SensorConnectionHandler.
+
+capnp's event loop belongs to the first thread which uses it, so when sensors are served on their own thread no other thread may make capnp calls.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from logger import get_logger
+from match_actor import MatchActor
+from matchdata import GameStateStore
+from match_directory import MatchDirectory, Node
+from tcp_server import TCPServer
+
+class _SensorConnectionHandler():
+    def __init__(self, connection_handler, loop: asyncio.AbstractEventLoop):
+        """
+        Stands in for the sensor thread's ConnectionHandler in game states on the main loop, forwarding the calls they make on it to the sensor loop
+        """
+        self._connection_handler = connection_handler
+        self._loop = loop
+
+    def confirm_move(self, match_id, move) -> int:
+        # The sensor loop numbers the move when it queues it for the board
+        self._loop.call_soon_threadsafe(self._connection_handler.confirm_move, match_id, move)
+        return 0
+
+    def set_frame_rate(self, match_id, role, fps: float):
+        self._loop.call_soon_threadsafe(self._connection_handler.set_frame_rate, match_id, role, fps)
+
+class BridgedMatchActor():
+    def __init__(self, bridge: 'MatchBridge', match_id: str):
+        """
+        Sensor side handle to a match actor on the main loop, used in the same way as a MatchActor
+        """
+        self._bridge = bridge
+        self._match_id = match_id
+
+    def post_frame(self, role, delta) -> bool:
+        return self._bridge.post_frame(self._match_id, role, delta)
+
+    async def call(self, command: Callable[..., Any], *args):
+        return await asyncio.wrap_future(self._bridge.call(self._match_id, command, args))
+
+    def close(self):
+        pass
+
+class MatchBridge():
+    MAX_QUEUED = MatchActor.MAX_QUEUED
+
+    def __init__(self, main_loop: asyncio.AbstractEventLoop, sensor_loop: asyncio.AbstractEventLoop, max_queued: int = MAX_QUEUED):
+        """
+        Gives the sensor thread's ConnectionHandler access to the matches owned by the main loop, with the same create_new_match and get_actor interface as GameStateStore
+
+        @param max_queued: Number of a match's frames which may be waiting for the main loop, beyond which they are rejected
+        """
+        self._main_loop = main_loop
+        self._sensor_loop = sensor_loop
+        self._max_queued = max_queued
+        self._actors: Dict[str, BridgedMatchActor] = {}
+        self._frames: Deque[Tuple[str, Any, Any]] = deque() # (match_id, role, delta), appended by the sensor thread and drained by the main loop
+        # Each counter is only written by one thread, so a match's queued frames can be counted without a lock
+        self._n_of_posted: Dict[str, int] = {} # Sensor thread
+        self._n_of_drained: Dict[str, int] = {} # Main loop
+        self._is_dropping: Dict[str, bool] = {} # Main loop, whether the match's actor dropped the last frame handed over
+        self._drain_scheduled = False
+        self._stats = {'frames': 0, 'rejected_frames': 0, 'batches': 0, 'max_batch': 0}
+
+    def create_new_match(self, match_id: str, player_names: Tuple[str, str], connection_handler):
+        assert match_id not in self._actors, f"Cannot start new match with match_id={match_id}, this id is already taken"
+
+        # Scheduled before any of the match's frames or commands, which are only sent once its handle exists
+        handler = _SensorConnectionHandler(connection_handler, self._sensor_loop)
+        self._main_loop.call_soon_threadsafe(GameStateStore().create_new_match, match_id, player_names, handler)
+        self._actors[match_id] = BridgedMatchActor(self, match_id)
+
+    def get_actor(self, match_id) -> Optional[BridgedMatchActor]:
+        return self._actors.get(match_id)
+
+    def post_frame(self, match_id: str, role, delta) -> bool:
+        """
+        Queues a frame for the match's actor. Called on the sensor thread, frames queued before the main loop next runs are handed over together.
+
+        Returns False if the frame was dropped as the bridge already holds max_queued of the match's frames. Also returns False, though the frame is still handed over, if the actor dropped the match's last frame, as this one is most likely dropped too.
+        """
+        n_of_posted = self._n_of_posted.get(match_id, 0)
+        if n_of_posted - self._n_of_drained.get(match_id, 0) >= self._max_queued:
+            self._stats['rejected_frames'] += 1
+            return False
+        self._n_of_posted[match_id] = n_of_posted + 1
+
+        # The frame is queued before checking for a pending drain, and the main loop clears the flag before draining, so a frame is never left in the queue without a drain to come
+        self._frames.append((match_id, role, delta))
+        if not self._drain_scheduled:
+            self._drain_scheduled = True
+            self._main_loop.call_soon_threadsafe(self._drain)
+        return not self._is_dropping.get(match_id, False)
+
+    def call(self, match_id: str, command: Callable[..., Any], args: tuple) -> Future:
+        """
+        Runs command on the match's actor, returning a concurrent Future of its result. Can be called from any thread.
+        """
+        return asyncio.run_coroutine_threadsafe(self._call(match_id, command, args), self._main_loop)
+
+    @property
+    def queue_depth(self):
+        return len(self._frames)
+
+    @property
+    def stats(self):
+        n_of_batches = self._stats['batches']
+        return {
+            **self._stats,
+            'queue_depth': self.queue_depth,
+            'mean_batch': self._stats['frames'] / n_of_batches if n_of_batches else 0.
+        }
+
+    async def _call(self, match_id: str, command: Callable[..., Any], args: tuple):
+        return await GameStateStore().get_actor(match_id).call(command, *args)
+
+    def _drain(self):
+        self._drain_scheduled = False
+        store = GameStateStore()
+        n_of_frames = 0
+        while self._frames:
+            match_id, role, delta = self._frames.popleft()
+            self._is_dropping[match_id] = not store.get_actor(match_id).post_frame(role, delta)
+            self._n_of_drained[match_id] = self._n_of_drained.get(match_id, 0) + 1
+            n_of_frames += 1
+
+        self._stats['frames'] += n_of_frames
+        self._stats['batches'] += 1
+        self._stats['max_batch'] = max(n_of_frames, self._stats['max_batch'])
+
+class SensorThread():
+    def __init__(self, loop: asyncio.AbstractEventLoop, port: int = 9189, directory: Optional[MatchDirectory] = None, node: Optional[Node] = None, packed: bool = False):
+        """
+        Serves sensors on a thread with its own event loop. Has the interface of TCPServer used by HTTPServer, so can be used in its place.
+
+        @param loop: Main event loop, which owns the match actors and runs the HTTP server
+        @param packed: Accept sensors' requests for the packed transport, see TCPServer
+        """
+        self._main_loop = loop
+        self._loop = asyncio.new_event_loop()
+        self._bridge = MatchBridge(loop, self._loop)
+        self._tcp_server = TCPServer(self._loop, port, directory, node, matches=self._bridge, packed=packed)
+        self._thread = threading.Thread(target=self._run, name='SensorThread', daemon=True)
+        self._finished: Future = Future()
+        self._logger = get_logger(__class__.__name__)
+
+    @property
+    def bridge(self):
+        return self._bridge
+
+    async def start(self):
+        """
+        Starts the sensor thread, and waits for its server to stop
+        """
+        self._thread.start()
+        self._logger.info("Serving sensors on their own thread")
+        await asyncio.wrap_future(self._finished)
+
+    async def assign_match(self, match_id: str, player_names: Tuple[str, str]):
+        return await self._on_sensor_loop(self._tcp_server.assign_match(match_id, player_names))
+
+    async def end_match(self, match_id: str) -> bool:
+        return await self._on_sensor_loop(self._tcp_server.end_match(match_id))
+
+    def get_delivery_stats(self, match_id):
+        # Only counters, which can be read from another thread
+        return self._tcp_server.get_delivery_stats(match_id)
+
+    def get_match_node(self, match_id) -> Optional[Node]:
+        return self._tcp_server.get_match_node(match_id)
+
+    async def _on_sensor_loop(self, coroutine):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._loop))
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._finished.set_result(self._loop.run_until_complete(self._tcp_server.start()))
+        except BaseException as err:
+            self._logger.error(f"Sensor thread stopped: {err!r}")
+            self._finished.set_exception(err)
@@ -0,0 +1,125 @@
+"""
+Sliding window vote over a sensor's most recent snapshots, used by the delta resolvers.
+
+A single flicker frame (a tile misread, or briefly covered by a hand) would otherwise replace the snapshot used at the end of the turn. Instead each accepted snapshot votes for its key, and the snapshot with the most votes among the last few frames wins. Counts are kept incrementally, along with the keys holding each count, so adding a frame and finding the leader do not depend on the number of distinct snapshots seen.
+"""
+
+from collections import deque
+from typing import Deque, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+class SnapshotWindow(Generic[T]):
+    SIZE = 5
+    __slots__ = ('_max_age', '_size', '_frames', '_counts', '_keys_by_count', '_max_count', '_snapshots', '_last_seen', '_n_of_frames', '_last_update')
+
+    def __init__(self, max_age: float, size: int = SIZE) -> None:
+        """
+        @param max_age: Seconds after which a snapshot no longer votes
+        @param size: Number of most recent snapshots which vote
+        """
+        self._max_age = max_age
+        self._size = size
+        self._frames: Deque[Tuple[float, Hashable]] = deque() # (time received, key), oldest first
+        self._counts: Dict[Hashable, int] = {}
+        self._keys_by_count: Dict[int, Dict[Hashable, None]] = {}
+        self._max_count = 0
+        self._snapshots: Dict[Hashable, T] = {} # Newest snapshot with each key
+        self._last_seen: Dict[Hashable, int] = {} # Number of the newest frame with each key, to break ties in favour of the newest snapshot
+        self._n_of_frames = 0
+        self._last_update = 0.
+
+    def add(self, key: Hashable, snapshot: T, now: float):
+        self._evict(now)
+        if len(self._frames) == self._size:
+            self._remove_oldest()
+
+        self._frames.append((now, key))
+        self._last_update = now
+        self._snapshots[key] = snapshot
+        self._n_of_frames += 1
+        self._last_seen[key] = self._n_of_frames
+        self._move(key, self._counts.get(key, 0), self._counts.get(key, 0) + 1)
+
+    def vote(self, now: float) -> Optional[Tuple[T, int]]:
+        """
+        Returns the leading snapshot and its number of votes, or None if no snapshot is recent enough to vote
+        """
+        self._evict(now)
+        if self._max_count == 0:
+            return None
+        return self.leader, self._max_count
+
+    @property
+    def leader(self) -> Optional[T]:
+        """
+        Snapshot with the most votes when the last frame was added
+        """
+        if self._max_count == 0:
+            return None
+        return self._snapshots[self._get_leader_key()]
+
+    @property
+    def last_update(self) -> float:
+        """
+        Time the last snapshot was added, even if it no longer votes
+        """
+        return self._last_update
+
+    def retain_leader(self):
+        """
+        Drops every frame which did not vote for the leader, e.g. once the leader has been used at the end of a turn and is the new baseline
+        """
+        if self._max_count == 0:
+            return
+        leader = self._get_leader_key()
+        frames = [frame for frame in self._frames if frame[1] == leader]
+        snapshot, last_seen = self._snapshots[leader], self._last_seen[leader]
+        self.clear()
+        self._frames.extend(frames)
+        self._snapshots[leader] = snapshot
+        self._last_seen[leader] = last_seen
+        self._move(leader, 0, len(frames))
+
+    def clear(self):
+        self._frames.clear()
+        self._counts.clear()
+        self._keys_by_count.clear()
+        self._max_count = 0
+        self._snapshots.clear()
+        self._last_seen.clear()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _get_leader_key(self) -> Hashable:
+        return max(self._keys_by_count[self._max_count], key=self._last_seen.__getitem__)
+
+    def _evict(self, now: float):
+        cutoff = now - self._max_age
+        while self._frames and self._frames[0][0] < cutoff:
+            self._remove_oldest()
+
+    def _remove_oldest(self):
+        _, key = self._frames.popleft()
+        count = self._counts[key]
+        self._move(key, count, count - 1)
+        if count == 1:
+            del self._snapshots[key]
+            del self._last_seen[key]
+
+    def _move(self, key: Hashable, count: int, new_count: int):
+        if count > 0:
+            keys = self._keys_by_count[count]
+            del keys[key]
+            if not keys:
+                del self._keys_by_count[count]
+                if count == self._max_count and new_count < count:
+                    self._max_count = new_count
+
+        if new_count > 0:
+            self._counts[key] = new_count
+            self._keys_by_count.setdefault(new_count, {})[key] = None
+            self._max_count = max(new_count, self._max_count)
+        else:
+            del self._counts[key]
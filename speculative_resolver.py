@@ -0,0 +1,88 @@
+from typing import Dict, Mapping, Optional
+from logging import Logger
+
+from bitboard import BitBoard, fold_delta
+from board_delta_resolver import BoardDeltaResolver
+from scrabble import Pos, Tile, Move
+
+class Candidate():
+    __slots__ = ('board_delta', 'rack_delta', 'move', 'score')
+
+    def __init__(self, board_delta: Dict[Pos, Tile], rack_delta: Mapping[Tile, int], move: Move, score: int) -> None:
+        """
+        A move which has already been validated and scored against the current board, along with the deltas it was built from
+        """
+        self.board_delta = board_delta
+        self.rack_delta = rack_delta
+        self.move = move
+        self.score = score
+
+class SpeculativeResolver():
+    __slots__ = ('_board', '_candidate', '_logger', '_stats')
+
+    def __init__(self, board: BitBoard, logger: Logger) -> None:
+        """
+        Keeps a candidate for the move being played up to date while the playing player's tiles are on the board, so that ending the turn only has to commit it rather than build, validate and score the move
+        """
+        self._board = board
+        self._candidate: Optional[Candidate] = None
+        self._logger = logger
+        self._stats = {'speculations': 0, 'unplayable': 0, 'hits': 0, 'misses': 0}
+
+    @property
+    def candidate(self) -> Optional[Candidate]:
+        return self._candidate
+
+    @property
+    def stats(self):
+        return dict(self._stats)
+
+    def update(self, board_delta: Dict[Pos, Tile], rack_delta: Mapping[Tile, int]) -> Optional[Candidate]:
+        """
+        Rebuilds the candidate if the deltas differ from the ones it was built from. The rack delta must already have been matched against the board delta.
+        """
+        if (self._candidate is not None
+                and self._candidate.board_delta == board_delta
+                and self._candidate.rack_delta == rack_delta):
+            return self._candidate
+
+        self._candidate = None
+        self._stats['speculations'] += 1
+        # Most incomplete placements are caught by the bitboard, without building the move or applying it
+        mask, _, _ = fold_delta(board_delta)
+        if not self._board.is_playable(mask):
+            self._stats['unplayable'] += 1
+            return None
+
+        move = BoardDeltaResolver.delta_to_move(board_delta)
+
+        # The board only scores moves as they are applied, so the move is applied and immediately undone
+        if not self._board.apply_move(move):
+            self._logger.debug(f"Speculative move {move} cannot be applied to the board")
+            return None
+        score = self._board.get_score()
+        self._board.undo_move()
+
+        self._candidate = Candidate(board_delta, rack_delta, move, score)
+        self._logger.debug(f"Speculative candidate {move} scores {score}")
+        return self._candidate
+
+    def take(self, board_delta: Dict[Pos, Tile], rack_delta: Mapping[Tile, int]) -> Optional[Candidate]:
+        """
+        Returns the candidate if it was built from exactly these deltas, clearing it either way
+        """
+        candidate, self._candidate = self._candidate, None
+        if (candidate is not None
+                and candidate.board_delta == board_delta
+                and candidate.rack_delta == rack_delta):
+            self._stats['hits'] += 1
+            return candidate
+
+        self._stats['misses'] += 1
+        return None
+
+    def invalidate(self):
+        """
+        Drops the candidate, used when the confirmed board changes outside of a turn (e.g. a successful challenge)
+        """
+        self._candidate = None
@@ -1,12 +1,22 @@
 import asyncio
 import logging
+from collections import deque
 from enum import Enum
-from typing import Dict, List, Tuple, Optional
-from time import time
+from typing import Deque, Dict, List, Tuple, Optional
+from time import perf_counter, thread_time
 
 from logger import get_logger
 from util import Result
+from backoff import ReconnectPolicy
 from matchdata import GameStateStore, SensorRole
+from board_codec import decode_move, format_move, encode_move, write_move, PackedBoard, BoardDiff
+from rack_codec import RackDecoder
+from match_directory import MatchDirectory, Node
+from clock import Clock
+from frame_ring import FrameRing
+from usage import UsageTracker
+import match_commands
+from transport import StreamCodec, ReadSizer, PACKED_HELLO, PACKED_ACK, WRITE_HIGH_WATER
 
 import capnp
 import game_capture_capnp
@@ -37,45 +47,87 @@ def are_compatible(type: SensorType, role: SensorRole):
     assert False, f"Unexpected SensorType {type}"
 
 class TCPServer():
-    def __init__(self, loop):
+    def __init__(self, loop, port: int = 9189, directory: Optional[MatchDirectory] = None, node: Optional[Node] = None, matches=None, clock: Optional[Clock] = None, registration_limiter: Optional['RegistrationLimiter'] = None, packed: bool = False):
+        """
+        @param port: Port sensors connect to
+        @param directory: Directory shared with the other nodes at the event, used to redirect sensors whose match runs elsewhere. Only needed when running several nodes.
+        @param node: This node's entry in the directory
+        @param matches: Where matches are created and their actors found, GameStateStore by default (see ConnectionHandler)
+        @param clock: Clock heartbeats, registration slots and move delivery are timed with, the system's by default
+        @param registration_limiter: Limits the rate sensors are admitted at, one using the clock by default
+        @param packed: Accept sensors' requests for the packed transport, which saves bandwidth at the cost of CPU (see transport.py)
+        """
         self._loop = loop
+        self._port = port
+        self._packed = packed
+        self._clock = clock or Clock()
         self._logger = get_logger(__class__.__name__)
-        self._connection_handler = ConnectionHandler()
+        self._directory = directory
+        self._node = node
+        if directory is not None:
+            directory.register_node(node)
+        self._connection_handler = ConnectionHandler(registration_limiter or RegistrationLimiter(clock=self._clock), directory=directory, node=node, matches=matches, clock=self._clock)
 
     async def handle(self, reader, writer):
         # Log connection
         self._logger.info(f"New connection from {writer.get_extra_info('peername')}")
-        socket = SocketHandler(self._connection_handler, reader, writer)
+        socket = SocketHandler(self._connection_handler, reader, writer, self._clock, self._packed)
         await socket.serve()
         self._logger.info(f"{writer.get_extra_info('peername')} disconnected")
         # Handle disconnection here
         self._connection_handler.on_disconnect(socket)
 
     async def start(self):
-        server = await asyncio.start_server(self.handle, host=None, port=9189)
+        server = await asyncio.start_server(self.handle, host=None, port=self._port)
         addr = server.sockets[0].getsockname()
         self._logger.info(f"TCP server listnening on port {addr[1]}")
-        await server.serve_forever()
+        # Not gathered with the server, so that a failed sweep cannot stop it serving sensors
+        sweep = asyncio.ensure_future(self.integrity_sweep())
+        try:
+            await server.serve_forever()
+        finally:
+            sweep.cancel()
+
+    async def integrity_sweep(self, interval: float = 30.):
+        """
+        Periodically checks that every connected board agrees with the confirmed state of its match
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                results = await self._connection_handler.verify_board_states()
+            except Exception as err:
+                self._logger.error(f"Integrity sweep failed: {err}")
+                continue
+            inconsistent = [match_id for match_id, diff in results.items() if diff is not None and not diff.is_consistent]
+            self._logger.info(f"Integrity sweep checked {len(results)} boards, {len(inconsistent)} inconsistent")
 
     async def assign_match(self, match_id: str, player_names: Tuple[str, str]):
         return await self._connection_handler.assign_match(match_id, player_names)
+
+    async def end_match(self, match_id) -> bool:
+        return self._connection_handler.end_match(match_id)
     
-    async def confirm_move(self, match_id, move):
+    def confirm_move(self, match_id, move: Move) -> int:
         # Currently just being used to test RPC functionality
-        sensors = self._connection_handler.get_match_sensors(match_id)
-        if sensors is None:
-            self._logger.error(f"[{match_id}] Match has no assigned sensors")
-            return False
-        elif not sensors.board.is_connected:
-            self._logger.error(f"[{match_id}] board sensor is not connected")
-            return False
-        
-        board = sensors.board.sensor
-        self._logger.debug(f"[{match_id}] Sending confirmMove to board")
-        res = (await board.confirmMove(move).a_wait()).success
-        self._logger.debug(f"[{match_id}] Obtained confirmMove response {res}")
-        return res
+        # Numbered and delivered like the moves game states confirm, as the board ignores moves with a seq it has already seen
+        return self._connection_handler.confirm_move(match_id, move)
     
+    def get_delivery_stats(self, match_id):
+        return self._connection_handler.get_delivery_stats(match_id)
+
+    def get_frame_ring(self, match_id) -> Optional[FrameRing]:
+        return self._connection_handler.get_frame_ring(match_id)
+
+    def get_match_node(self, match_id) -> Optional[Node]:
+        """
+        Returns the node running the match if it is not this one, according to the directory
+        """
+        if self._directory is None:
+            return None
+        node = self._directory.get_match_node(match_id)
+        return None if node is None or node.node_id == self._node.node_id else node
+
     async def get_full_board_state(self, match_id):
         # Currently just being used to test RPC functionality
         sensors = self._connection_handler.get_match_sensors(match_id)
@@ -93,10 +145,17 @@ class TCPServer():
         return res
 
 class SocketHandler:
-    def __init__(self, connection_handler, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    PULSE_TIMEOUT = 5.
+    PULSE_CHECK_INTERVAL = 2.5
+
+    def __init__(self, connection_handler, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, clock: Optional[Clock] = None, allow_packed: bool = False):
         """
         Base capnproto socket server class which is created when receiving a new connection
+
+        @param clock: Clock the sensor's heartbeat is checked against, the system's by default
+        @param allow_packed: Confirm the packed transport if the sensor asks for it. Otherwise the sensor is disconnected, and reconnects with the plain stream.
         """
+        self._clock = clock or Clock()
         self._connection_handler = connection_handler
         self._logger: logging.Logger = get_logger(__class__.__name__)
         self._peername = writer.get_extra_info('peername')
@@ -105,7 +164,11 @@ class SocketHandler:
         self._reader = reader
         self._writer = writer
         self._retry = True
-        self._last_pulse = time()
+        self._last_pulse = self._clock.now()
+        self._codec = StreamCodec()
+        self._allow_packed = allow_packed
+        self._read_sizer = ReadSizer()
+        self._write_sizer = ReadSizer()
 
     @property
     def sensor_type(self):
@@ -123,12 +186,16 @@ class SocketHandler:
     def is_connected(self):
         return self._retry
 
+    @property
+    def wire_stats(self):
+        return {'packed': self._codec.is_packed, 'bytes_in': self._codec.bytes_in, 'bytes_out': self._codec.bytes_out}
+
     async def socketreader(self):
         while self._retry:
             try:
                 # Must be a wait_for so we don't block on read()
                 data = await asyncio.wait_for(
-                    self._reader.read(4096),
+                    self._reader.read(self._read_sizer.size),
                     timeout=1.0
                 )
             except asyncio.TimeoutError:
@@ -138,7 +205,11 @@ class SocketHandler:
                 self._logger.error("Unknown myreader err: %s", err)
                 return False
             #self._logger.debug(f"Size of packet: {len(data)}")
-            await self._capnp_server.write(data)
+            if data:
+                # Any traffic from the sensor shows it is alive, so sensors streaming frames need not pulse as well
+                self._last_pulse = self._clock.now()
+            self._read_sizer.update(len(data))
+            await self._capnp_server.write(self._codec.decode(data))
         self._logger.debug2("myreader done.")
         return True
 
@@ -147,11 +218,14 @@ class SocketHandler:
             try:
                 # Must be a wait_for so we don't block on read()
                 data = await asyncio.wait_for(
-                    self._capnp_server.read(4096),
+                    self._capnp_server.read(self._write_sizer.size),
                     timeout=1.0
                 )
-                #self._logger.debug(f"Size of packet: {len(data.tobytes())}")
-                self._writer.write(data.tobytes())
+                #self._logger.debug(f"Size of packet: {len(data)}")
+                self._write_sizer.update(len(data))
+                self._writer.write(self._codec.encode(data))
+                if self._writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+                    await self._writer.drain()
             except asyncio.TimeoutError:
                 self._logger.debug2("mywriter timeout.")
                 continue
@@ -163,12 +237,37 @@ class SocketHandler:
     
     async def check_pulse(self):
         while self._retry:
-            if time() - self._last_pulse > 5:
+            if self._clock.now() - self._last_pulse > SocketHandler.PULSE_TIMEOUT:
                 self._logger.warning(f"Disconnecting {self._peername} due to inactivity (missed heartbeat)")
                 await self.disconnect_client()
-            await asyncio.sleep(2.5)
+            await self._clock.sleep(SocketHandler.PULSE_CHECK_INTERVAL)
+
+    async def negotiate_transport(self):
+        """
+        Checks whether the client asked for the packed transport before sending any capnp data. Returns False if the client sent nothing at all, or asked for the packed transport when it is not allowed.
+        """
+        try:
+            first = await asyncio.wait_for(self._reader.readexactly(len(PACKED_HELLO)), timeout=5.0)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            self._logger.warning(f"{self._peername} did not send any data")
+            return False
+
+        if first == PACKED_HELLO:
+            if not self._allow_packed:
+                self._logger.info(f"{self._peername} asked for the packed transport, which is disabled")
+                return False
+            self._codec = StreamCodec(packed=True)
+            self._writer.write(PACKED_ACK)
+            self._logger.info(f"Using packed transport for {self._peername}")
+        else:
+            await self._capnp_server.write(first)
+        return True
 
     async def serve(self):
+        if not await self.negotiate_transport():
+            await self.disconnect_client()
+            return
+
         tasks = []
         # Assemble reader and writer tasks, run in the background
         coroutines = [self.socketreader(), self.socketwriter()]
@@ -205,7 +304,7 @@ class SocketHandler:
             self._mac_address = None
 
         # Currently cannot be async - can be once new capnproto update is out
-        def register(self, macAddr, sensorInterface, **kwargs):
+        def register(self, macAddr, sensorInterface, resume, **kwargs):
             self._logger.info(f"Received registration request from {sensorInterface.which()} ({hex(macAddr)})")
             self._sensor_type = SensorType[sensorInterface.which()]
             self._mac_address = macAddr
@@ -217,93 +316,316 @@ class SocketHandler:
                     self._sensor = sensorInterface.rack
 
             # TODO: Update this to await once using new capnp version
-            data_feed = self._socket_handler._connection_handler.register_sensor(self._socket_handler)
+            connection_handler = self._socket_handler._connection_handler
+            data_feed = connection_handler.register_sensor(self._socket_handler)
             self._logger.info(f'Responding to registration request from {hex(macAddr)} with {data_feed}')
-            return data_feed
+            if 'retryAfter' in data_feed or 'redirect' in data_feed:
+                # Sensor will reconnect later or elsewhere, so this socket is not tracked as a registered sensor
+                self._sensor = None
+                self._sensor_type = None
+                self._mac_address = None
+                return data_feed, game_capture_capnp.ResumeInfo.new_message()
+
+            return data_feed, connection_handler.get_resume_info(macAddr, resume)
         
         def pulse(self, **kwargs):
             self._logger.debug2(f"Received pluse")
-            self._socket_handler._last_pulse = time()
+            self._socket_handler._last_pulse = self._socket_handler._clock.now()
 
 
-def make_data_feed(match_id, role: SensorRole):
+def make_data_feed(match_id, role: SensorRole, session: 'SensorSession', matches, frames: FrameRing, mac_addr: int):
     match role:
         case SensorRole.board:
-            return {'board': BoardFeed(match_id)}
+            return {'board': BoardFeed(match_id, session, matches, frames, mac_addr)}
         case SensorRole.player1 | SensorRole.player2:
-            return {'rack': RackFeed(match_id, role)}
+            return {'rack': RackFeed(match_id, role, session, matches, frames, mac_addr)}
         
     assert False, f"Unexpected role {role}"
 
+class SensorSession:
+    def __init__(self):
+        """
+        State of a sensor's feed which outlives its connection, so that a reconnecting sensor can resume where it left off
+        """
+        self.last_frame_seq = 0
+
+    def accept_frame(self, seq: int) -> Optional[bool]:
+        """
+        Records a frame's sequence number. Returns None if the frame should be processed, otherwise the response to give without processing it: True for a resend of the last received frame, False for a frame older than it (which is out of date).
+        """
+        if seq == 0: # Unsequenced sensor
+            return None
+        if seq <= self.last_frame_seq:
+            return seq == self.last_frame_seq
+        self.last_frame_seq = seq
+        return None
+
+    def resume(self, last_acked_frame: int) -> bool:
+        """
+        Called when the sensor registers again. A sensor reporting an older acknowledged frame than the last one received has restarted its seqs (e.g. after rebooting) or lost acknowledgements, and in either case its frames are accepted again from that seq. Returns True if the session was rewound.
+        """
+        if last_acked_frame >= self.last_frame_seq:
+            return False
+        self.last_frame_seq = last_acked_frame
+        return True
+
 class RackFeed(game_capture_capnp.RackFeed.Server):
-    def __init__(self, match_id, player: SensorRole):
+    def __init__(self, match_id, player: SensorRole, session: SensorSession, matches, frames: FrameRing, mac_addr: int):
+        """
+        @param frames: Ring every decoded rack is written to for the match's other consumers, see frame_ring.py
+        @param mac_addr: MAC address of the rack, which the feed's CPU time is charged to (see usage.py)
+        """
         assert are_compatible(SensorType.rack, player)
         self._match_id = match_id
         self._role = player
+        self._session = session
+        self._matches = matches
+        self._frames = frames
+        self._mac_addr = mac_addr
+        self._usage = UsageTracker()
         self._logger = get_logger(f'{__class__.__name__}-{match_id}-{player.name}')
 
-    def sendRack(self, tiles, **kwargs):
-        tiles = tiles.upper()
-        self._logger.debug2(f"Received rack {tiles}")
+    def sendRack(self, tiles, seq, **kwargs):
+        cpu_start, start = thread_time(), perf_counter()
+        res = self._send_rack(tiles, seq)
+        self._usage.record(self._match_id, 'feed', thread_time() - cpu_start, perf_counter() - start, mac_addr=self._mac_addr)
+        return res
 
-        histogram = {}
-        for letter in tiles:
-            try:
-                tile = Tile(letter)
-            except ValueError:
-                self._logger.warning(f"Ignoring tiles {tiles} as they contain invalid letter '{letter}'")
-                return False
-            
-            histogram.setdefault(tile, 0)
-            histogram[tile] += 1
+    def _send_rack(self, tiles, seq):
+        self._logger.debug2("Received rack %s (seq=%d)", tiles, seq)
+        if (res := self._session.accept_frame(seq)) is not None:
+            self._logger.debug(f"Skipping rack {tiles} with seq {seq}, already received up to {self._session.last_frame_seq}")
+            return res
+
+        res = RackDecoder().decode(tiles)
+        if not res.is_success:
+            self._logger.warning(f"Ignoring tiles {tiles.upper()} as {res.error}")
+            return False
+        self._frames.append(self._role, res.value)
+
+        actor = self._matches.get_actor(self._match_id)
+
+        if actor is None:
+            self._logger.error(f"Rack feed assigned to non-existent game state")
+            return False
 
-        game_state = GameStateStore().get_game_state(self._match_id)
-        return game_state.process_delta(self._role, histogram)
+        # Processed by the match's actor, so success means the frame was accepted for processing
+        return actor.post_frame(self._role, res.value)
     
 class BoardFeed(game_capture_capnp.BoardFeed.Server):
-    def __init__(self, match_id):
+    def __init__(self, match_id, session: SensorSession, matches, frames: FrameRing, mac_addr: int):
+        """
+        @param frames: Ring every decoded move is written to for the match's other consumers, see frame_ring.py
+        @param mac_addr: MAC address of the board, which the feed's CPU time is charged to (see usage.py)
+        """
         self._match_id = match_id
         self._role = SensorRole.board
+        self._session = session
+        self._matches = matches
+        self._frames = frames
+        self._mac_addr = mac_addr
+        self._usage = UsageTracker()
         self._logger = get_logger(f'{__class__.__name__}-{match_id}')
     
-    def sendMove(self, move, **kwargs):
-        def format_tile(tile):
-            return f"Tile '{chr(tile.value)}' @ {Pos(tile.pos.row, tile.pos.col)}" 
-        
-        move_str = ', '.join(format_tile(tile) for tile in move.tiles)
-        self._logger.debug2(f"Received move {move_str}")
+    def sendMove(self, move, seq, **kwargs):
+        cpu_start, start = thread_time(), perf_counter()
+        res = self._send_move(move, seq)
+        self._usage.record(self._match_id, 'feed', thread_time() - cpu_start, perf_counter() - start, mac_addr=self._mac_addr)
+        return res
 
-        delta = {}
-        for play in move.tiles:
-            if (pos := Pos(play.pos.row, play.pos.col)) in delta:
-                self._logger.warning(f'Ignoring move {move_str} as it contains multiple tiles for pos {pos}')
-                return False
-            
-            try:
-                tile = Tile(chr(play.value))
-            except ValueError:
-                self._logger.warning(f"Ignoring move {move_str} as it contains invalid letter '{chr(play.value)}'")
-                return False
-            
-            delta[pos] = tile
+    def _send_move(self, move, seq):
+        tiles = move.tiles
+        if self._logger.isEnabledFor(logging.DEBUG2):
+            self._logger.debug2(f"Received move {format_move(tiles)} (seq={seq})")
+        if (res := self._session.accept_frame(seq)) is not None:
+            self._logger.debug(f"Skipping move with seq {seq}, already received up to {self._session.last_frame_seq}")
+            return res
+
+        res = decode_move(tiles)
+        if not res.is_success:
+            self._logger.warning(f"Ignoring move {format_move(tiles)} as {res.error}")
+            return False
+        delta = res.value
+        # Written before the game state can filter the delta's confirmed tiles out
+        self._frames.append(self._role, delta)
 
-        
-        game_state = GameStateStore().get_game_state(self._match_id)
+        actor = self._matches.get_actor(self._match_id)
 
-        if game_state is None:
+        if actor is None:
             self._logger.error(f"Board feed assigned to non-existent game state")
             return False
 
-        self._logger.debug2(f"Sending delta {delta} to game state")
-        return game_state.process_delta(self._role, delta)
+        # Processed by the match's actor, so success means the frame was accepted for processing
+        self._logger.debug2("Sending delta %s to game state", delta)
+        return actor.post_frame(self._role, delta)
+
+class MoveDelivery:
+    RETRY_DELAY = 0.5
+    MAX_RETRY_DELAY = 8.
+    ATTEMPT_TIMEOUT = 1.
+
+    def __init__(self, sensors: 'MatchSensors', match_id: str, clock: Optional[Clock] = None):
+        """
+        Delivers a match's confirmed moves to its board in the background, so that ending a turn never waits on the board. Moves are sent strictly in seq order, and each one is retried with backoff until the board acknowledges it or the delivery is closed. Moves the board receives by resuming its session after a reconnection are dropped from the queue rather than sent again.
+
+        @param clock: Clock retries and delivery latency are timed with, the system's by default
+        """
+        self._sensors = sensors
+        self._match_id = match_id
+        self._clock = clock or Clock()
+        self._policy = ReconnectPolicy(MoveDelivery.RETRY_DELAY, MoveDelivery.MAX_RETRY_DELAY)
+        self._pending: Deque[Tuple[int, float]] = deque() # (seq, time queued) of each move awaiting delivery, in seq order
+        self._task: Optional[asyncio.Future] = None
+        self._is_closed = False
+        self._delivered_seq = 0
+        self._n_of_delivered = 0
+        self._n_of_attempts = 0
+        self._total_latency = 0.
+        self._max_latency = 0.
+        self._logger = get_logger(f'{__class__.__name__}-{match_id}')
+
+    def push(self, seq: int):
+        if self._is_closed:
+            self._logger.warning(f"Not delivering move {seq}, the match has ended")
+            return
+        if seq <= self._delivered_seq or any(queued == seq for queued, _ in self._pending):
+            self._logger.debug(f"Move {seq} is already delivered or queued")
+            return
+
+        self._pending.append((seq, self._clock.now()))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._deliver())
+
+    def mark_delivered(self, seq: int):
+        """
+        Records that the board has every move up to and including seq
+        """
+        self._delivered_seq = max(seq, self._delivered_seq)
+        now = self._clock.now()
+        while self._pending and self._pending[0][0] <= seq:
+            _, queued_at = self._pending.popleft()
+            latency = now - queued_at
+            self._n_of_delivered += 1
+            self._total_latency += latency
+            self._max_latency = max(latency, self._max_latency)
+
+    def close(self):
+        """
+        Stops delivering, e.g. once the match has ended. Moves still queued are never sent.
+        """
+        self._is_closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._pending:
+            self._logger.warning(f"Closed with {len(self._pending)} moves undelivered")
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    @property
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'delivered_seq': self._delivered_seq,
+            'delivered': self._n_of_delivered,
+            'attempts': self._n_of_attempts,
+            'mean_latency': self._total_latency / self._n_of_delivered if self._n_of_delivered else 0.,
+            'max_latency': self._max_latency
+        }
+
+    async def _deliver(self):
+        while self._pending:
+            seq, _ = self._pending[0]
+            board = self._sensors.board
+            if not board.is_connected:
+                # The board is given the moves it missed when it reconnects, see MatchSensors.get_resume_info
+                await self._clock.sleep(self._policy.next_delay())
+                continue
+
+            self._n_of_attempts += 1
+            try:
+                res = await asyncio.wait_for(
+                    board.sensor.confirmMove(encode_move(self._sensors.get_confirmed_move(seq)), seq).a_wait(),
+                    timeout=MoveDelivery.ATTEMPT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self._logger.warning(f"Board confirm_move request for move {seq} timed out, retrying")
+                continue
+            except Exception as err:
+                self._logger.error(f"Board confirm_move request for move {seq} failed, retrying: {err}")
+                await self._clock.sleep(self._policy.next_delay())
+                continue
+
+            self._policy.reset()
+            if not res.success:
+                # Resending the same move would be rejected again, the integrity sweep reports the board's actual state
+                self._logger.error(f"Board rejected confirmed move {seq}")
+            self.mark_delivered(seq)
 
 class MatchSensors:
-    def __init__(self, board: SocketHandler, p1_rack: SocketHandler, p2_rack: SocketHandler):
+    def __init__(self, board: SocketHandler, p1_rack: SocketHandler, p2_rack: SocketHandler, sessions: Dict[SensorRole, SensorSession], match_id: str = '', frames: Optional[FrameRing] = None, clock: Optional[Clock] = None):
+        """
+        @param frames: Ring the match's feeds write decoded frames to
+        @param clock: Clock the delivery of confirmed moves is timed with, see MoveDelivery
+        """
+        self._frames = frames or FrameRing()
         self._sensors: Dict[SensorRole, SocketHandler] = {
             SensorRole.board: board,
             SensorRole.player1: p1_rack,
             SensorRole.player2: p2_rack
         }
+        self._sessions = sessions
+        self._confirmed_moves: List[Move] = [] # Move with seq n is at index n - 1
+        self._frame_rates: Dict[SensorRole, float] = {}
+        self._delivery = MoveDelivery(self, match_id, clock)
+
+    def record_confirmed_move(self, move: Move) -> int:
+        """
+        Numbers a newly confirmed move, returning its seq
+        """
+        self._confirmed_moves.append(move)
+        return len(self._confirmed_moves)
+
+    def get_confirmed_move(self, seq: int) -> Move:
+        return self._confirmed_moves[seq - 1]
+
+    @property
+    def delivery(self) -> MoveDelivery:
+        return self._delivery
+
+    def close(self):
+        self._delivery.close()
+
+    @property
+    def frames(self) -> FrameRing:
+        return self._frames
+
+    def get_resume_info(self, role: SensorRole, last_confirmed_move: int):
+        """
+        Builds the ResumeInfo for a reconnecting sensor, containing only the confirmed moves it has not yet seen
+        """
+        info = game_capture_capnp.ResumeInfo.new_message()
+        info.lastFrameSeq = self._sessions[role].last_frame_seq
+        info.frameRate = self._frame_rates.get(role, 0.)
+        if role == SensorRole.board:
+            missed = self._confirmed_moves[last_confirmed_move:]
+            entries = info.init('missedMoves', len(missed))
+            for seq, (entry, move) in enumerate(zip(entries, missed), start=last_confirmed_move + 1):
+                entry.seq = seq
+                write_move(entry.move, move)
+            self._delivery.mark_delivered(len(self._confirmed_moves))
+        return info
+
+    def get_session(self, role: SensorRole):
+        return self._sessions[role]
+
+    def record_frame_rate(self, role: SensorRole, fps: float):
+        """
+        Remembers the rate a sensor was asked for, so it can be restored if the sensor reconnects
+        """
+        self._frame_rates[role] = fps
 
     def reconnect_sensor(self, role: SensorRole, sensor: SocketHandler):
         old = self._sensors[role]
@@ -329,17 +651,93 @@ class MatchSensors:
     def player2(self):
         return self._sensors[SensorRole.player2]
 
+class RegistrationLimiter():
+    RESERVATION_TOLERANCE = 0.05
+    RESERVATION_TTL = 10.
+
+    def __init__(self, rate: float = 50., burst: int = 50, clock: Optional[Clock] = None):
+        """
+        Limits the rate at which sensors are admitted by MatchServer.register, so that a reconnect storm (e.g. after a server restart) is spread out over time. Admission follows a token bucket. A sensor which is turned away is given a reserved slot in the future, and is admitted when it comes back for it.
+
+        @param rate: Sustained registrations per second
+        @param burst: Number of registrations which may be admitted at once
+        @param clock: Clock used when try_admit is not given the time, the system's by default
+        """
+        self._clock = clock or Clock()
+        self._interval = 1. / rate
+        self._tolerance = (burst - 1) * self._interval
+        self._next_free = 0.
+        self._reservations: Dict[int, float] = {}
+        self._last_purge = 0.
+
+    def try_admit(self, mac_addr: int, now: Optional[float] = None) -> Optional[float]:
+        """
+        Returns None if the sensor may register now, otherwise the number of seconds after which it should retry
+        """
+        now = self._clock.now() if now is None else now
+        self._purge(now)
+
+        if (slot := self._reservations.get(mac_addr)) is not None:
+            if now >= slot - RegistrationLimiter.RESERVATION_TOLERANCE:
+                del self._reservations[mac_addr]
+                return None
+            return slot - now
+
+        if self._next_free - now <= self._tolerance:
+            self._next_free = max(self._next_free, now) + self._interval
+            return None
+
+        slot = self._next_free - self._tolerance
+        self._next_free += self._interval
+        self._reservations[mac_addr] = slot
+        return slot - now
+
+    @property
+    def n_of_reservations(self):
+        return len(self._reservations)
+
+    def _purge(self, now: float):
+        if now - self._last_purge < 1.:
+            return
+        self._last_purge = now
+        self._reservations = {
+            mac: slot for mac, slot in self._reservations.items() if slot + RegistrationLimiter.RESERVATION_TTL > now
+        }
+
 class ConnectionHandler():
-    MAX_RETRIES = 5
+    UNDELIVERED_SEQ = -1
 
-    def __init__(self):
+    def __init__(self, registration_limiter: Optional[RegistrationLimiter] = None, directory: Optional[MatchDirectory] = None, node: Optional[Node] = None, matches=None, clock: Optional[Clock] = None):
+        """
+        @param directory: Directory of the nodes running each match, see match_directory.py
+        @param node: This node's entry in the directory
+        @param matches: Object with GameStateStore's create_new_match and get_actor, through which the sensor side reaches the matches. GameStateStore by default, or a MatchBridge when sensors are served on their own thread (see sensor_thread.py).
+        """
         self._available_sensors: Dict[SensorType, Dict[int, SocketHandler]] = {SensorType.board: {}, SensorType.rack: {}}
         self._assigned_sensors: Dict[int, Tuple[str, SensorRole]] = {}
         self._active_matches: Dict[str, MatchSensors] = {}
+        self._registration_limiter = registration_limiter or RegistrationLimiter()
+        self._directory = directory
+        self._node = node
+        self._matches = matches or GameStateStore()
+        self._clock = clock or Clock()
         self._logger = get_logger(__class__.__name__)
 
     def register_sensor(self, server: SocketHandler):
         mac_addr = server.mac_address
+        if (mac_addr not in self._assigned_sensors
+                and self._directory is not None
+                and (node := self._directory.get_sensor_node(mac_addr)) is not None
+                and node.node_id != self._node.node_id):
+            self._logger.info(f"Redirecting {server.sensor_type} ({hex(mac_addr)}) to node {node}, which runs its match")
+            return {'redirect': {'host': node.host, 'port': node.sensor_port}}
+
+        # Sensors in an active match are never deferred, as the match depends on them
+        if (mac_addr not in self._assigned_sensors
+                and (delay := self._registration_limiter.try_admit(mac_addr)) is not None):
+            self._logger.info(f"Deferring registration of {server.sensor_type} ({hex(mac_addr)}) by {delay * 1000:.0f} ms")
+            return {'retryAfter': max(1, round(delay * 1000))}
+
         if mac_addr in self._assigned_sensors:
             match_id, role = self._assigned_sensors[mac_addr]
             if not are_compatible(server.sensor_type, role):
@@ -347,8 +745,9 @@ class ConnectionHandler():
                 assert False, "Currently unable to disconnect client as method cannot be asynchronous (fix with new capnproto version)"
                 #await server.disconnect_client()
             else:
-                if self._active_matches[match_id].reconnect_sensor(role, server):
-                    return make_data_feed(match_id, role)
+                sensors = self._active_matches[match_id]
+                if sensors.reconnect_sensor(role, server):
+                    return make_data_feed(match_id, role, sensors.get_session(role), self._matches, sensors.frames, mac_addr)
                 else:
                     self._logger.error(f'Unable to reconnect sensor {hex(mac_addr)} to match {match_id}, either due to sensor role mismatch or old socket was not cleaned up properly')
                     assert False, "Currently unable to disconnect client as method cannot be asynchronous (fix with new capnproto version)"
@@ -386,10 +785,12 @@ class ConnectionHandler():
             p1_socket = self._select_available_sensor(SensorType.rack)
             p2_socket = self._select_available_sensor(SensorType.rack)
             
+            sessions = {role: SensorSession() for role in SensorRole}
+            frames = FrameRing()
             match_assign_coroutines = [
-                board_socket.sensor.assignMatch(BoardFeed(match_id)).a_wait(),
-                p1_socket.sensor.assignMatch(RackFeed(match_id, SensorRole.player1)).a_wait(),
-                p2_socket.sensor.assignMatch(RackFeed(match_id, SensorRole.player2)).a_wait()
+                board_socket.sensor.assignMatch(BoardFeed(match_id, sessions[SensorRole.board], self._matches, frames, board_socket.mac_address)).a_wait(),
+                p1_socket.sensor.assignMatch(RackFeed(match_id, SensorRole.player1, sessions[SensorRole.player1], self._matches, frames, p1_socket.mac_address)).a_wait(),
+                p2_socket.sensor.assignMatch(RackFeed(match_id, SensorRole.player2, sessions[SensorRole.player2], self._matches, frames, p2_socket.mac_address)).a_wait()
             ]
 
             self._logger.debug(f"[{match_id}] Sending match assignment requests to sensors: {SensorRole.board} {board_socket.mac_address}, {SensorRole.player1} {p1_socket.mac_address}, {SensorRole.player2} {p2_socket.mac_address}")
@@ -406,34 +807,75 @@ class ConnectionHandler():
             self._logger.debug(f"[{match_id}] Obtained assignment responses {results}")
             assigned_sensors = all(results) and all([sensor.is_connected for sensor in [board_socket, p1_socket, p2_socket]])
 
-        GameStateStore().create_new_match(match_id, player_names, self)
+        self._matches.create_new_match(match_id, player_names, self)
 
         self._assigned_sensors[board_socket.mac_address] = (match_id, SensorRole.board)
         self._assigned_sensors[p1_socket.mac_address] = (match_id, SensorRole.player1)
         self._assigned_sensors[p2_socket.mac_address] = (match_id, SensorRole.player2)
-        self._active_matches[match_id] = MatchSensors(board_socket, p1_socket, p2_socket)
+        for role, socket in [(SensorRole.board, board_socket), (SensorRole.player1, p1_socket), (SensorRole.player2, p2_socket)]:
+            UsageTracker().assign_sensor(match_id, role, socket.mac_address)
+        self._active_matches[match_id] = MatchSensors(board_socket, p1_socket, p2_socket, sessions, match_id, frames, self._clock)
+        if self._directory is not None:
+            self._directory.claim_match(match_id, self._node.node_id, [board_socket.mac_address, p1_socket.mac_address, p2_socket.mac_address])
         self._logger.info(f"[{match_id}] Successfully assigned sensors")
     
-    async def confirm_move(self, match_id, move: Move):
-        board = self.get_match_sensors(match_id).board
-        msg = ConnectionHandler._move_to_capnp(move)
+    def end_match(self, match_id) -> bool:
+        """
+        Tears down the sensor side of an ended match, stopping the delivery of its confirmed moves. Returns False if the match is not active.
+        """
+        if (sensors := self._active_matches.pop(match_id, None)) is None:
+            self._logger.warning(f"[{match_id}] Cannot end inactive match")
+            return False
+        sensors.close()
+        self._logger.info(f"[{match_id}] Ended match")
+        return True
 
-        for _ in range(ConnectionHandler.MAX_RETRIES):
-            if not board.is_connected:
-                self._logger.error(f"[{match_id}] Board sensor is disconnected, cannot confirm move")
-                return False
-            try:
-                res = await asyncio.wait_for(
-                            board.sensor.confirmMove(msg).a_wait(),
-                            timeout=1.0
-                        )
-                return res.success
-            except asyncio.TimeoutError:
-                self._logger.warning(f"[{match_id}] Board confirm_move request timed out")
+    def confirm_move(self, match_id, move: Move) -> int:
+        """
+        Queues a confirmed move for delivery to the match's board without waiting for it to be sent, see MoveDelivery. Returns the move's seq, or UNDELIVERED_SEQ if the match has no sensors to deliver it to.
+        """
+        sensors = self.get_match_sensors(match_id)
+        if sensors is None:
+            self._logger.error(f"[{match_id}] Cannot deliver confirmed move {move}, match has no assigned sensors")
+            return ConnectionHandler.UNDELIVERED_SEQ
+        seq = sensors.record_confirmed_move(move)
+        sensors.delivery.push(seq)
+        self._logger.debug(f"[{match_id}] Queued move {seq} for delivery, {sensors.delivery.queue_depth} moves awaiting delivery")
+        return seq
+
+    def get_frame_ring(self, match_id) -> Optional[FrameRing]:
+        """
+        Returns the ring of the match's decoded frames, from which consumers read with their own FrameCursor
+        """
+        sensors = self._active_matches.get(match_id)
+        return None if sensors is None else sensors.frames
 
-        self._logger.error(f"[{match_id}] Board confirm_move timed out {ConnectionHandler.MAX_RETRIES} times, giving up")
-        return False
+    def get_delivery_stats(self, match_id) -> Optional[Dict[str, float]]:
+        sensors = self.get_match_sensors(match_id)
+        return None if sensors is None else sensors.delivery.stats
     
+    def set_frame_rate(self, match_id, role: SensorRole, fps: float):
+        """
+        Asks a match's sensor to change its frame rate. Called while processing frames, so the request is sent in the background.
+        """
+        sensors = self.get_match_sensors(match_id)
+        if sensors is None:
+            return
+
+        sensors.record_frame_rate(role, fps)
+        sensor = sensors.get_sensor(role)
+        if sensor.is_connected:
+            asyncio.ensure_future(self._send_frame_rate(match_id, role, sensor, fps))
+
+    async def _send_frame_rate(self, match_id, role: SensorRole, sensor: SocketHandler, fps: float):
+        try:
+            await asyncio.wait_for(sensor.sensor.setFrameRate(fps).a_wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            # The sensor is given the latest rate on reconnection, see MatchSensors.get_resume_info
+            self._logger.warning(f"[{match_id}] {role} setFrameRate request timed out")
+        except Exception as err:
+            self._logger.error(f"[{match_id}] {role} setFrameRate request failed: {err}")
+
     def on_disconnect(self, socket):
         mac_addr = socket.mac_address
         sensor_type = socket.sensor_type
@@ -449,41 +891,69 @@ class ConnectionHandler():
         else:
             self._logger.warning(f"Removing unmanaged socket from ConnectionHandler type={sensor_type}, mac={mac_addr}")
         
+    async def verify_board_states(self, match_ids: Optional[List[str]] = None, timeout: float = 2.0) -> Dict[str, Optional[BoardDiff]]:
+        """
+        Requests the packed board state from the boards of the given matches (all active matches by default) concurrently, and diffs each against the match's confirmed board. Matches which are not active, whose board could not be queried, or whose board has not yet received every confirmed move map to None.
+        """
+        match_ids = list(self._active_matches) if match_ids is None else match_ids
+
+        async def verify(match_id):
+            if (sensors := self._active_matches.get(match_id)) is None:
+                self._logger.warning(f"[{match_id}] Cannot verify board state of inactive match")
+                return None
+            board = sensors.board
+            actor = self._matches.get_actor(match_id)
+            if not board.is_connected or actor is None or sensors.delivery.queue_depth > 0:
+                return None
+            try:
+                res = await asyncio.wait_for(board.sensor.getPackedBoardState().a_wait(), timeout=timeout)
+                confirmed = await actor.call(match_commands.get_packed_board)
+            except asyncio.TimeoutError:
+                self._logger.warning(f"[{match_id}] Board getPackedBoardState request timed out")
+                return None
+            except Exception as err:
+                self._logger.error(f"[{match_id}] Unable to verify board state: {err}")
+                return None
+
+            # A move confirmed while the board was queried may not have reached it yet
+            if sensors.delivery.queue_depth > 0:
+                return None
+            diff = confirmed.diff(PackedBoard.from_capnp(res.state))
+            if not diff.is_consistent:
+                self._logger.error(f"[{match_id}] Board sensor disagrees with confirmed board state: {diff}")
+            return diff
+
+        results = await asyncio.gather(*(verify(match_id) for match_id in match_ids))
+        return dict(zip(match_ids, results))
+
+    def get_resume_info(self, mac_addr: int, resume):
+        """
+        Returns the ResumeInfo for a registering sensor. Sensors which are not in a match have nothing to resume.
+        """
+        if mac_addr not in self._assigned_sensors:
+            return game_capture_capnp.ResumeInfo.new_message()
+
+        match_id, role = self._assigned_sensors[mac_addr]
+        sensors = self._active_matches[match_id]
+        last_frame_seq = sensors.get_session(role).last_frame_seq
+        if sensors.get_session(role).resume(resume.lastAckedFrame):
+            self._logger.warning(f"[{match_id}] {role} ({hex(mac_addr)}) acked frame {resume.lastAckedFrame} but the server received frame {last_frame_seq}, accepting its frames from {resume.lastAckedFrame + 1}")
+        info = sensors.get_resume_info(role, resume.lastConfirmedMove)
+        self._logger.info(f"[{match_id}] Resuming {role} ({hex(mac_addr)}): {len(info.missedMoves)} missed moves, sensor acked frame {resume.lastAckedFrame}, server received frame {info.lastFrameSeq}")
+        return info
+
     def get_match_sensors(self, match_id) -> Optional[MatchSensors]:        
         return self._active_matches.get(match_id)
 
     def _select_available_sensor(self, sensor_type: SensorType):
         _, sensor = self._available_sensors[sensor_type].popitem()
         return sensor
-    
-    @staticmethod
-    def _move_to_capnp(move: Move):
-        msg = {'tiles': []}
-        for tile, pos in move:
-            pos_info = {'row': pos.row, 'col': pos.col}
-            info = {
-                'value': ord(tile.letter),
-                'pos': pos_info
-            }
-            msg['tiles'].append(info)
-
-        return msg
 
 async def test_client_rpc(server: TCPServer):
     match_id = "ExampleID"
     await test_assign_match(server, match_id)
     while True:
-        await server.confirm_move(match_id, {'tiles': [
-                {
-                    'value': ord('A'),
-                    'pos': {'row': 4, 'col': 9}
-                },
-                {
-                    'value': ord('?'),
-                    'pos': {'row': 4, 'col': 10}
-                }
-            ]
-        })
+        server.confirm_move(match_id, Move([Tile('A'), Tile('?')], [Pos(4, 9), Pos(4, 10)]))
         await asyncio.sleep(5)
         await server.get_full_board_state(match_id)
         await asyncio.sleep(5)
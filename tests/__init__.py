@@ -1,4 +1,4 @@
 from pathlib import Path
 import sys
 
-sys.path.append(Path(__file__).absolute().parent.parent)
\ No newline at end of file
+sys.path.append(str(Path(__file__).absolute().parent.parent))
\ No newline at end of file
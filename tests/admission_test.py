@@ -0,0 +1,127 @@
+import asyncio
+import time
+import unittest
+
+from admission import AdmissionController
+from match_actor import MatchActor
+
+class FakeGameState:
+    def __init__(self, match_id, events):
+        self.match_id = match_id
+        self.events = events
+
+    def process_delta(self, role, delta):
+        self.events.append((self.match_id, role, delta))
+        return True
+
+    def end_turn(self, player_time):
+        self.events.append((self.match_id, 'end_turn', player_time))
+        return player_time
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.admission = AdmissionController(lag_threshold=0.05, check_interval=0.01)
+        self.events = []
+        self.noisy = MatchActor('Noisy', FakeGameState('Noisy', self.events), admission=self.admission)
+        self.quiet = MatchActor('Quiet', FakeGameState('Quiet', self.events), admission=self.admission)
+
+    async def asyncTearDown(self):
+        self.noisy.close()
+        self.quiet.close()
+        self.admission.close()
+
+    async def test_commands_start_before_other_matches_frames(self):
+        for i in range(50):
+            self.noisy.post_frame('board', i)
+        await asyncio.sleep(0) # The noisy actor starts on its frames
+        self.assertEqual(await self.quiet.call(FakeGameState.end_turn, 30), 30)
+
+        # At most the frame being processed when the command was queued runs before it
+        self.assertLessEqual(self.events.index(('Quiet', 'end_turn', 30)), 2)
+        await self.noisy.call(lambda game_state: None)
+        self.assertEqual(len(self.events), 51)
+        stats = self.admission.stats
+        self.assertEqual(stats['control']['started'], 2)
+        self.assertEqual(stats['control']['queued'], 0)
+        self.assertEqual(stats['frames']['started'], 50)
+
+    async def test_commands_wait_for_own_match_frames(self):
+        for i in range(3):
+            self.noisy.post_frame('board', i)
+        await self.noisy.call(FakeGameState.end_turn, 30)
+        self.assertEqual(self.events[-1], ('Noisy', 'end_turn', 30))
+        self.assertEqual(len(self.events), 4)
+
+    async def test_frames_are_coalesced_when_overloaded(self):
+        self.admission.record_lag(0.1)
+        for i in range(10):
+            self.noisy.post_frame('board', i)
+            self.noisy.post_frame('player1', -i)
+        self.assertEqual(self.noisy.queue_depth, 2)
+        await self.noisy.call(lambda game_state: None)
+
+        self.assertEqual(self.events, [('Noisy', 'board', 9), ('Noisy', 'player1', -9)])
+        self.assertEqual(self.noisy.stats['coalesced_frames'], 18)
+        self.assertEqual(self.admission.stats['frames']['coalesced'], 18)
+
+    async def test_frames_are_not_coalesced_across_commands(self):
+        self.admission.record_lag(0.1)
+        self.noisy.post_frame('board', 1)
+        command = asyncio.ensure_future(self.noisy.call(FakeGameState.end_turn, 30))
+        await asyncio.sleep(0)
+        self.noisy.post_frame('board', 2)
+        await command
+        await self.noisy.call(lambda game_state: None)
+
+        self.assertEqual(self.events, [('Noisy', 'board', 1), ('Noisy', 'end_turn', 30), ('Noisy', 'board', 2)])
+
+    async def test_superseded_frames_are_shed_when_overloaded(self):
+        for i in range(3):
+            self.noisy.post_frame('board', i)
+        self.admission.record_lag(0.1)
+        self.noisy.post_frame('board', 3)
+        # Frames are only shed while no command is queued after them
+        while self.noisy.queue_depth > 0:
+            await asyncio.sleep(0)
+
+        # The last frame queued before the overload is replaced, and the earlier ones shed
+        self.assertEqual(self.events, [('Noisy', 'board', 3)])
+        self.assertEqual(self.noisy.stats['shed_frames'], 2)
+        self.assertEqual(self.admission.stats['frames']['queued'], 0)
+
+    async def test_overload_hysteresis(self):
+        self.admission.record_lag(0.06)
+        self.assertTrue(self.admission.is_overloaded)
+        self.admission.record_lag(0.03)
+        self.assertTrue(self.admission.is_overloaded)
+        self.admission.record_lag(0.02)
+        self.assertFalse(self.admission.is_overloaded)
+        self.assertEqual(self.admission.stats['overloads'], 1)
+        self.assertEqual(self.admission.stats['max_lag'], 0.06)
+
+    async def test_lag_is_measured(self):
+        self.admission.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1) # Blocks the loop
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.admission.stats['overloads'], 1)
+        self.assertGreater(self.admission.stats['max_lag'], 0.05)
+
+    async def test_closed_actor_releases_frames(self):
+        release = asyncio.Event()
+        async def wait(game_state):
+            await release.wait()
+        asyncio.ensure_future(self.quiet.call(wait))
+        command = asyncio.ensure_future(self.quiet.call(FakeGameState.end_turn, 30))
+        await asyncio.sleep(0)
+        self.noisy.post_frame('board', 1)
+        await asyncio.sleep(0)
+        self.assertFalse(self.admission.frames_may_run)
+        self.assertEqual(self.events, [])
+
+        self.quiet.close()
+        self.assertTrue(self.admission.frames_may_run)
+        await self.noisy.call(lambda game_state: None)
+        self.assertEqual(self.events, [('Noisy', 'board', 1)])
+        with self.assertRaises(asyncio.CancelledError):
+            await command
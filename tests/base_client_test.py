@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+
+import base_client
+from base_client import Client
+from logger import get_logger
+
+logger = get_logger('TestClient')
+
+class FakePromise:
+    def __init__(self, value, delay):
+        self._value = value
+        self._delay = delay
+
+    async def a_wait(self):
+        await asyncio.sleep(self._delay)
+        return self._value
+
+class TestSendQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = Client(asyncio.get_running_loop(), logger, max_in_flight=2, max_queued=2)
+        self.client._retry_task = True
+        self.sender = asyncio.ensure_future(self.client.socketsender())
+
+    async def asyncTearDown(self):
+        self.client._retry_task = False
+        self.client._send_wakeup.set()
+        await self.sender
+
+    async def test_requests_are_pipelined(self):
+        futures = [self.client.queue_request(f'stream{i}', lambda seq, i=i: FakePromise(i, 0.2)) for i in range(2)]
+        start = asyncio.get_running_loop().time()
+        self.assertEqual(await asyncio.gather(*futures), [0, 1])
+        self.assertLess(asyncio.get_running_loop().time() - start, 0.35)
+
+    async def test_queued_requests_are_coalesced(self):
+        # Fill the in-flight window so the next requests stay queued
+        in_flight = [self.client.queue_request(f'slow{i}', lambda seq: FakePromise(None, 0.2)) for i in range(2)]
+        await asyncio.sleep(0.01) # Let the sender dispatch them
+        old = self.client.queue_request('move', lambda seq: FakePromise('old', 0))
+        new = self.client.queue_request('move', lambda seq: FakePromise('new', 0))
+
+        self.assertEqual(await new, 'new')
+        self.assertIsNone(await old)
+        await asyncio.gather(*in_flight)
+        self.assertEqual(self.client.send_stats['coalesced'], 1)
+
+    async def test_full_queue_drops_oldest(self):
+        in_flight = [self.client.queue_request(f'slow{i}', lambda seq: FakePromise(None, 0.2)) for i in range(2)]
+        await asyncio.sleep(0.01) # Let the sender dispatch them
+        queued = [self.client.queue_request(f'stream{i}', lambda seq, i=i: FakePromise(i, 0)) for i in range(3)]
+
+        self.assertEqual(await asyncio.gather(*queued), [None, 1, 2])
+        await asyncio.gather(*in_flight)
+        self.assertEqual(self.client.send_stats['dropped'], 1)
+
+    async def test_unacknowledged_request_times_out(self):
+        res = await self.client.queue_request('move', lambda seq: FakePromise(True, 1), timeout=0.05)
+        self.assertIsNone(res)
+        self.assertEqual(self.client.send_stats['timed_out'], 1)
+
+class FakeMatchServer:
+    def __init__(self):
+        self.n_of_pulses = 0
+
+    def pulse(self):
+        self.n_of_pulses += 1
+        return FakePromise(None, 0)
+
+class TestQuietPulse(unittest.IsolatedAsyncioTestCase):
+    async def run_watcher(self, client: Client, duration: float, on_traffic=None):
+        client._server = FakeMatchServer()
+        client._retry_task = True
+        watcher = asyncio.ensure_future(client.socketwatcher())
+        end = asyncio.get_running_loop().time() + duration
+        while asyncio.get_running_loop().time() < end:
+            if on_traffic is not None:
+                on_traffic()
+            await asyncio.sleep(0.01)
+        client._retry_task = False
+        await watcher
+        return client._server.n_of_pulses
+
+    async def test_pulses_while_streaming(self):
+        client = Client(asyncio.get_running_loop(), logger, pulse_interval=0.05)
+        self.assertGreater(await self.run_watcher(client, 0.3), 2)
+
+    async def test_quiet_pulse_skips_while_streaming(self):
+        client = Client(asyncio.get_running_loop(), logger, quiet_pulse=True, pulse_interval=0.05)
+        client._last_inbound = 0.
+        def on_traffic():
+            client._last_inbound = base_client.monotonic()
+        self.assertLessEqual(await self.run_watcher(client, 0.3, on_traffic), 1)
+        self.assertGreater(client.send_stats['pulses_skipped'], 0)
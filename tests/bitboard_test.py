@@ -0,0 +1,54 @@
+import unittest
+
+from bitboard import BitBoard, fold_delta, get_neighbours, get_span, is_in_line
+from scrabble import Move, Pos, Tile
+
+def mask_of(*squares):
+    mask = 0
+    for row, col in squares:
+        mask |= 1 << (row * 15 + col)
+    return mask
+
+class TestMasks(unittest.TestCase):
+    def test_line(self):
+        self.assertTrue(is_in_line(mask_of((3, 0), (3, 14))))
+        self.assertTrue(is_in_line(mask_of((0, 4), (14, 4))))
+        self.assertFalse(is_in_line(mask_of((3, 14), (4, 0))))
+        self.assertFalse(is_in_line(mask_of((4, 12), (5, 12), (7, 13))))
+
+    def test_span(self):
+        self.assertEqual(get_span(mask_of((7, 3), (7, 6))), mask_of((7, 3), (7, 4), (7, 5), (7, 6)))
+        self.assertEqual(get_span(mask_of((2, 9), (4, 9))), mask_of((2, 9), (3, 9), (4, 9)))
+
+    def test_neighbours_do_not_wrap_rows(self):
+        self.assertEqual(get_neighbours(mask_of((3, 14))), mask_of((2, 14), (4, 14), (3, 13)))
+        self.assertEqual(get_neighbours(mask_of((0, 0))), mask_of((0, 1), (1, 0)))
+
+class TestBitBoard(unittest.TestCase):
+    def setUp(self):
+        self.board = BitBoard()
+        self.assertTrue(self.board.apply_move(Move([Tile('C'), Tile('A'), Tile('T')], [Pos(7, 6), Pos(7, 7), Pos(7, 8)])))
+
+    def test_moves_are_tracked(self):
+        self.assertEqual(self.board.occupancy, mask_of((7, 6), (7, 7), (7, 8)))
+        self.board.undo_move()
+        self.assertEqual((self.board.occupancy, self.board.letters, self.board.letter_mask), (0, 0, 0))
+
+    def test_conflicts(self):
+        _, letters, letter_mask = fold_delta({Pos(7, 6): Tile('C'), Pos(7, 7): Tile('O'), Pos(8, 7): Tile('X')})
+        self.assertEqual(self.board.find_conflict(letters, letter_mask), 7 * 15 + 7)
+        _, letters, letter_mask = fold_delta({Pos(7, 6): Tile('C'), Pos(8, 7): Tile('X')})
+        self.assertEqual(self.board.find_conflict(letters, letter_mask), -1)
+
+    def test_playable(self):
+        self.assertTrue(self.board.is_playable(mask_of((6, 7), (8, 7))))
+        self.assertTrue(self.board.is_playable(mask_of((7, 9), (7, 10))))
+        self.assertFalse(self.board.is_playable(mask_of((7, 10), (7, 11)))) # Gap
+        self.assertFalse(self.board.is_playable(mask_of((3, 3), (3, 4)))) # Not touching
+        self.assertFalse(BitBoard().is_playable(mask_of((0, 0), (0, 1)))) # Misses centre
+
+    def test_confirmed_tiles_are_removed(self):
+        delta = {Pos(7, 6): Tile('C'), Pos(7, 7): Tile('A'), Pos(7, 8): Tile('T'), Pos(7, 9): Tile('S')}
+        mask, _, _ = fold_delta(delta)
+        self.assertEqual(self.board.remove_confirmed(delta, mask), mask_of((7, 9)))
+        self.assertEqual(delta, {Pos(7, 9): Tile('S')})
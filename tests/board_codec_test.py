@@ -0,0 +1,84 @@
+import unittest
+
+import capnp
+import game_capture_capnp
+
+from board_codec import decode_move, encode_move, get_pos, get_tile, PackedBoard
+from scrabble import Board, Pos, Tile, Move
+
+def to_capnp(tiles):
+    msg = game_capture_capnp.Move.new_message()
+    entries = msg.init('tiles', len(tiles))
+    for entry, (letter, row, col) in zip(entries, tiles):
+        entry.value = ord(letter)
+        entry.pos.row = row
+        entry.pos.col = col
+    return msg.as_reader()
+
+class TestDecodeMove(unittest.TestCase):
+    def test_valid_move(self):
+        res = decode_move(to_capnp([('A', 4, 9), ('?', 4, 10)]).tiles)
+        self.assertTrue(res.is_success)
+        self.assertEqual(res.value, {Pos(4, 9): Tile('A'), Pos(4, 10): Tile('?')})
+
+    def test_decoded_objects_are_interned(self):
+        first = decode_move(to_capnp([('Q', 7, 7)]).tiles).value
+        second = decode_move(to_capnp([('Q', 7, 7)]).tiles).value
+        (pos1, tile1), = first.items()
+        (pos2, tile2), = second.items()
+        self.assertIs(pos1, pos2)
+        self.assertIs(tile1, tile2)
+        self.assertIs(pos1, get_pos(7, 7))
+        self.assertIs(tile1, get_tile(ord('Q')))
+
+    def test_duplicate_pos_invalid(self):
+        self.assertFalse(decode_move(to_capnp([('A', 4, 9), ('B', 4, 9)]).tiles).is_success)
+
+    def test_invalid_letter_invalid(self):
+        self.assertFalse(decode_move(to_capnp([('A', 4, 9), ('!', 4, 10)]).tiles).is_success)
+
+    def test_out_of_bounds_invalid(self):
+        self.assertFalse(decode_move(to_capnp([('A', 15, 0)]).tiles).is_success)
+
+class TestEncodeMove(unittest.TestCase):
+    def test_round_trip(self):
+        move = Move([Tile('C'), Tile('A'), Tile('T')], [Pos(7, 7), Pos(7, 8), Pos(7, 9)])
+        delta = decode_move(encode_move(move).as_reader().tiles).value
+        self.assertEqual(delta, {Pos(7, 7): Tile('C'), Pos(7, 8): Tile('A'), Pos(7, 9): Tile('T')})
+
+class TestPackedBoard(unittest.TestCase):
+    def setUp(self):
+        self.board = Board()
+        move = Move([Tile('C'), Tile('A'), Tile('T')], [Pos(7, 7), Pos(7, 8), Pos(7, 9)])
+        self.assertTrue(self.board.apply_move(move))
+
+    def test_capnp_round_trip(self):
+        packed = PackedBoard.from_board(self.board)
+        msg = game_capture_capnp.PackedBoardState.new_message()
+        packed.write(msg)
+        self.assertEqual(len(msg.occupancy), 29)
+
+        unpacked = PackedBoard.from_capnp(msg.as_reader())
+        self.assertEqual(unpacked.occupancy, packed.occupancy)
+        self.assertEqual(unpacked.codes, b'CAT')
+
+    def test_identical_boards_are_consistent(self):
+        packed = PackedBoard.from_board(self.board)
+        diff = packed.diff(PackedBoard.from_squares({112: ord('C'), 113: ord('A'), 114: ord('T')}))
+        self.assertTrue(diff.is_consistent)
+        self.assertEqual(diff.pending, [])
+
+    def test_diff_classifies_squares(self):
+        packed = PackedBoard.from_board(self.board)
+        observed = PackedBoard.from_squares({112: ord('C'), 113: ord('E'), 127: ord('S')})
+        diff = packed.diff(observed)
+
+        self.assertFalse(diff.is_consistent)
+        self.assertEqual(diff.missing, [Pos(7, 9)])
+        self.assertEqual(diff.conflicting, [Pos(7, 8)])
+        self.assertEqual(diff.pending, [Pos(8, 7)])
+
+    def test_blank_matches_any_tile(self):
+        packed = PackedBoard.from_board(self.board)
+        observed = PackedBoard.from_squares({112: ord('?'), 113: ord('A'), 114: ord('T')})
+        self.assertTrue(packed.diff(observed).is_consistent)
@@ -1,16 +1,17 @@
 import unittest
 from typing import Dict
-import time
 
 from board_delta_resolver import BoardDeltaResolver
-from scrabble import Board, Pos, Tile
+from bitboard import BitBoard
+from clock import VirtualClock
+from scrabble import Pos, Tile
 from logger import get_logger
 
 logger = get_logger('GameState-ExampleId')
 
 class TestProcessDelta(unittest.TestCase):
     def test_valid_delta_empty_board(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        resolver = BoardDeltaResolver(BitBoard(), logger)
 
         delta = {
             Pos(0, 0): Tile('a'),
@@ -20,7 +21,7 @@ class TestProcessDelta(unittest.TestCase):
         self.assertTrue(resolver.process_delta(delta))
 
     def test_too_long_delta_invalid(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        resolver = BoardDeltaResolver(BitBoard(), logger)
 
         delta = {
             Pos(0, 0): Tile('a'),
@@ -35,7 +36,7 @@ class TestProcessDelta(unittest.TestCase):
         self.assertFalse(resolver.process_delta(delta))
 
     def test_invalid_move_delta_invalid(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        resolver = BoardDeltaResolver(BitBoard(), logger)
 
         delta = {
             Pos(4, 12): Tile('c'),
@@ -46,7 +47,7 @@ class TestProcessDelta(unittest.TestCase):
         self.assertFalse(resolver.process_delta(delta))
 
     def test_delta_with_confirmed_info_valid(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        resolver = BoardDeltaResolver(BitBoard(), logger)
 
         delta = {
             Pos(7, 3): Tile('q'),
@@ -76,7 +77,7 @@ class TestProcessDelta(unittest.TestCase):
         self._apply_move_to_resolver(resolver, delta)
 
     def test_delta_with_conflicting_info_is_invalid(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        resolver = BoardDeltaResolver(BitBoard(), logger)
 
         delta = {
             Pos(7, 7): Tile('s'),
@@ -99,7 +100,7 @@ class TestProcessDelta(unittest.TestCase):
         self.assertFalse(resolver.process_delta(delta))
 
     def test_delta_over_undone_move_is_valid(self):
-        board = Board()
+        board = BitBoard()
         resolver = BoardDeltaResolver(board, logger)
 
         delta = {
@@ -126,13 +127,67 @@ class TestProcessDelta(unittest.TestCase):
         self.assertTrue(resolver.process_delta(delta))
         self.assertTrue(resolver.end_turn())
 
+class TestVoting(unittest.TestCase):
+    def test_flicker_frame_is_outvoted(self):
+        resolver = BoardDeltaResolver(BitBoard(), logger)
+        placed = {Pos(7, 7): Tile('a'), Pos(7, 8): Tile('t')}
+        for _ in range(3):
+            self.assertTrue(resolver.process_delta(dict(placed)))
+        self.assertTrue(resolver.process_delta({Pos(7, 7): Tile('a')})) # Tile briefly covered
+
+        self.assertEqual(resolver.delta, placed)
+        self.assertTrue(resolver.end_turn())
+
+class TestValidityCache(unittest.TestCase):
+    def test_repeated_deltas_hit_cache(self):
+        resolver = BoardDeltaResolver(BitBoard(), logger)
+        for _ in range(5):
+            self.assertTrue(resolver.process_delta({Pos(7, 7): Tile('a'), Pos(7, 8): Tile('t')}))
+            self.assertFalse(resolver.process_delta({Pos(7, 7): Tile('a'), Pos(8, 8): Tile('t')}))
+
+        self.assertEqual(resolver.stats['validations'], 10)
+        self.assertEqual(resolver.stats['cache_hits'], 8)
+        self.assertEqual(resolver.stats['cached_deltas'], 2)
+
+    def test_cached_deltas_have_confirmed_tiles_removed(self):
+        board = BitBoard()
+        resolver = BoardDeltaResolver(board, logger)
+        self.assertTrue(resolver.process_delta({Pos(7, 7): Tile('a'), Pos(7, 8): Tile('t')}))
+        self.assertTrue(resolver.process_delta({Pos(7, 7): Tile('a'), Pos(7, 8): Tile('t')}))
+        self.assertTrue(resolver.end_turn())
+
+        for _ in range(2):
+            delta = {Pos(7, 7): Tile('a'), Pos(7, 8): Tile('t'), Pos(7, 9): Tile('e')}
+            self.assertTrue(resolver.process_delta(delta))
+            self.assertEqual(delta, {Pos(7, 9): Tile('e')})
+        self.assertEqual(resolver.stats['cache_hits'], 2)
+
+    def test_board_changes_invalidate_cache(self):
+        board = BitBoard()
+        resolver = BoardDeltaResolver(board, logger)
+        self._apply_move_to_resolver(resolver, {Pos(7, 7): Tile('a'), Pos(7, 8): Tile('t')})
+        delta = {Pos(7, 7): Tile('a'), Pos(7, 8): Tile('t'), Pos(7, 9): Tile('e')}
+        self.assertTrue(resolver.process_delta(dict(delta)))
+
+        # Once the move is undone by a challenge, none of the delta's tiles are confirmed
+        board.undo_move()
+        undone = dict(delta)
+        self.assertTrue(resolver.process_delta(undone))
+        self.assertEqual(undone, delta)
+        self.assertEqual(resolver.stats['cache_hits'], 0)
+
+    def _apply_move_to_resolver(self, resolver: BoardDeltaResolver, delta: Dict[Pos, Tile]):
+        for _ in range(2):
+            self.assertTrue(resolver.process_delta(dict(delta)))
+        self.assertTrue(resolver.end_turn())
+
 class TestEndTurn(unittest.TestCase):
     def test_empty_delta_valid(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        resolver = BoardDeltaResolver(BitBoard(), logger)
         self._apply_move_to_resolver(resolver, {})
 
     def test_unappliable_move_invalid(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        resolver = BoardDeltaResolver(BitBoard(), logger)
 
         delta = {
             Pos(7, 7): Tile('a'),
@@ -144,7 +199,8 @@ class TestEndTurn(unittest.TestCase):
         self.assertFalse(resolver.end_turn())
 
     def test_old_delta_invalid(self):
-        resolver = BoardDeltaResolver(Board(), logger)
+        clock = VirtualClock()
+        resolver = BoardDeltaResolver(BitBoard(), logger, clock)
 
         delta = {
             Pos(7, 3): Tile('j'),
@@ -156,7 +212,7 @@ class TestEndTurn(unittest.TestCase):
         }
 
         self.assertTrue(resolver.process_delta(delta))
-        time.sleep(BoardDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS / 1000)
+        clock.advance(BoardDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS / 1000 + 0.001)
         self.assertFalse(resolver.end_turn())
 
     def _apply_move_to_resolver(self, resolver: BoardDeltaResolver, delta: Dict[Pos, Tile]):
@@ -0,0 +1,74 @@
+import unittest
+
+import capnp
+import game_capture_capnp
+from board_codec import PackedBoard
+from matchdata import SensorRole
+from tcp_server import ConnectionHandler, MatchSensors, SensorSession
+
+class FakePromise:
+    def __init__(self, res=None, error=None):
+        self._res = res
+        self._error = error
+
+    async def a_wait(self):
+        if self._error is not None:
+            raise self._error
+        return self._res
+
+class FakeBoard:
+    def __init__(self, error=None):
+        """
+        Responds to getPackedBoardState with an empty board, or fails with the given error (e.g. a board build without the method)
+        """
+        self.n_of_requests = 0
+        self._error = error
+
+    def getPackedBoardState(self):
+        self.n_of_requests += 1
+        state = game_capture_capnp.PackedBoardState.new_message()
+        PackedBoard.from_squares({}).write(state)
+        return FakePromise(type('Result', (), {'state': state}), self._error)
+
+class FakeSocket:
+    def __init__(self, board: FakeBoard):
+        self.sensor = board
+        self.is_connected = True
+
+class FakeActor:
+    async def call(self, command, *args):
+        return PackedBoard.from_squares({})
+
+class FakeMatches:
+    def get_actor(self, match_id):
+        return FakeActor()
+
+class TestVerifyBoardStates(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.handler = ConnectionHandler(matches=FakeMatches())
+
+    def add_match(self, match_id: str, board: FakeBoard) -> MatchSensors:
+        sensors = MatchSensors(FakeSocket(board), None, None, {role: SensorSession() for role in SensorRole}, match_id)
+        self.handler._active_matches[match_id] = sensors
+        return sensors
+
+    async def test_failures_are_isolated_to_their_match(self):
+        self.add_match('Broken', FakeBoard(error=RuntimeError("Method not implemented")))
+        self.add_match('Working', FakeBoard())
+
+        results = await self.handler.verify_board_states()
+        self.assertIsNone(results['Broken'])
+        self.assertTrue(results['Working'].is_consistent)
+
+    async def test_inactive_match_is_skipped(self):
+        results = await self.handler.verify_board_states(['Ended'])
+        self.assertEqual(results, {'Ended': None})
+
+    async def test_board_awaiting_moves_is_skipped(self):
+        board = FakeBoard()
+        sensors = self.add_match('Pending', board)
+        sensors.delivery._pending.append((1, 0.))
+
+        results = await self.handler.verify_board_states()
+        self.assertIsNone(results['Pending'])
+        self.assertEqual(board.n_of_requests, 0)
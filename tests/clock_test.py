@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+
+from clock import VirtualClock
+
+class TestVirtualClock(unittest.IsolatedAsyncioTestCase):
+    async def test_sleepers_wake_in_deadline_order(self):
+        clock = VirtualClock()
+        woken = []
+
+        async def sleeper(name, delay):
+            await clock.sleep(delay)
+            woken.append((name, clock.now()))
+
+        tasks = [asyncio.ensure_future(sleeper(name, delay)) for name, delay in [('c', 3.), ('a', 1.), ('b', 2.)]]
+        await asyncio.sleep(0)
+        self.assertEqual(clock.n_of_sleepers, 3)
+
+        await clock.run_for(2.5)
+        self.assertEqual(woken, [('a', 1.), ('b', 2.)])
+        self.assertEqual(clock.now(), 2.5)
+
+        await clock.run_for(10.)
+        await asyncio.gather(*tasks)
+        self.assertEqual(woken[-1], ('c', 3.))
+
+    async def test_periodic_task_runs_once_per_period(self):
+        clock = VirtualClock()
+        ticks = []
+
+        async def periodic():
+            while True:
+                ticks.append(clock.now())
+                await clock.sleep(2.5)
+
+        task = asyncio.ensure_future(periodic())
+        await asyncio.sleep(0)
+        await clock.run_for(3600.)
+        task.cancel()
+        self.assertEqual(len(ticks), 3600 / 2.5 + 1)
+        self.assertEqual(ticks[-1], 3600.)
+
+    def test_advance_without_loop(self):
+        clock = VirtualClock(start=10.)
+        clock.advance(0.5)
+        self.assertEqual(clock.now(), 10.5)
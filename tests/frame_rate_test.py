@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+
+from game_simulator import GameSimulator
+from matchdata import FrameRate, FrameRateController, GameState, SensorRole
+from tests.helpers import RecordingConnectionHandler
+
+class TestFrameRateController(unittest.TestCase):
+    def test_stable_after_unchanged_frames(self):
+        controller = FrameRateController()
+        results = [controller.observe(SensorRole.board, {}) for _ in range(FrameRateController.STABLE_AFTER_N_FRAMES + 1)]
+        self.assertEqual(results, [False] * FrameRateController.STABLE_AFTER_N_FRAMES + [True])
+        self.assertFalse(controller.observe(SensorRole.board, {'changed': 1}))
+
+    def test_only_changed_rates_are_sent(self):
+        controller = FrameRateController()
+        self.assertFalse(controller.set_rate(SensorRole.player1, FrameRate.active))
+        self.assertTrue(controller.set_rate(SensorRole.player1, FrameRate.idle))
+        self.assertFalse(controller.set_rate(SensorRole.player1, FrameRate.idle))
+        self.assertEqual(controller.get_rate(SensorRole.player1), FrameRate.idle)
+
+    def test_idle_rate_keeps_snapshots_fresh(self):
+        from board_delta_resolver import BoardDeltaResolver
+        from rack_delta_resolver import RackDeltaResolver
+        max_age = min(BoardDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS, RackDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS) / 1000
+        self.assertLess(1 / FrameRate.idle.fps, max_age)
+
+class TestGameStateFrameRates(unittest.TestCase):
+    def test_rates_follow_activity(self):
+        handler = RecordingConnectionHandler()
+        game_state = GameState('FrameRate', ('Player 1', 'Player 2'), handler)
+        n_of_frames = 0
+        for turn in GameSimulator(5).turns():
+            for frame in turn.frames:
+                n_of_frames += 1
+                game_state.process_delta(frame.role, frame.to_delta())
+            self.assertTrue(asyncio.run(game_state.end_turn(player_time=0)).is_success)
+
+        # Rates only change when a sensor's activity does, not with every frame
+        self.assertGreater(len(handler.rates), 0)
+        self.assertLess(len(handler.rates), n_of_frames / 2)
+        self.assertTrue(any(fps < FrameRate.active.fps for _, fps in handler.rates))
+
+    def test_drawing_rack_is_not_idle_before_drawing(self):
+        handler = RecordingConnectionHandler()
+        game_state = GameState('FrameRate', ('Player 1', 'Player 2'), handler)
+        for _ in range(FrameRateController.STABLE_AFTER_N_FRAMES + 1):
+            game_state.process_delta(SensorRole.player2, {})
+        self.assertEqual(game_state.get_frame_rate(SensorRole.player2), FrameRate.stable)
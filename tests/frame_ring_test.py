@@ -0,0 +1,53 @@
+import unittest
+
+from frame_ring import FrameRing
+from matchdata import SensorRole
+from scrabble import Pos, Tile
+
+def make_board_delta(n_of_tiles: int):
+    return {Pos(i // 15, i % 15): Tile('ABCDEFG'[i % 7]) for i in range(n_of_tiles)}
+
+class TestFrameRing(unittest.TestCase):
+    def test_frames_round_trip(self):
+        ring = FrameRing()
+        cursor = ring.cursor()
+        board = {Pos(7, 7): Tile('A'), Pos(7, 8): Tile('?')}
+        rack = {Tile('E'): 2, Tile('S'): 1}
+        self.assertEqual(ring.append(SensorRole.board, board), 1)
+        self.assertEqual(ring.append(SensorRole.player2, rack), 2)
+
+        records = [(record.seq, record.role, record.to_delta()) for record in cursor.read()]
+        self.assertEqual(records, [(1, SensorRole.board, board), (2, SensorRole.player2, rack)])
+        self.assertEqual(list(cursor.read()), [])
+
+    def test_cursors_are_independent(self):
+        ring = FrameRing()
+        first, second = ring.cursor(), ring.cursor()
+        for i in range(5):
+            ring.append(SensorRole.player1, {Tile('A'): i + 1})
+
+        self.assertEqual([record.seq for record in first.read(limit=2)], [1, 2])
+        self.assertEqual([record.seq for record in second.read()], [1, 2, 3, 4, 5])
+        self.assertEqual(first.lag, 3)
+        self.assertEqual(ring.cursor().lag, 0)
+        self.assertEqual(ring.cursor(from_oldest=True).lag, 5)
+
+    def test_slow_cursor_skips_overwritten_frames(self):
+        ring = FrameRing(n_of_bytes=FrameRing.MAX_RECORD_SIZE * 2)
+        cursor = ring.cursor()
+        for _ in range(10):
+            ring.append(SensorRole.board, make_board_delta(225))
+
+        records = list(cursor.read())
+        self.assertEqual([record.seq for record in records], [ring.oldest_seq + i for i in range(len(records))])
+        self.assertEqual(records[-1].seq, 10)
+        self.assertEqual(cursor.n_of_missed, 10 - len(records))
+        self.assertEqual(records[-1].to_delta(), make_board_delta(225))
+
+    def test_frame_slots_are_bounded(self):
+        ring = FrameRing(max_frames=8)
+        for _ in range(20):
+            ring.append(SensorRole.player1, {})
+        self.assertEqual(ring.oldest_seq, 13)
+        self.assertIsNone(ring.get(12))
+        self.assertEqual(ring.get(20).role, SensorRole.player1)
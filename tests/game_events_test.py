@@ -0,0 +1,37 @@
+import asyncio
+import unittest
+
+from game_simulator import GameSimulator
+from matchdata import GameState, SensorRole
+from tests.helpers import RecordingConnectionHandler
+
+class RecordingPublisher():
+    def __init__(self):
+        self.events = []
+
+    def publish(self, match_id, event):
+        self.events.append((match_id, event))
+        return len(self.events)
+
+class TestGameEvents(unittest.TestCase):
+    def test_every_turn_is_published(self):
+        publisher = RecordingPublisher()
+        game_state = GameState('Events', ('Player 1', 'Player 2'), RecordingConnectionHandler(), publisher=publisher)
+        turns = list(GameSimulator(3, max_turns=6).turns())
+        for turn in turns:
+            for frame in turn.frames:
+                game_state.process_delta(frame.role, frame.to_delta())
+            self.assertTrue(asyncio.run(game_state.end_turn(player_time=0)).is_success)
+
+        events = [event for match_id, event in publisher.events if match_id == 'Events']
+        self.assertEqual(events[0]['type'], 'rack')
+        self.assertEqual(len(events[0]['rack']), 7)
+
+        turn_events = events[1:]
+        self.assertEqual([event['turn'] for event in turn_events], list(range(len(turns))))
+        for turn, event in zip(turns, turn_events):
+            self.assertEqual(event['player'], turn.player.name)
+            if event['type'] == 'move':
+                self.assertEqual(event['score'], turn.score)
+                self.assertEqual(sorted((tile['row'], tile['col']) for tile in event['tiles']), sorted((row, col) for row, col, _ in turn.placement))
+            self.assertEqual(set(event['racks']), {SensorRole.player1.name, SensorRole.player2.name})
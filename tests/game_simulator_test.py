@@ -0,0 +1,27 @@
+import asyncio
+import unittest
+
+from game_simulator import GameSimulator, NoiseConfig, run_in_process
+from matchdata import SensorRole
+
+class TestGameSimulator(unittest.TestCase):
+    def test_same_seed_produces_same_frames(self):
+        noise = NoiseConfig(misread=0.1, flicker=0.1, occlusion=0.1, late=0.1)
+        first = [(frame.role, frame.tick, frame.payload) for turn in GameSimulator(3, noise).turns() for frame in turn.frames]
+        second = [(frame.role, frame.tick, frame.payload) for turn in GameSimulator(3, noise).turns() for frame in turn.frames]
+        self.assertEqual(first, second)
+
+    def test_game_ends(self):
+        turns = list(GameSimulator(1).turns())
+        self.assertTrue(turns[-1].game_over)
+        self.assertEqual(turns[0].player, SensorRole.player1)
+
+    def test_clean_game_resolves_in_process(self):
+        report = asyncio.run(run_in_process(GameSimulator(7)))
+        self.assertTrue(report.is_success, str(report))
+        self.assertEqual(report.frames_sent, report.frames_accepted)
+
+    def test_noisy_game_resolves_in_process(self):
+        noise = NoiseConfig(misread=0.05, flicker=0.05, occlusion=0.05)
+        report = asyncio.run(run_in_process(GameSimulator(11, noise)))
+        self.assertTrue(report.is_success, str(report))
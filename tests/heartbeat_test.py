@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+from clock import VirtualClock
+from tcp_server import SocketHandler
+
+class FakeWriter:
+    def __init__(self):
+        self.is_closed = False
+
+    def get_extra_info(self, name):
+        return ('sensor', 0)
+
+    def close(self):
+        self.is_closed = True
+
+    async def wait_closed(self):
+        pass
+
+class TestHeartbeat(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.clock = VirtualClock()
+        self.writer = FakeWriter()
+        self.socket = SocketHandler(None, None, self.writer, self.clock)
+        self.task = asyncio.ensure_future(self.socket.check_pulse())
+        await asyncio.sleep(0)
+
+    async def asyncTearDown(self):
+        self.task.cancel()
+
+    async def test_pulsing_sensor_stays_connected(self):
+        for _ in range(3600): # An hour of pulses, in virtual time
+            await self.clock.run_for(1.)
+            self.socket._match_server.pulse()
+        self.assertTrue(self.socket.is_connected)
+
+    async def test_silent_sensor_is_disconnected(self):
+        await self.clock.run_for(SocketHandler.PULSE_TIMEOUT)
+        self.assertTrue(self.socket.is_connected)
+
+        await self.clock.run_for(SocketHandler.PULSE_CHECK_INTERVAL)
+        self.assertFalse(self.socket.is_connected)
+        self.assertTrue(self.writer.is_closed)
@@ -0,0 +1,19 @@
+import threading
+
+class RecordingConnectionHandler():
+    def __init__(self):
+        """
+        Stands in for ConnectionHandler in game states, recording the calls they make on it
+        """
+        self.calls = [] # (method, name of the thread it was called on)
+        self.moves = []
+        self.rates = [] # (role, fps)
+
+    def confirm_move(self, match_id, move):
+        self.calls.append(('confirm_move', threading.current_thread().name))
+        self.moves.append(move)
+        return len(self.moves)
+
+    def set_frame_rate(self, match_id, role, fps):
+        self.calls.append(('set_frame_rate', threading.current_thread().name))
+        self.rates.append((role, fps))
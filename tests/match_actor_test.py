@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+from match_actor import MatchActor
+
+class FakeGameState:
+    def __init__(self):
+        self.events = []
+
+    def process_delta(self, role, delta):
+        self.events.append(('frame', delta))
+        return delta is not None
+
+    async def end_turn(self, player_time):
+        await asyncio.sleep(0.01)
+        self.events.append(('end_turn', player_time))
+        return player_time
+
+class TestMatchActor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.game_state = FakeGameState()
+        self.actor = MatchActor('Actor', self.game_state, max_queued=4)
+
+    async def asyncTearDown(self):
+        self.actor.close()
+
+    async def test_frames_and_commands_are_serialised(self):
+        self.assertTrue(self.actor.post_frame('board', 1))
+        self.assertTrue(self.actor.post_frame('board', 2))
+        res = await self.actor.call(FakeGameState.end_turn, 30)
+        self.actor.post_frame('board', 3)
+        await self.actor.call(lambda game_state: None)
+
+        self.assertEqual(res, 30)
+        self.assertEqual(self.game_state.events, [('frame', 1), ('frame', 2), ('end_turn', 30), ('frame', 3)])
+        self.assertEqual(self.actor.stats['frames'], 3)
+        self.assertEqual(self.actor.stats['commands'], 2)
+
+    async def test_frames_are_dropped_when_queue_is_full(self):
+        results = [self.actor.post_frame('board', i) for i in range(6)]
+        self.assertEqual(results, [True] * 4 + [False] * 2)
+        await self.actor.call(lambda game_state: None)
+        self.assertEqual(self.actor.stats['dropped_frames'], 2)
+        # Commands are queued even when frames fill the queue
+        self.assertEqual(self.actor.stats['max_queue_depth'], 5)
+
+    async def test_rejected_frames_are_counted(self):
+        self.actor.post_frame('board', None)
+        await self.actor.call(lambda game_state: None)
+        self.assertEqual(self.actor.stats['rejected_frames'], 1)
+
+    async def test_command_errors_are_raised_to_caller(self):
+        def fail(game_state):
+            raise ValueError("bad command")
+        with self.assertRaises(ValueError):
+            await self.actor.call(fail)
+        # The actor keeps running after a failed command
+        self.assertIsNone(await self.actor.call(lambda game_state: None))
+
+    async def test_commands_beyond_limit_are_rejected(self):
+        actor = MatchActor('Limited', self.game_state, max_queued_commands=2)
+        calls = [asyncio.ensure_future(actor.call(FakeGameState.end_turn, i)) for i in range(3)]
+        await asyncio.sleep(0)
+        with self.assertRaises(asyncio.QueueFull):
+            await calls[2]
+        self.assertEqual(await asyncio.gather(*calls[:2]), [0, 1])
+        self.assertEqual(actor.stats['rejected_commands'], 1)
+        actor.close()
@@ -0,0 +1,61 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from match_directory import MatchDirectory, Node
+
+NODE_A = Node('a', '10.0.0.1', 9189, 9190)
+NODE_B = Node('b', '10.0.0.2', 9189, 9190)
+
+class TestMatchDirectory(unittest.TestCase):
+    def setUp(self):
+        self.directory = MatchDirectory()
+        self.directory.register_node(NODE_A)
+        self.directory.register_node(NODE_B)
+
+    def tearDown(self):
+        self.directory.close()
+
+    def test_sensors_map_to_match_node(self):
+        self.assertTrue(self.directory.claim_match('Match1', 'a', [1, 2, 3]))
+        self.assertEqual(self.directory.get_sensor_node(2), NODE_A)
+        self.assertEqual(self.directory.get_match_node('Match1'), NODE_A)
+        self.assertIsNone(self.directory.get_sensor_node(4))
+
+    def test_match_cannot_be_claimed_twice(self):
+        self.assertTrue(self.directory.claim_match('Match1', 'a', [1]))
+        self.assertFalse(self.directory.claim_match('Match1', 'b', [2]))
+        self.assertIsNone(self.directory.get_sensor_node(2))
+
+    def test_sensor_follows_newest_match(self):
+        self.directory.claim_match('Match1', 'a', [1])
+        self.directory.claim_match('Match2', 'b', [1])
+        self.assertEqual(self.directory.get_sensor_node(1), NODE_B)
+
+        self.directory.release_match('Match2')
+        self.assertIsNone(self.directory.get_sensor_node(1))
+        self.assertIsNone(self.directory.get_match_node('Match2'))
+
+    def test_usable_from_other_threads(self):
+        # The sensor and HTTP sides share the directory when sensors are served on their own thread
+        results = []
+        def claim(i):
+            results.append(self.directory.claim_match(f'Match{i}', 'a', [i]))
+        threads = [threading.Thread(target=claim, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 8)
+        self.assertEqual(self.directory.get_sensor_node(7), NODE_A)
+
+    def test_nodes_share_database_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'directory.db'
+            first, second = MatchDirectory(path), MatchDirectory(path)
+            first.register_node(NODE_A)
+            first.claim_match('Match1', 'a', [1])
+            self.assertEqual(second.get_sensor_node(1), NODE_A)
+            first.close()
+            second.close()
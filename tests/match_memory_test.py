@@ -0,0 +1,42 @@
+import gc
+import itertools
+import tracemalloc
+import unittest
+
+from game_simulator import GameSimulator
+from match_actor import MatchActor
+from matchdata import GameState
+from tests.helpers import RecordingConnectionHandler
+
+# Hosts are sized for 1,000 concurrent matches, i.e. 64 MiB of match state
+BYTES_PER_MATCH = 64 * 1024
+N_OF_MATCHES = 100
+
+class TestMatchMemory(unittest.TestCase):
+    def setUp(self):
+        turns = itertools.islice(GameSimulator(7).turns(), 2)
+        self.frames = [(frame.role, frame.to_delta()) for turn in turns for frame in turn.frames]
+        # State shared by every match (e.g. the loggers' handlers) is created by the first one
+        self.make_match('MemoryWarmup')
+
+    def make_match(self, match_id: str) -> MatchActor:
+        """
+        Creates a match whose resolvers hold the frames of its first turns, as a match does while in progress
+        """
+        game_state = GameState(match_id, ('Player 1', 'Player 2'), RecordingConnectionHandler())
+        for role, delta in self.frames:
+            game_state.process_delta(role, dict(delta))
+        return MatchActor(match_id, game_state)
+
+    def test_bytes_per_match(self):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            matches = [self.make_match(f'Memory{i}') for i in range(N_OF_MATCHES)]
+            gc.collect()
+            size, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(len(matches), N_OF_MATCHES)
+        self.assertLess(size / N_OF_MATCHES, BYTES_PER_MATCH, f"{size / N_OF_MATCHES:.0f} bytes per match")
@@ -0,0 +1,64 @@
+import asyncio
+import multiprocessing
+import unittest
+
+from match_shards import HashRing, _MessageChannel, _encode_delta, _decode_delta, _encode_move, _decode_move
+from matchdata import SensorRole
+from scrabble import Pos, Tile, Move
+
+class TestHashRing(unittest.TestCase):
+    def test_keys_are_spread_over_nodes(self):
+        ring = HashRing(4)
+        counts = [0] * 4
+        for i in range(4000):
+            counts[ring.get_node(f'Match{i}')] += 1
+        self.assertTrue(all(count > 600 for count in counts), counts)
+
+    def test_adding_node_moves_few_keys(self):
+        before, after = HashRing(4), HashRing(5)
+        keys = [f'Match{i}' for i in range(4000)]
+        moved = sum(1 for key in keys if before.get_node(key) != after.get_node(key))
+        # Ideally 1/5 of the keys move to the new node, and none move between existing nodes
+        self.assertLess(moved, 4000 * 0.3)
+        self.assertTrue(all(after.get_node(key) in (before.get_node(key), 4) for key in keys))
+
+class TestEncoding(unittest.TestCase):
+    def test_board_delta_round_trip(self):
+        delta = {Pos(7, 7): Tile('A'), Pos(7, 8): Tile('?')}
+        self.assertEqual(_decode_delta(SensorRole.board, _encode_delta(SensorRole.board, delta)), delta)
+
+    def test_rack_round_trip(self):
+        rack = {Tile('E'): 2, Tile('Q'): 1}
+        self.assertEqual(_decode_delta(SensorRole.player1, _encode_delta(SensorRole.player1, rack)), rack)
+
+    def test_move_round_trip(self):
+        move = Move([Tile('A'), Tile('T')], [Pos(7, 7), Pos(7, 8)])
+        self.assertEqual(list(_decode_move(_encode_move(move))), list(move))
+
+class TestMessageChannel(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.received = []
+        self.closed = asyncio.Event()
+        left, right = multiprocessing.Pipe()
+        self.sender = _MessageChannel(left, self.received.append, lambda: None)
+        self.receiver = _MessageChannel(right, self.received.append, self.closed.set)
+
+    async def asyncTearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    async def test_messages_larger_than_the_socket_buffer_are_written_when_writable(self):
+        msgs = [('frames', i, b'x' * 300000) for i in range(4)]
+        for msg in msgs:
+            self.assertTrue(self.sender.send(msg))
+        self.assertGreater(self.sender.n_of_buffered_bytes, 0)
+        while len(self.received) < len(msgs):
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.received, msgs)
+        self.assertEqual(self.sender.n_of_buffered_bytes, 0)
+
+    async def test_closing_one_end_closes_the_other(self):
+        self.sender.close()
+        await asyncio.wait_for(self.closed.wait(), timeout=1.)
+        self.assertTrue(self.receiver.is_closed)
+        self.assertFalse(self.receiver.send(('result', 1, None)))
@@ -0,0 +1,20 @@
+import unittest
+
+from scrabble import Pos, Tile, Move
+from frame_ring import FrameRing
+from matchdata import SensorRole
+from tcp_server import ConnectionHandler, RackFeed, SensorSession
+
+class NoMatches:
+    def get_actor(self, match_id):
+        return None
+
+class TestMatchTeardown(unittest.TestCase):
+    def test_move_confirmed_without_sensors_is_not_delivered(self):
+        handler = ConnectionHandler(matches=NoMatches())
+        seq = handler.confirm_move('Ended', Move([Tile('A')], [Pos(7, 7)]))
+        self.assertEqual(seq, ConnectionHandler.UNDELIVERED_SEQ)
+
+    def test_rack_after_teardown_is_rejected(self):
+        feed = RackFeed('Ended', SensorRole.player1, SensorSession(), NoMatches(), FrameRing(), 0x1)
+        self.assertFalse(feed.sendRack('TILES', 1))
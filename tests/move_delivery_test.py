@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+
+from scrabble import Pos, Tile, Move
+from clock import VirtualClock
+from matchdata import SensorRole
+from tcp_server import ConnectionHandler, MatchSensors, MoveDelivery, SensorSession, TCPServer
+
+class FakePromise:
+    def __init__(self, success, delay):
+        self._success = success
+        self._delay = delay
+
+    async def a_wait(self):
+        await asyncio.sleep(self._delay)
+        return type('Result', (), {'success': self._success})
+
+class FakeBoard:
+    def __init__(self, n_of_timeouts: int = 0):
+        """
+        Acknowledges confirmMove requests, except for the first n_of_timeouts which never get a response
+        """
+        self.received = []
+        self._n_of_timeouts = n_of_timeouts
+
+    def confirmMove(self, move, seq):
+        if self._n_of_timeouts > 0:
+            self._n_of_timeouts -= 1
+            return FakePromise(True, 60)
+        self.received.append(seq)
+        return FakePromise(True, 0)
+
+class FakeSocket:
+    def __init__(self, board: FakeBoard):
+        self.sensor = board
+        self.is_connected = True
+
+class DisconnectedSocket:
+    def __init__(self):
+        self.sensor = None
+        self.n_of_checks = 0
+
+    @property
+    def is_connected(self):
+        self.n_of_checks += 1
+        return False
+
+def make_sensors(board, clock=None):
+    socket = board if isinstance(board, DisconnectedSocket) else FakeSocket(board)
+    return MatchSensors(socket, None, None, {role: SensorSession() for role in SensorRole}, 'Delivery', clock=clock)
+
+def make_moves():
+    return [Move([Tile('A')], [Pos(7, 7)]), Move([Tile('T')], [Pos(7, 8)]), Move([Tile('S')], [Pos(7, 9)])]
+
+class TestMoveDelivery(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._attempt_timeout = MoveDelivery.ATTEMPT_TIMEOUT
+        MoveDelivery.ATTEMPT_TIMEOUT = 0.05
+
+    async def asyncTearDown(self):
+        MoveDelivery.ATTEMPT_TIMEOUT = self._attempt_timeout
+
+    async def wait_until_delivered(self, sensors: MatchSensors):
+        while sensors.delivery.queue_depth > 0:
+            await asyncio.sleep(0.01)
+
+    async def test_moves_are_delivered_in_order(self):
+        board = FakeBoard()
+        sensors = make_sensors(board)
+        for move in make_moves():
+            sensors.delivery.push(sensors.record_confirmed_move(move))
+        self.assertEqual(sensors.delivery.queue_depth, 3)
+
+        await self.wait_until_delivered(sensors)
+        self.assertEqual(board.received, [1, 2, 3])
+        self.assertEqual(sensors.delivery.stats['delivered'], 3)
+
+    async def test_timed_out_move_is_retried_before_later_moves(self):
+        board = FakeBoard(n_of_timeouts=2)
+        sensors = make_sensors(board)
+        for move in make_moves()[:2]:
+            sensors.delivery.push(sensors.record_confirmed_move(move))
+
+        await self.wait_until_delivered(sensors)
+        self.assertEqual(board.received, [1, 2])
+        self.assertEqual(sensors.delivery.stats['attempts'], 4)
+
+    async def test_duplicate_and_resumed_moves_are_not_resent(self):
+        board = FakeBoard()
+        sensors = make_sensors(board)
+        sensors.board.is_connected = False
+        for move in make_moves()[:2]:
+            sensors.delivery.push(sensors.record_confirmed_move(move))
+        sensors.delivery.push(1)
+        self.assertEqual(sensors.delivery.queue_depth, 2)
+
+        # Board reconnects and receives both moves as part of its resume info
+        sensors.get_resume_info(SensorRole.board, last_confirmed_move=0)
+        sensors.board.is_connected = True
+        self.assertEqual(sensors.delivery.queue_depth, 0)
+
+        sensors.delivery.push(sensors.record_confirmed_move(make_moves()[2]))
+        await self.wait_until_delivered(sensors)
+        self.assertEqual(board.received, [3])
+
+    async def test_rpc_test_moves_are_numbered_like_confirmed_moves(self):
+        board = FakeBoard()
+        sensors = make_sensors(board)
+        server = TCPServer(asyncio.get_running_loop())
+        server._connection_handler._active_matches['Delivery'] = sensors
+        self.assertEqual([server.confirm_move('Delivery', move) for move in make_moves()[:2]], [1, 2])
+
+        await self.wait_until_delivered(sensors)
+        self.assertEqual(board.received, [1, 2])
+
+    async def test_disconnected_board_is_polled_with_backoff(self):
+        clock = VirtualClock()
+        socket = DisconnectedSocket()
+        sensors = make_sensors(socket, clock)
+        sensors.delivery.push(sensors.record_confirmed_move(make_moves()[0]))
+        await clock.run_for(60.)
+
+        # Polling every RETRY_DELAY would check the board 120 times
+        self.assertLess(socket.n_of_checks, 30)
+        self.assertEqual(sensors.delivery.queue_depth, 1)
+        sensors.close()
+
+    async def test_ended_match_stops_delivery(self):
+        clock = VirtualClock()
+        socket = DisconnectedSocket()
+        sensors = make_sensors(socket, clock)
+        handler = ConnectionHandler(clock=clock)
+        handler._active_matches['Delivery'] = sensors
+        sensors.delivery.push(sensors.record_confirmed_move(make_moves()[0]))
+        await clock.run_for(1.)
+
+        self.assertTrue(handler.end_match('Delivery'))
+        self.assertFalse(handler.end_match('Delivery'))
+        n_of_checks = socket.n_of_checks
+        sensors.delivery.push(sensors.record_confirmed_move(make_moves()[1]))
+        await clock.run_for(60.)
+        self.assertEqual(socket.n_of_checks, n_of_checks)
+        self.assertEqual(clock.n_of_sleepers, 0)
@@ -0,0 +1,112 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+from publisher import Publisher, StubReceiver
+
+N_OF_MATCHES = 100
+
+class TestPublisher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._constants = (Publisher.RETRY_DELAY, Publisher.MAX_RETRY_DELAY, Publisher.MAX_IN_MEMORY)
+        Publisher.RETRY_DELAY, Publisher.MAX_RETRY_DELAY = 0.01, 0.05
+        self.receiver = StubReceiver()
+        self.url = await self.receiver.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.spill_path = Path(self.directory.name) / 'spill.db'
+        self.publisher = Publisher(self.url, self.spill_path)
+
+    async def asyncTearDown(self):
+        Publisher.RETRY_DELAY, Publisher.MAX_RETRY_DELAY, Publisher.MAX_IN_MEMORY = self._constants
+        await self.publisher.close()
+        await self.receiver.close()
+        self.directory.cleanup()
+
+    async def wait_until_published(self, publisher: Publisher, timeout: float = 5.):
+        async def wait():
+            while publisher.stats['queued'] > 0:
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(wait(), timeout)
+
+    def received_turns(self, match_id):
+        return [event['turn'] for event in self.receiver.events.get(match_id, [])]
+
+    async def test_events_are_batched_in_order(self):
+        seqs = [self.publisher.publish('Match', {'type': 'move', 'turn': turn}) for turn in range(10)]
+        self.assertEqual(seqs, list(range(1, 11)))
+        await self.wait_until_published(self.publisher)
+
+        self.assertEqual(self.received_turns('Match'), list(range(10)))
+        self.assertEqual(self.receiver.n_of_requests, 1)
+
+    async def test_failed_requests_are_retried(self):
+        self.receiver.n_of_failures = 3
+        for turn in range(5):
+            self.publisher.publish('Match', {'type': 'pass', 'turn': turn})
+        await self.wait_until_published(self.publisher)
+
+        self.assertEqual(self.received_turns('Match'), list(range(5)))
+        self.assertEqual(self.publisher.stats['failed_requests'], 3)
+
+    async def test_unserialisable_events_do_not_stop_delivery(self):
+        self.publisher.publish('Match', {'type': 'move', 'turn': 0, 'move': object()})
+        await self.wait_until_published(self.publisher)
+        self.publisher.publish('Match', {'type': 'move', 'turn': 1})
+        await self.wait_until_published(self.publisher)
+
+        self.assertEqual(self.received_turns('Match'), [1])
+        self.assertEqual(self.publisher.stats['rejected'], 1)
+
+    async def test_unexpected_errors_are_retried(self):
+        post = self.publisher._post
+        n_of_errors = 2
+        async def failing_post(match_id, batch):
+            nonlocal n_of_errors
+            if n_of_errors > 0:
+                n_of_errors -= 1
+                raise RuntimeError("Unexpected")
+            return await post(match_id, batch)
+        self.publisher._post = failing_post
+        self.publisher.publish('Match', {'type': 'pass', 'turn': 0})
+        await self.wait_until_published(self.publisher)
+
+        self.assertEqual(self.received_turns('Match'), [0])
+        self.assertEqual(self.publisher.stats['failed_requests'], 2)
+
+    async def test_publish_does_not_wait_for_platform(self):
+        self.receiver.delay = 0.5
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for turn in range(100):
+            self.publisher.publish('Match', {'type': 'move', 'turn': turn})
+        self.assertLess(loop.time() - start, 0.1)
+
+    async def test_spilled_events_survive_restart(self):
+        Publisher.MAX_IN_MEMORY = 4
+        self.receiver.n_of_failures = 1000
+        for turn in range(10):
+            self.publisher.publish('Match', {'type': 'move', 'turn': turn})
+        await asyncio.sleep(0.1)
+        await self.publisher.close()
+        self.assertEqual(self.received_turns('Match'), [])
+
+        self.receiver.n_of_failures = 0
+        self.publisher = Publisher(self.url, self.spill_path)
+        self.assertEqual(self.publisher.stats['queued'], 10)
+        self.publisher.resume()
+        self.publisher.publish('Match', {'type': 'move', 'turn': 10})
+        await self.wait_until_published(self.publisher)
+
+        self.assertEqual(self.received_turns('Match'), list(range(11)))
+        self.assertEqual([event['seq'] for event in self.receiver.events['Match']], list(range(1, 12)))
+
+    async def test_many_matches_end_turns_at_once(self):
+        for turn in range(5):
+            for i in range(N_OF_MATCHES):
+                self.publisher.publish(f'Match{i}', {'type': 'move', 'turn': turn})
+        await self.wait_until_published(self.publisher)
+
+        self.assertTrue(all(self.received_turns(f'Match{i}') == list(range(5)) for i in range(N_OF_MATCHES)))
+        # Each match's events for the burst go in a single request
+        self.assertEqual(self.receiver.n_of_requests, N_OF_MATCHES)
@@ -0,0 +1,35 @@
+import unittest
+
+from scrabble import Tile
+from rack_codec import RackDecoder
+
+class TestRackDecoder(unittest.TestCase):
+    def setUp(self):
+        self.decoder = RackDecoder()
+        self.decoder.clear()
+
+    def test_valid_rack(self):
+        res = self.decoder.decode('tiles')
+        self.assertTrue(res.is_success)
+        self.assertEqual(res.value, {Tile('T'): 1, Tile('I'): 1, Tile('L'): 1, Tile('E'): 1, Tile('S'): 1})
+
+    def test_invalid_rack(self):
+        self.assertFalse(self.decoder.decode('TIL3S').is_success)
+        self.assertFalse(self.decoder.decode('TIL3S').is_success)
+        self.assertEqual(self.decoder.stats['hits'], 1)
+
+    def test_repeated_rack_is_cached(self):
+        first = self.decoder.decode('RATES?V')
+        second = self.decoder.decode('RATES?V')
+        self.assertIs(first, second)
+        self.assertEqual(self.decoder.hit_rate, 0.5)
+
+    def test_oversized_rack_is_not_cached(self):
+        self.assertFalse(self.decoder.decode('A' * 8).is_success)
+        self.assertEqual(self.decoder.stats['size'], 0)
+        self.assertEqual(self.decoder.stats['rejected'], 1)
+
+    def test_histogram_is_read_only(self):
+        histogram = self.decoder.decode('AA').value
+        with self.assertRaises(TypeError):
+            histogram[Tile('A')] = 3
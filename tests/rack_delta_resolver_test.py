@@ -1,9 +1,9 @@
 import unittest
-import time
 
 from scrabble import Tile
 from rack_delta_resolver import RackDeltaResolver
 from tile_bag import TileBag
+from clock import VirtualClock
 from logger import get_logger
 
 logger = get_logger('GameState-ExampleId')
@@ -131,11 +131,22 @@ class TestEndTurn(unittest.TestCase):
         self.assertTrue(resolver.process_delta(rack))
         self.assertFalse(resolver.end_turn())
 
-    def test_old_snapshot_is_invalid(self):
+    def test_misread_frame_is_outvoted(self):
         resolver = RackDeltaResolver(TileBag(), logger)
+        for _ in range(3):
+            self.assertTrue(resolver.process_delta(to_rack("POGBOLP")))
+        self.assertTrue(resolver.process_delta(to_rack("POGBOLE")))
+
+        self.assertTrue(resolver.end_turn())
+        self.assertEqual(resolver.previous_rack, to_rack("POGBOLP"))
+        self.assertEqual(resolver.confidence, 3)
+
+    def test_old_snapshot_is_invalid(self):
+        clock = VirtualClock()
+        resolver = RackDeltaResolver(TileBag(), logger, clock)
         rack = to_rack("RAEES?T")
         self.assertTrue(resolver.process_delta(rack))
-        time.sleep(RackDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS / 1000)
+        clock.advance(RackDeltaResolver.MAX_SNAPSHOT_AGE_IN_MS / 1000 + 0.001)
         self.assertFalse(resolver.end_turn())
 
     def _set_resolver_to_play_mode(self, resolver: RackDeltaResolver, rack):
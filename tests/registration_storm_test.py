@@ -0,0 +1,111 @@
+import asyncio
+import heapq
+import random
+import unittest
+from time import monotonic
+
+from backoff import ReconnectPolicy
+from rack_client import FakeRackClient
+from tcp_server import RegistrationLimiter, TCPServer
+
+N_OF_SENSORS = 500
+RATE = 50.
+BURST = 50
+ROUND_TRIP = 0.01
+
+def simulate_storm(limiter: RegistrationLimiter, seed: int = 0):
+    """
+    Reconnects N_OF_SENSORS fake sensors to a freshly restarted server in virtual time. Returns the time each sensor registered at.
+    """
+    policies = {mac: ReconnectPolicy(rng=random.Random(seed * N_OF_SENSORS + mac)) for mac in range(N_OF_SENSORS)}
+    attempts = [(policy.next_delay(), mac) for mac, policy in policies.items()]
+    heapq.heapify(attempts)
+
+    registered_at = {}
+    while attempts:
+        now, mac = heapq.heappop(attempts)
+        delay = limiter.try_admit(mac, now + ROUND_TRIP)
+        if delay is None:
+            registered_at[mac] = now + ROUND_TRIP
+            continue
+
+        policies[mac].defer(delay)
+        heapq.heappush(attempts, (now + 2 * ROUND_TRIP + policies[mac].next_delay(), mac))
+
+    return registered_at
+
+class TestRegistrationStorm(unittest.TestCase):
+    def test_all_sensors_register(self):
+        registered_at = simulate_storm(RegistrationLimiter(RATE, BURST))
+        self.assertEqual(len(registered_at), N_OF_SENSORS)
+
+        time_to_registered = max(registered_at.values())
+        # Sustained rate after the burst, with some slack for sensors arriving after their reserved slot
+        self.assertLess(time_to_registered, (N_OF_SENSORS - BURST) / RATE + 5.)
+
+    def test_admissions_are_spread_out(self):
+        registered_at = sorted(simulate_storm(RegistrationLimiter(RATE, BURST)).values())
+
+        window_start = 0
+        for i, t in enumerate(registered_at):
+            while registered_at[window_start] <= t - 1.:
+                window_start += 1
+            self.assertLessEqual(i - window_start + 1, RATE + BURST + 1)
+
+    def test_reservation_is_honoured(self):
+        limiter = RegistrationLimiter(rate=1., burst=1)
+        self.assertIsNone(limiter.try_admit(1, now=0.))
+        delay = limiter.try_admit(2, now=0.)
+        self.assertAlmostEqual(delay, 1.)
+
+        # Another sensor cannot take the reserved slot
+        self.assertGreater(limiter.try_admit(3, now=1.), 0.)
+        self.assertIsNone(limiter.try_admit(2, now=1.))
+
+class TestDeferredRegistration(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        loop = asyncio.get_running_loop()
+        # A second sensor arriving with the first is deferred by half a second
+        self.tcp_server = TCPServer(loop, registration_limiter=RegistrationLimiter(rate=2., burst=1))
+        self.server = await asyncio.start_server(self.tcp_server.handle, host='localhost', port=0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.clients = [FakeRackClient(loop, mac, send_test_frames=False) for mac in (1, 2)]
+        self.tasks = [asyncio.ensure_future(client.connect(addr='localhost', port=port)) for client in self.clients]
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            if client.is_registered:
+                await client.disconnect()
+        for task in self.tasks:
+            task.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def wait_for_registered(self, n: int, timeout: float) -> float:
+        start = monotonic()
+        while sum(client.is_registered for client in self.clients) < n:
+            self.assertLess(monotonic() - start, timeout, f"{n} sensors did not register")
+            await asyncio.sleep(0.01)
+        return monotonic()
+
+    async def test_deferred_sensor_retries_later(self):
+        first_registered_at = await self.wait_for_registered(1, timeout=5.)
+        self.assertEqual(sum(client.is_registered for client in self.clients), 1)
+
+        # The deferred sensor reconnects once the server's retryAfter has passed, rather than at its own backoff
+        second_registered_at = await self.wait_for_registered(2, timeout=5.)
+        self.assertGreater(second_registered_at - first_registered_at, 0.3)
+        self.assertEqual(self.tcp_server._connection_handler._registration_limiter.n_of_reservations, 0)
+
+class TestReconnectPolicy(unittest.TestCase):
+    def test_delays_are_bounded(self):
+        policy = ReconnectPolicy(base=0.5, cap=4., rng=random.Random(0))
+        delays = [policy.next_delay() for _ in range(50)]
+        self.assertTrue(all(0.5 <= delay <= 4. for delay in delays))
+        self.assertGreater(max(delays), 2.)
+
+    def test_defer_sets_minimum_delay(self):
+        policy = ReconnectPolicy(base=0.5, cap=4., rng=random.Random(0))
+        policy.defer(10.)
+        self.assertEqual(policy.next_delay(), 10.)
+        self.assertLessEqual(policy.next_delay(), 4.)
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import Future
+
+import match_commands as commands
+from matchdata import GameStateStore, SensorRole
+from sensor_thread import MatchBridge, _SensorConnectionHandler
+from tests.helpers import RecordingConnectionHandler
+
+class TestMatchBridge(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.sensor_loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.sensor_loop.run_forever, name='TestSensorThread', daemon=True)
+        self.thread.start()
+        self.bridge = MatchBridge(asyncio.get_running_loop(), self.sensor_loop)
+
+    async def asyncTearDown(self):
+        self.sensor_loop.call_soon_threadsafe(self.sensor_loop.stop)
+        self.thread.join()
+        self.sensor_loop.close()
+
+    async def on_sensor_thread(self, fn, *args):
+        future = Future()
+        def run():
+            try:
+                future.set_result(fn(*args))
+            except Exception as err:
+                future.set_exception(err)
+        self.sensor_loop.call_soon_threadsafe(run)
+        return await asyncio.wrap_future(future)
+
+    async def test_frames_reach_match_on_main_loop(self):
+        await self.on_sensor_thread(self.bridge.create_new_match, 'Bridge1', ('Player 1', 'Player 2'), RecordingConnectionHandler())
+        actor = self.bridge.get_actor('Bridge1')
+        def post_frames():
+            return [actor.post_frame(SensorRole.board, {}) for _ in range(20)]
+        self.assertEqual(await self.on_sensor_thread(post_frames), [True] * 20)
+
+        # Commands are queued behind the frames handed over before them
+        async def sync():
+            return await actor.call(commands.sync)
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(sync(), self.sensor_loop))
+
+        self.assertEqual(GameStateStore().get_actor('Bridge1').stats['frames'], 20)
+        self.assertEqual(self.bridge.stats['frames'], 20)
+        self.assertLessEqual(self.bridge.stats['batches'], 20)
+        self.assertEqual(self.bridge.queue_depth, 0)
+
+    async def test_frames_beyond_bridge_or_actor_queue_are_rejected(self):
+        self.bridge = MatchBridge(asyncio.get_running_loop(), self.sensor_loop, max_queued=4)
+        await self.on_sensor_thread(self.bridge.create_new_match, 'Bridge3', ('Player 1', 'Player 2'), RecordingConnectionHandler())
+        actor = self.bridge.get_actor('Bridge3')
+        def post_frames(n):
+            return [actor.post_frame(SensorRole.board, {}) for _ in range(n)]
+        self.assertEqual(await self.on_sensor_thread(post_frames, 6), [True] * 4 + [False] * 2)
+        self.assertEqual(self.bridge.stats['rejected_frames'], 2)
+
+        # Once handed over, the actor's own verdict on the match's last frame is reported
+        async def sync():
+            return await actor.call(commands.sync)
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(sync(), self.sensor_loop))
+        self.assertEqual(GameStateStore().get_actor('Bridge3').stats['frames'], 4)
+        self.assertEqual(await self.on_sensor_thread(post_frames, 1), [True])
+
+    async def test_game_state_calls_run_on_sensor_thread(self):
+        handler = RecordingConnectionHandler()
+        proxy = _SensorConnectionHandler(handler, self.sensor_loop)
+        self.assertEqual(proxy.confirm_move('Bridge2', None), 0)
+        proxy.set_frame_rate('Bridge2', SensorRole.board, 2.)
+        await self.on_sensor_thread(lambda: None)
+
+        self.assertEqual(handler.calls, [('confirm_move', 'TestSensorThread'), ('set_frame_rate', 'TestSensorThread')])
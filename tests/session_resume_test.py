@@ -0,0 +1,77 @@
+import unittest
+
+from scrabble import Pos, Tile, Move
+from matchdata import SensorRole
+from tcp_server import MatchSensors, SensorSession
+
+def make_sensors():
+    return MatchSensors(None, None, None, {role: SensorSession() for role in SensorRole})
+
+class TestSensorSession(unittest.TestCase):
+    def test_new_frames_are_processed(self):
+        session = SensorSession()
+        self.assertIsNone(session.accept_frame(1))
+        self.assertIsNone(session.accept_frame(3))
+        self.assertEqual(session.last_frame_seq, 3)
+
+    def test_resent_frame_is_acknowledged(self):
+        session = SensorSession()
+        session.accept_frame(5)
+        self.assertTrue(session.accept_frame(5))
+
+    def test_late_frame_is_rejected(self):
+        session = SensorSession()
+        session.accept_frame(5)
+        self.assertFalse(session.accept_frame(4))
+        self.assertEqual(session.last_frame_seq, 5)
+
+    def test_unsequenced_frames_are_processed(self):
+        session = SensorSession()
+        self.assertIsNone(session.accept_frame(0))
+        self.assertIsNone(session.accept_frame(0))
+
+    def test_rebooted_sensor_resends_from_start(self):
+        session = SensorSession()
+        for seq in range(1, 101):
+            session.accept_frame(seq)
+
+        # A rebooted sensor has acknowledged nothing, and numbers its frames from 1 again
+        self.assertTrue(session.resume(0))
+        self.assertIsNone(session.accept_frame(1))
+        self.assertIsNone(session.accept_frame(2))
+        self.assertEqual(session.last_frame_seq, 2)
+
+    def test_reconnected_sensor_keeps_its_place(self):
+        session = SensorSession()
+        session.accept_frame(5)
+        self.assertFalse(session.resume(5))
+        self.assertTrue(session.accept_frame(5))
+
+class TestResumeInfo(unittest.TestCase):
+    def test_board_receives_only_missed_moves(self):
+        sensors = make_sensors()
+        moves = [
+            Move([Tile('A'), Tile('T')], [Pos(7, 7), Pos(7, 8)]),
+            Move([Tile('S')], [Pos(7, 9)]),
+            Move([Tile('C')], [Pos(6, 7)])
+        ]
+        self.assertEqual([sensors.record_confirmed_move(move) for move in moves], [1, 2, 3])
+
+        info = sensors.get_resume_info(SensorRole.board, last_confirmed_move=1)
+        self.assertEqual([entry.seq for entry in info.missedMoves], [2, 3])
+        self.assertEqual(info.missedMoves[0].move.tiles[0].value, ord('S'))
+
+    def test_last_frame_seq_is_reported(self):
+        sensors = make_sensors()
+        sensors.get_session(SensorRole.player1).accept_frame(42)
+
+        self.assertEqual(sensors.get_resume_info(SensorRole.player1, 0).lastFrameSeq, 42)
+        self.assertEqual(len(sensors.get_resume_info(SensorRole.player1, 0).missedMoves), 0)
+
+    def test_rewound_session_is_reported(self):
+        sensors = make_sensors()
+        sensors.get_session(SensorRole.board).accept_frame(42)
+        sensors.get_session(SensorRole.board).resume(40)
+
+        # The sensor resends any frame newer than the seq reported
+        self.assertEqual(sensors.get_resume_info(SensorRole.board, 0).lastFrameSeq, 40)
@@ -0,0 +1,52 @@
+import random
+import unittest
+from collections import Counter
+
+from snapshot_window import SnapshotWindow
+
+class TestSnapshotWindow(unittest.TestCase):
+    def test_flicker_does_not_replace_leader(self):
+        window = SnapshotWindow(max_age=3.)
+        for now, key in enumerate('AAAB'):
+            window.add(key, key.lower(), float(now))
+        self.assertEqual(window.vote(3.), ('a', 3))
+
+    def test_ties_go_to_newest_snapshot(self):
+        window = SnapshotWindow(max_age=3.)
+        for now, key in enumerate('AABB'):
+            window.add(key, key, float(now))
+        self.assertEqual(window.leader, 'B')
+
+    def test_old_frames_stop_voting(self):
+        window = SnapshotWindow(max_age=1., size=10)
+        for now, key in [(0., 'A'), (0.1, 'A'), (0.9, 'B')]:
+            window.add(key, key, now)
+        self.assertEqual(window.vote(1.05), ('B', 1))
+        self.assertIsNone(window.vote(2.))
+        self.assertEqual(window.last_update, 0.9)
+
+    def test_retain_leader(self):
+        window = SnapshotWindow(max_age=10.)
+        for now, key in enumerate('ABAC'):
+            window.add(key, key, float(now))
+        window.retain_leader()
+        self.assertEqual(len(window), 2)
+        window.add('C', 'C', 4.)
+        self.assertEqual(window.vote(4.), ('A', 2))
+
+    def test_matches_recount(self):
+        rng = random.Random(3)
+        window = SnapshotWindow(max_age=1., size=5)
+        frames = []
+        now = 0.
+        for _ in range(2000):
+            now += rng.random() * 0.3
+            key = rng.choice('ABCD')
+            window.add(key, key, now)
+            frames.append((now, key))
+
+            voting = [key for received, key in frames if received >= now - 1.][-5:]
+            counts = Counter(voting)
+            n_of_votes = max(counts.values())
+            expected = [key for key in voting if counts[key] == n_of_votes][-1]
+            self.assertEqual(window.vote(now), (expected, n_of_votes))
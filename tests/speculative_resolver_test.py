@@ -0,0 +1,46 @@
+import unittest
+
+from speculative_resolver import SpeculativeResolver
+from bitboard import BitBoard
+from scrabble import Pos, Tile
+from logger import get_logger
+
+logger = get_logger('GameState-ExampleId-speculation')
+
+def make_deltas():
+    board_delta = {Pos(7, 7): Tile('A'), Pos(7, 8): Tile('T')}
+    rack_delta = {Tile('A'): 1, Tile('T'): 1}
+    return board_delta, rack_delta
+
+class TestSpeculativeResolver(unittest.TestCase):
+    def test_candidate_is_scored_without_changing_board(self):
+        board = BitBoard()
+        resolver = SpeculativeResolver(board, logger)
+        candidate = resolver.update(*make_deltas())
+
+        self.assertIsNotNone(candidate)
+        self.assertGreater(candidate.score, 0)
+        self.assertIsNone(board.get_tile(Pos(7, 7)))
+
+    def test_unchanged_deltas_reuse_candidate(self):
+        resolver = SpeculativeResolver(BitBoard(), logger)
+        first = resolver.update(*make_deltas())
+        self.assertIs(resolver.update(*make_deltas()), first)
+        self.assertEqual(resolver.stats['speculations'], 1)
+
+    def test_take_requires_same_deltas(self):
+        resolver = SpeculativeResolver(BitBoard(), logger)
+        resolver.update(*make_deltas())
+        board_delta, rack_delta = make_deltas()
+        board_delta[Pos(7, 9)] = Tile('S')
+        self.assertIsNone(resolver.take(board_delta, rack_delta))
+
+        resolver.update(*make_deltas())
+        self.assertIsNotNone(resolver.take(*make_deltas()))
+        self.assertIsNone(resolver.candidate)
+        self.assertEqual((resolver.stats['hits'], resolver.stats['misses']), (1, 1))
+
+    def test_invalid_move_has_no_candidate(self):
+        resolver = SpeculativeResolver(BitBoard(), logger)
+        board_delta = {Pos(0, 0): Tile('A'), Pos(1, 1): Tile('T')}
+        self.assertIsNone(resolver.update(board_delta, {Tile('A'): 1, Tile('T'): 1}))
@@ -1,3 +1,4 @@
+import random
 import unittest
 from typing import Dict
 
@@ -97,4 +98,23 @@ class TestExpectedTiles(unittest.TestCase):
         }))
 
         self.assertEqual(bag.get_expected_tiles_on_rack({}), 3)
-        self.assertEqual(bag.get_expected_tiles_on_rack(to_rack({'G': 2})), 5)
\ No newline at end of file
+        self.assertEqual(bag.get_expected_tiles_on_rack(to_rack({'G': 2})), 5)
+
+class TestDraw(unittest.TestCase):
+    def test_draw_removes_tiles(self):
+        bag = TileBag()
+        drawn = bag.draw(7, random.Random(0))
+
+        self.assertEqual(sum(drawn.values()), 7)
+        self.assertEqual(bag.n_of_tiles, 100 - 7)
+
+    def test_draw_is_reproducible(self):
+        self.assertEqual(TileBag().draw(7, random.Random(42)), TileBag().draw(7, random.Random(42)))
+
+    def test_draw_from_nearly_empty_bag(self):
+        bag = TileBag()
+        bag.empty()
+        bag.add_tiles(to_rack({'Q': 1, 'U': 1}))
+
+        self.assertEqual(bag.draw(7, random.Random(0)), to_rack({'Q': 1, 'U': 1}))
+        self.assertEqual(bag.n_of_tiles, 0)
@@ -0,0 +1,62 @@
+import random
+import unittest
+
+from transport import Packer, Unpacker, ReadSizer, StreamCodec, pack_words
+
+class TestPacking(unittest.TestCase):
+    def test_known_encoding(self):
+        # Example from the capnp encoding spec
+        unpacked = bytes([0x08, 0, 0, 0, 0x03, 0, 0x02, 0, 0x19, 0, 0, 0, 0xaa, 0x01, 0, 0])
+        self.assertEqual(pack_words(unpacked), bytes([0x51, 0x08, 0x03, 0x02, 0x31, 0x19, 0xaa, 0x01]))
+
+    def test_zero_run(self):
+        self.assertEqual(pack_words(bytes(8 * 3)), b'\x00\x02')
+
+    def test_round_trip_with_arbitrary_chunks(self):
+        rng = random.Random(1)
+        for trial in range(200):
+            n_of_words = rng.randrange(0, 80)
+            if trial % 3 == 0:
+                data = bytes(rng.randrange(1, 256) for _ in range(8 * n_of_words))
+            else:
+                data = bytes(rng.randrange(256) if rng.random() < 0.3 else 0 for _ in range(8 * n_of_words))
+
+            packer, unpacker = Packer(), Unpacker()
+            packed = b''
+            i = 0
+            while i < len(data):
+                j = min(len(data), i + rng.randrange(1, 50))
+                packed += packer.pack(data[i:j])
+                i = j
+
+            unpacked = b''
+            i = 0
+            while i < len(packed):
+                j = min(len(packed), i + rng.randrange(1, 20))
+                unpacked += unpacker.unpack(packed[i:j])
+                i = j
+
+            self.assertEqual(unpacked, data)
+
+    def test_plain_codec_passes_through(self):
+        codec = StreamCodec()
+        self.assertFalse(codec.is_packed)
+        self.assertEqual(bytes(codec.encode(b'12345678')), b'12345678')
+        self.assertEqual(codec.decode(b'abc'), b'abc')
+        self.assertEqual((codec.bytes_in, codec.bytes_out), (3, 8))
+
+class TestReadSizer(unittest.TestCase):
+    def test_grows_on_full_reads(self):
+        sizer = ReadSizer()
+        for _ in range(10):
+            sizer.update(sizer.size)
+        self.assertEqual(sizer.size, ReadSizer.MAX_SIZE)
+
+    def test_shrinks_on_small_reads(self):
+        sizer = ReadSizer()
+        sizer.update(sizer.size)
+        sizer.update(sizer.size)
+        self.assertEqual(sizer.size, 4 * ReadSizer.MIN_SIZE)
+        for _ in range(5):
+            sizer.update(10)
+        self.assertEqual(sizer.size, ReadSizer.MIN_SIZE)
@@ -0,0 +1,157 @@
+import asyncio
+import unittest
+from time import thread_time
+
+from match_actor import MatchActor
+from usage import CpuTimer, UsageTracker
+
+def spin(seconds: float):
+    end = thread_time() + seconds
+    while thread_time() < end:
+        pass
+
+class FakeGameState:
+    def process_delta(self, role, delta):
+        return True
+
+    async def end_turn(self, player_time):
+        return player_time
+
+class TestUsageTracker(unittest.TestCase):
+    def setUp(self):
+        self.usage = UsageTracker()
+        self.usage.clear()
+
+    def tearDown(self):
+        self.usage.clear()
+
+    def test_matches_are_ranked(self):
+        self.usage.record('Quiet', 'feed', 0.1, 0.2)
+        self.usage.record('Busy', 'feed', 0.5, 0.6)
+        self.usage.record('Busy', 'end_turn', 0.2, 0.1)
+        for _ in range(3):
+            self.usage.record('Quiet', 'http', 0., 1.)
+
+        ranked = self.usage.get_ranked_matches()
+        self.assertEqual([match['match_id'] for match in ranked], ['Busy', 'Quiet'])
+        self.assertAlmostEqual(ranked[0]['cpu'], 0.7)
+        self.assertEqual(ranked[0]['kinds']['end_turn'], {'calls': 1, 'cpu': 0.2, 'wall': 0.1})
+        self.assertEqual([match['match_id'] for match in self.usage.get_ranked_matches('calls')], ['Quiet', 'Busy'])
+        self.assertEqual(len(self.usage.get_ranked_matches(limit=1)), 1)
+
+    def test_work_is_charged_to_sensors(self):
+        self.usage.assign_sensor('Match', 'board', 0x1)
+        self.usage.assign_sensor('Match', 'player1', 0x2)
+        self.usage.record('Match', 'feed', 0.1, 0.1, mac_addr=0x2)
+        self.usage.record('Match', 'frames', 0.3, 0.3, role='board')
+        self.usage.record('Match', 'frames', 0.2, 0.2, role='player1')
+        self.usage.record('Match', 'end_turn', 1., 1.)
+
+        match, = self.usage.get_ranked_matches()
+        self.assertAlmostEqual(match['cpu'], 1.6)
+        sensors = match['sensors']
+        self.assertEqual([sensor['mac'] for sensor in sensors], ['0x2', '0x1'])
+        self.assertAlmostEqual(sensors[0]['cpu'], 0.3)
+        self.assertEqual(set(sensors[0]['kinds']), {'feed', 'frames'})
+
+    def test_sensor_follows_reassignment(self):
+        self.usage.assign_sensor('Old', 'board', 0x1)
+        self.usage.record('Old', 'frames', 0.1, 0.1, role='board')
+        self.usage.assign_sensor('New', 'board', 0x1)
+        self.usage.record('New', 'frames', 0.1, 0.1, role='board')
+
+        sensors = {match['match_id']: match['sensors'] for match in self.usage.get_ranked_matches()}
+        self.assertEqual(sensors['Old'], [])
+        self.assertEqual(sensors['New'][0]['calls'], 2)
+
+    def test_forwarded_usage_is_charged_by_the_front_end(self):
+        self.usage.forward()
+        self.usage.record('Match', 'frames', 0.1, 0.2, role='board')
+        self.usage.record('Match', 'frames', 0.3, 0.4, role='board')
+        self.usage.record('Match', 'end_turn', 0.5, 0.5)
+        records = self.usage.take_forwarded()
+        self.assertEqual(self.usage.take_forwarded(), [])
+        self.assertEqual(self.usage.get_ranked_matches(), [])
+        self.usage.forward(False)
+
+        # As the front end does with a worker's records
+        self.usage.assign_sensor('Match', 'board', 0x1)
+        for match_id, kind, role, calls, cpu, wall in records:
+            self.usage.record(match_id, kind, cpu, wall, role=role, calls=calls)
+        match, = self.usage.get_ranked_matches()
+        self.assertEqual(match['kinds']['frames']['calls'], 2)
+        self.assertAlmostEqual(match['cpu'], 0.9)
+        self.assertAlmostEqual(match['sensors'][0]['cpu'], 0.4)
+
+class TestCpuTimer(unittest.IsolatedAsyncioTestCase):
+    async def test_only_steps_of_the_awaitable_are_timed(self):
+        async def work():
+            spin(0.02)
+            await asyncio.sleep(0.01)
+            spin(0.02)
+            return 'done'
+
+        async def other_match():
+            spin(0.1)
+
+        timer = CpuTimer()
+        waiting = asyncio.ensure_future(timer.wait(work()))
+        await asyncio.sleep(0)
+        await other_match()
+        self.assertEqual(await waiting, 'done')
+        self.assertGreaterEqual(timer.cpu, 0.04)
+        self.assertLess(timer.cpu, 0.09)
+
+    async def test_exceptions_and_cancellation_reach_the_awaitable(self):
+        cancelled = asyncio.Event()
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        timer = CpuTimer()
+        waiting = asyncio.ensure_future(timer.wait(work()))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertTrue(cancelled.is_set())
+        with self.assertRaises(ZeroDivisionError):
+            timer.run(lambda: 1 / 0)
+
+class TestActorUsage(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        UsageTracker().clear()
+        UsageTracker().assign_sensor('Actor', 'board', 0x1)
+        self.actor = MatchActor('Actor', FakeGameState())
+
+    async def asyncTearDown(self):
+        self.actor.close()
+        UsageTracker().clear()
+
+    async def test_frames_and_commands_are_recorded(self):
+        self.actor.post_frame('board', {})
+        self.actor.post_frame('board', {})
+        await self.actor.call(FakeGameState.end_turn, 30)
+
+        match, = UsageTracker().get_ranked_matches()
+        self.assertEqual(match['kinds']['frames']['calls'], 2)
+        self.assertEqual(match['kinds']['end_turn']['calls'], 1)
+        self.assertEqual(match['sensors'][0]['kinds']['frames']['calls'], 2)
+
+    async def test_commands_are_not_charged_for_other_work_while_awaiting(self):
+        started = asyncio.Event()
+        async def slow_command(game_state):
+            started.set()
+            await asyncio.sleep(0.01)
+
+        running = asyncio.ensure_future(self.actor.call(slow_command))
+        await started.wait()
+        spin(0.1)
+        await running
+
+        match, = UsageTracker().get_ranked_matches()
+        self.assertLess(match['kinds']['slow_command']['cpu'], 0.05)
+        self.assertGreaterEqual(match['kinds']['slow_command']['wall'], 0.01)
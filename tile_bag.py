@@ -1,3 +1,5 @@
+import random
+from array import array
 from typing import Dict
 
 from scrabble import Tile
@@ -7,13 +9,18 @@ class TileBag():
         'J': 1, 'K': 1, 'L': 4, 'M': 2, 'N': 6, 'O': 8, 'P': 2, 'Q': 1, 'R': 6,
         'S': 4, 'T': 6, 'U': 4, 'V': 2, 'W': 2, 'X': 1, 'Y': 2, 'Z': 1, '?': 2
     }
+    # Tiles are shared by every bag, which only holds a count per tile
+    _TILES = [Tile(letter) for letter in STARTING_BAG]
+    _INDEX = {tile: i for i, tile in enumerate(_TILES)}
+
+    __slots__ = ('_counts',)
 
     def __init__(self):
-        self._tile_histogram = {Tile(letter): count for letter, count in self.STARTING_BAG.items()}
+        self._counts = array('B', TileBag.STARTING_BAG.values())
 
     def is_feasible(self, rack: Dict[Tile, int]):        
         for tile, count in rack.items():
-            if self._tile_histogram[tile] < count:
+            if self._counts[TileBag._INDEX[tile]] < count:
                 return False
         
         return True
@@ -23,24 +30,37 @@ class TileBag():
             return False 
         
         for tile, count in tiles.items():
-            self._tile_histogram[tile] -= count
+            self._counts[TileBag._INDEX[tile]] -= count
         return True
     
     def add_tiles(self, tiles: Dict[Tile, int]):
         for tile, count in tiles.items():
-            self._tile_histogram[tile] += count
+            self._counts[TileBag._INDEX[tile]] += count
         return True
     
+    def draw(self, n: int, rng: random.Random) -> Dict[Tile, int]:
+        """
+        Randomly draws up to n tiles from the bag and removes them. Passing a seeded rng makes the draw reproducible, which is used by the game simulator
+        """
+        pool = [tile for tile, count in zip(TileBag._TILES, self._counts) for _ in range(count)]
+        drawn = {}
+        for tile in rng.sample(pool, min(n, len(pool))):
+            drawn.setdefault(tile, 0)
+            drawn[tile] += 1
+
+        self.remove_tiles(drawn)
+        return drawn
+
     def empty(self):
         """
         Completely empties the tile bag. Used to facilitate unit testing
         """
-        for tile in self._tile_histogram.keys():
-            self._tile_histogram[tile] = 0
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
     
     def get_expected_tiles_on_rack(self, rack: Dict[Tile, int]) -> int:
         tiles_on_rack = sum(rack.values())
-        tiles_in_bag = sum(self._tile_histogram.values())
+        tiles_in_bag = sum(self._counts)
         return min(tiles_on_rack + tiles_in_bag, 7)
     
     @property
@@ -48,4 +68,4 @@ class TileBag():
         """
         Returns the number of tiles left in the bag
         """
-        return sum(self._tile_histogram.values())
\ No newline at end of file
+        return sum(self._counts)
\ No newline at end of file
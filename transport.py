@@ -0,0 +1,166 @@
+"""
+Optional packed encoding for the capnp byte stream between sensors and the server, plus read sizing shared by both ends.
+
+The packing is capnp's standard packed encoding applied to the raw RPC stream, which is always a whole number of 8-byte words. Sensor frames are mostly small integers and zero padding, so packing typically removes over half of the bytes on the wire. A client asks for it by sending PACKED_HELLO before any capnp data, and the server confirms with PACKED_ACK. Clients which do not send the hello get the plain stream, as before.
+
+The plain stream is the default on both ends. Packing is done in Python, as pycapnp's packed serialisation works on whole messages rather than the RPC byte stream, and costs over twice the CPU of the plain stream (see benchmarks/transport.py). It is only worth enabling when the sensors' link is the bottleneck, and servers only accept it when started with it enabled.
+"""
+
+PACKED_HELLO = b'\xff\xffPKD\x00\x00\x01' # Can never start a capnp stream, whose first word is a small segment count
+PACKED_ACK = b'\xff\xffPKD\x00\x00\x02'
+
+WORD_SIZE = 8
+ZERO_WORD = bytes(WORD_SIZE)
+_LOW_BITS = 0x0101010101010101
+_GATHER = 0x0102040810204080 # Multiplying by this moves the low bit of each byte into the top byte
+_TAG_POSITIONS = [[bit for bit in range(WORD_SIZE) if tag & (1 << bit)] for tag in range(256)]
+
+def _tag(word: bytes) -> int:
+    """
+    Returns a byte with bit i set if byte i of the word is non-zero
+    """
+    x = int.from_bytes(word, 'little')
+    x |= x >> 4
+    x |= x >> 2
+    x |= x >> 1
+    return (((x & _LOW_BITS) * _GATHER) >> 56) & 0xFF
+
+class Packer():
+    def __init__(self) -> None:
+        """
+        Packs a stream of words which may be handed over in chunks that are not word aligned
+        """
+        self._tail = b''
+
+    def pack(self, data) -> bytes:
+        if self._tail:
+            data = self._tail + bytes(data)
+        aligned = len(data) - len(data) % WORD_SIZE
+        self._tail = bytes(data[aligned:])
+        return pack_words(memoryview(data)[:aligned])
+
+def pack_words(data) -> bytes:
+    """
+    Packs word aligned data using capnp's packed encoding
+    """
+    out = bytearray()
+    n_of_words = len(data) // WORD_SIZE
+    i = 0
+    while i < n_of_words:
+        word = bytes(data[i * WORD_SIZE:(i + 1) * WORD_SIZE])
+        i += 1
+        if word == ZERO_WORD:
+            run = 0
+            while i < n_of_words and run < 255 and data[i * WORD_SIZE:(i + 1) * WORD_SIZE] == ZERO_WORD:
+                run += 1
+                i += 1
+            out += b'\x00'
+            out.append(run)
+            continue
+
+        tag = _tag(word)
+        out.append(tag)
+        if tag != 0xFF:
+            out += word.replace(b'\x00', b'')
+            continue
+
+        # Fully populated word, followed by a run of words copied verbatim while they have at most one zero byte
+        out += word
+        start = i
+        while i < n_of_words and i - start < 255 and data[i * WORD_SIZE:(i + 1) * WORD_SIZE].tobytes().count(0) <= 1:
+            i += 1
+        out.append(i - start)
+        out += data[start * WORD_SIZE:i * WORD_SIZE]
+
+    return bytes(out)
+
+class Unpacker():
+    def __init__(self) -> None:
+        """
+        Unpacks a packed stream which may be received split at arbitrary points
+        """
+        self._buffer = bytearray()
+
+    def unpack(self, data) -> bytes:
+        buffer = self._buffer
+        buffer += data
+        out = bytearray()
+        pos = 0
+        end = len(buffer)
+        while pos < end:
+            tag = buffer[pos]
+            if tag == 0:
+                if pos + 2 > end:
+                    break
+                out += bytes(WORD_SIZE * (1 + buffer[pos + 1]))
+                pos += 2
+                continue
+
+            n_of_bytes = bin(tag).count('1')
+            unit_end = pos + 1 + n_of_bytes
+            if tag == 0xFF:
+                if unit_end + 1 > end:
+                    break
+                raw_end = unit_end + 1 + WORD_SIZE * buffer[unit_end]
+                if raw_end > end:
+                    break
+                out += buffer[pos + 1:unit_end]
+                out += buffer[unit_end + 1:raw_end]
+                pos = raw_end
+                continue
+
+            if unit_end > end:
+                break
+            word = bytearray(WORD_SIZE)
+            for src, bit in enumerate(_TAG_POSITIONS[tag], start=pos + 1):
+                word[bit] = buffer[src]
+            out += word
+            pos = unit_end
+
+        del buffer[:pos]
+        return bytes(out)
+
+class ReadSizer():
+    MIN_SIZE = 4096
+    MAX_SIZE = 64 * 1024
+
+    def __init__(self) -> None:
+        """
+        Adapts the read size to the traffic on a connection: doubles while reads fill the buffer (so bursts are drained in fewer calls), and halves when reads use less than a quarter of it
+        """
+        self.size = ReadSizer.MIN_SIZE
+
+    def update(self, n_read: int) -> int:
+        if n_read >= self.size:
+            self.size = min(self.size * 2, ReadSizer.MAX_SIZE)
+        elif n_read < self.size // 4:
+            self.size = max(self.size // 2, ReadSizer.MIN_SIZE)
+        return self.size
+
+WRITE_HIGH_WATER = 64 * 1024 # Pending output above which writers wait for the socket to drain, letting capnp output coalesce
+
+class StreamCodec():
+    def __init__(self, packed: bool = False) -> None:
+        """
+        Converts between the capnp stream and the bytes on the wire for one connection, counting the bytes on the wire in each direction
+        """
+        self._packer = Packer() if packed else None
+        self._unpacker = Unpacker() if packed else None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def is_packed(self):
+        return self._packer is not None
+
+    def encode(self, data):
+        """
+        Returns the wire form of capnp output. Unpacked output is passed on as a memoryview rather than copied: pycapnp's read returns a newly allocated array on every call and never reuses it, so the view stays valid for as long as the transport holds it.
+        """
+        data = self._packer.pack(data) if self._packer is not None else memoryview(data)
+        self.bytes_out += len(data)
+        return data
+
+    def decode(self, data):
+        self.bytes_in += len(data)
+        return self._unpacker.unpack(data) if self._unpacker is not None else data
@@ -0,0 +1,166 @@
+"""
+Attribution of the server's CPU and wall time to matches and sensors, so that a match or sensor which is using more than its share (e.g. a flapping sensor streaming changing frames) can be found from /debug/matches.
+
+Work is recorded by kind:
+- 'feed': decoding and queueing a sensor's frames, attributed to its match and MAC
+- 'frames': processing a sensor's frames on the match's actor (the resolvers, speculation and frame rates), attributed to the sensor the role was last assigned to
+- a command's name (e.g. 'end_turn'): running a command from match_commands.py on the match's actor
+- 'http': handling an HTTP request about the match. Its wall time is end to end, including the wait for the actor, while its CPU time is only the handler's own, as the command's is charged to the command.
+
+CPU time is measured with time.thread_time, so work on the sensor thread (see sensor_thread.py) is not charged for the main thread's work or vice versa. Work which awaits is timed with a CpuTimer, which only counts the CPU used while the work is running, not what other tasks on the thread use while it is suspended.
+
+With --workers, frames and commands run in the worker processes. Each worker's tracker forwards what it records to the front end's (see match_shards.py), which charges it to the match and sensor like its own work, so the front end's ranking covers every process.
+"""
+
+import threading
+import types
+from time import thread_time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from util import Singleton
+
+class Usage():
+    __slots__ = ('calls', 'cpu', 'wall')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.cpu = 0.
+        self.wall = 0.
+
+    def add(self, cpu: float, wall: float, calls: int = 1):
+        self.calls += calls
+        self.cpu += cpu
+        self.wall += wall
+
+    def to_dict(self) -> Dict[str, float]:
+        return {'calls': self.calls, 'cpu': self.cpu, 'wall': self.wall}
+
+class CpuTimer():
+    __slots__ = ('cpu',)
+
+    def __init__(self) -> None:
+        """
+        Totals the thread CPU time used by calls and awaitables run through it
+        """
+        self.cpu = 0.
+
+    def run(self, fn: Callable[..., Any], *args):
+        start = thread_time()
+        try:
+            return fn(*args)
+        finally:
+            self.cpu += thread_time() - start
+
+    @types.coroutine
+    def wait(self, awaitable: Awaitable):
+        """
+        Awaits the awaitable, timing each of its steps between suspensions rather than the whole wait, as other tasks run on the thread while it is suspended
+        """
+        steps = awaitable.__await__()
+        resume, value = steps.send, None
+        while True:
+            start = thread_time()
+            try:
+                yielded = resume(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.cpu += thread_time() - start
+            try:
+                resume, value = steps.send, (yield yielded)
+            except BaseException as err:
+                # e.g. the awaiting task is cancelled
+                resume, value = steps.throw, err
+
+class UsageTracker(metaclass=Singleton):
+    SORT_KEYS = ('cpu', 'wall', 'calls')
+
+    def __init__(self) -> None:
+        self._matches: Dict[str, Dict[str, Usage]] = {} # Usage of each kind of work, by match
+        self._sensors: Dict[int, Dict[str, Usage]] = {} # Usage of each kind of work, by MAC
+        self._sensor_matches: Dict[int, str] = {} # Match each MAC was last assigned to
+        self._roles: Dict[Tuple[str, Any], int] = {} # MAC of each (match, role)
+        self._forwarded: Optional[Dict[Tuple[str, str, Any], Usage]] = None # Usage recorded since it was last taken, by (match, kind, role), while forwarding
+        # Feeds record from the sensor thread when there is one
+        self._lock = threading.Lock()
+
+    def assign_sensor(self, match_id: str, role, mac_addr: int):
+        with self._lock:
+            self._roles[(match_id, role)] = mac_addr
+            self._sensor_matches[mac_addr] = match_id
+
+    def record(self, match_id: str, kind: str, cpu: float, wall: float, role=None, mac_addr: Optional[int] = None, calls: int = 1):
+        """
+        Charges work to the match and, if given, to the sensor with the MAC address or the one assigned to the role
+
+        @param calls: Number of times the work was done, when recording the total of several (e.g. forwarded by a worker)
+        """
+        with self._lock:
+            if self._forwarded is not None:
+                if (usage := self._forwarded.get((match_id, kind, role))) is None:
+                    usage = self._forwarded[(match_id, kind, role)] = Usage()
+                usage.add(cpu, wall, calls)
+                return
+            if mac_addr is None and role is not None:
+                mac_addr = self._roles.get((match_id, role))
+            UsageTracker._get_usage(self._matches, match_id, kind).add(cpu, wall, calls)
+            if mac_addr is not None:
+                UsageTracker._get_usage(self._sensors, mac_addr, kind).add(cpu, wall, calls)
+
+    def forward(self, enabled: bool = True):
+        """
+        In a worker process, keeps what is recorded for take_forwarded rather than totalling it here, as sensors are only known to the front end
+        """
+        with self._lock:
+            self._forwarded = {} if enabled else None
+
+    def take_forwarded(self) -> List[Tuple[str, str, Any, int, float, float]]:
+        """
+        Returns the (match_id, kind, role, calls, cpu, wall) of the work recorded since the last call, to be recorded by the front end's tracker
+        """
+        with self._lock:
+            if not self._forwarded:
+                return []
+            forwarded, self._forwarded = self._forwarded, {}
+        return [(match_id, kind, role, usage.calls, usage.cpu, usage.wall) for (match_id, kind, role), usage in forwarded.items()]
+
+    def get_ranked_matches(self, sort: str = 'cpu', limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the usage of each match and its sensors, with the match (and sensor) using the most first
+        """
+        assert sort in UsageTracker.SORT_KEYS, f"Cannot sort usage by {sort}"
+        with self._lock:
+            sensors_by_match: Dict[str, List[Dict[str, Any]]] = {}
+            for mac_addr, kinds in self._sensors.items():
+                sensors_by_match.setdefault(self._sensor_matches.get(mac_addr), []).append({'mac': hex(mac_addr), **UsageTracker._summarise(kinds)})
+
+            ranked = [
+                {'match_id': match_id, **UsageTracker._summarise(kinds), 'sensors': sorted(sensors_by_match.get(match_id, []), key=lambda sensor: sensor[sort], reverse=True)}
+                for match_id, kinds in self._matches.items()
+            ]
+        ranked.sort(key=lambda match: match[sort], reverse=True)
+        return ranked if limit is None else ranked[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._matches.clear()
+            self._sensors.clear()
+            self._sensor_matches.clear()
+            self._roles.clear()
+
+    @staticmethod
+    def _get_usage(usage: Dict[Any, Dict[str, Usage]], key, kind: str) -> Usage:
+        if (kinds := usage.get(key)) is None:
+            kinds = usage[key] = {}
+        if (res := kinds.get(kind)) is None:
+            res = kinds[kind] = Usage()
+        return res
+
+    @staticmethod
+    def _summarise(kinds: Dict[str, Usage]) -> Dict[str, Any]:
+        return {
+            'cpu': sum(usage.cpu for usage in kinds.values()),
+            'wall': sum(usage.wall for usage in kinds.values()),
+            'calls': sum(usage.calls for usage in kinds.values()),
+            'kinds': {kind: usage.to_dict() for kind, usage in kinds.items()}
+        }
@@ -12,6 +12,8 @@ class Result(Generic[T]):
     """
     Represents an F# Result type
     """
+    __slots__ = ('value', 'error', 'is_success')
+
     def __init__(self, value: Optional[T] = None, error: Optional[str] = None):
         self.value = value
         self.error = error
@@ -2,18 +2,23 @@ import asyncio
 import aiohttp
 from aiohttp import web
 import logging
-from typing import Dict, Any, Tuple
+from time import perf_counter
+from typing import Any, Callable, Dict, Tuple
 
 from logger import get_logger
 import matchdata as md
+import match_commands as commands
+from rack_codec import RackDecoder
 from tcp_server import TCPServer
+from usage import CpuTimer, UsageTracker
 from util import Result
 
 logging.getLogger(aiohttp.__name__).setLevel(logging.WARN) # Disable info logging from aiohttp
 
 class HTTPServer:
-    def __init__(self, loop, sensor_server: TCPServer):
+    def __init__(self, loop, sensor_server: TCPServer, port: int = 9190):
         self._loop = loop
+        self._port = port
         self._logger = get_logger(__class__.__name__)
         self._sensor_server = sensor_server
         self._app = web.Application()
@@ -45,127 +50,112 @@ class HTTPServer:
         @routes.get('/end-turn')
         async def end_turn(request: web.Request):
             self._logger.debug(f"Received end_turn request {request.query}")
+            player_time = request.query.get('player_time')
+            return await self._call_match(request, commands.end_turn, player_time)
 
-            res = self._validate_request(request)
-            if res.is_success:
-                game_state = res.value
-            else:
-                return HTTPServer._error(res.error)
+        @routes.get('/end-match')
+        async def end_match(request: web.Request):
+            match_id = request.query.get('match_id')
+            self._logger.info(f"Received end_match request for {match_id}")
+            if not await self._sensor_server.end_match(match_id):
+                return HTTPServer._error("Invalid match_id")
+            return HTTPServer._success({"match_id": match_id})
 
+        @routes.get('/delivery-stats')
+        async def get_delivery_stats(request: web.Request):
             match_id = request.query.get('match_id')
-            self._logger.info(f"[{match_id}] Received end turn event")
-            player_time = request.query.get('player_time')
-            res = await game_state.end_turn(player_time)
-            if res.is_success:
-                return HTTPServer._success(res.value.to_dict())
-            else:
-                return HTTPServer._error(res.error)
+            stats = self._sensor_server.get_delivery_stats(match_id)
+            if stats is None:
+                return HTTPServer._error("Invalid match_id")
+            return HTTPServer._success(stats)
 
         @routes.get('/challengeable-words')
         async def get_challengeable_words(request: web.Request):
             self._logger.debug(f"Received get_challengeable_words request {request.query}")
-            res = self._validate_request(request, turn_modifier=-1)
-            if res.is_success:
-                game_state = res.value
-            else:
-                return HTTPServer._error(res.error)
-            
-            challenge_words = list(game_state.board.get_challenge_words())
-            match_id = request.query.get('match_id')
-            self._logger.info(f"[{match_id}] Challenge request initiated, available words = {challenge_words}")
-
-            if len(challenge_words) == 0:
-                return HTTPServer._error("No challenge words")
-            else:
-                return self._success({
-                    "words": challenge_words
-                })
+            return await self._call_match(request, commands.get_challengeable_words)
         
         @routes.get('/challenge')
         async def challenge(request: web.Request):
             self._logger.debug(f"Received challenge request {request.query}")
-
-            res = self._validate_request(request)
-            if res.is_success:
-                game_state = res.value
-            else:
-                return HTTPServer._error(res.error)
-            
-            words = request.query.getall('words', [])
-            if not words:
-                return HTTPServer._error("No challenge words provided")
-            elif not all(word in game_state.board.get_challenge_words() for word in words):
-                self._logger.error(f'[{match_id}] Received challenge with words {words} that do not match challengable words {game_state.board.get_challenge_words()}')
-                return HTTPServer._error("Invalid challenge words")
-            
-            match_id = request.query.get('match_id')
-            self._logger.info(f"[{match_id}] Received challenge request on {words}")
-
-            successful = any(not md.Dictionary().is_valid(word) for word in words)
-
-            previous_score = game_state.board.get_score()
-
-            if successful:
-                self._logger.info(f"[{match_id}] Challenge was successful, undoing previous move")
-                game_state.on_successful_challenge()
-            else:
-                self._logger.info(f"[{match_id}] Challenge was unsuccessful, applying {len(words) * 5}-point penalty")
-            
-            return HTTPServer._success({
-                "successful": successful,
-                "challenger_penalty": len(words) * 5,
-                "undone_move_score": previous_score
-            })
+            return await self._call_match(request, commands.challenge, request.query.getall('words', []))
         
         @routes.post('/blanks')
         async def update_blank_tiles(request: web.Request):
             self._logger.debug(f"Received blank tile update {request.query}, has body = {request.can_read_body}")
             body = await request.json()
             self._logger.debug(f"Request body = {body}")
-
-            res = self._validate_request(request, turn_modifier=-1) # Need blanks from previous turn
-            if res.is_success:
-                game_state = res.value
-            else:
-                return HTTPServer._error(res.error)
-            
-            match_id = request.query.get('match_id')
-            blanks_str = ''.join(body)
-            if game_state.board.set_blanks(blanks_str):
-                self._logger.info(f"[{match_id}] Updated blank tile(s) of previous play to {body}")
-                self._logger.info(f"[{match_id}] Updated board state:\n{game_state.board}")
-                return HTTPServer._success({})
-            else:
-                return HTTPServer._error("Unable to set blanks")
+            return await self._call_match(request, commands.set_blanks, list(body))
         
+        @routes.get('/debug/admission')
+        async def get_admission_stats(request: web.Request):
+            """
+            Event loop lag and the queues of each priority of work on the match actors, see admission.py
+            """
+            return HTTPServer._success(md.GameStateStore().admission.stats)
+
+        @routes.get('/debug/matches')
+        async def get_match_usage(request: web.Request):
+            """
+            Matches ranked by the CPU time (or ?sort=wall|calls) their feeds, actor and requests have used, along with their sensors' (see usage.py) and their actor's queue stats, and the rack decoding cache's stats
+            """
+            sort = request.query.get('sort', 'cpu')
+            if sort not in UsageTracker.SORT_KEYS:
+                return HTTPServer._error(f"Invalid sort, expected one of {', '.join(UsageTracker.SORT_KEYS)}")
+            try:
+                limit = int(request.query['limit']) if 'limit' in request.query else None
+            except ValueError:
+                return HTTPServer._error("Invalid limit")
+            matches = UsageTracker().get_ranked_matches(sort, limit)
+            for match in matches:
+                if (actor := md.GameStateStore().get_actor(match['match_id'])) is not None:
+                    match['actor'] = actor.stats
+            return HTTPServer._success({'matches': matches, 'rack_cache': RackDecoder().stats})
+
         self._app.add_routes(routes)
 
     async def start(self):
         runner = web.AppRunner(self._app)
         await runner.setup()
-        site = web.TCPSite(runner, host=None, port=9190)  
+        site = web.TCPSite(runner, host=None, port=self._port)
         await site.start()
         self._logger.info(f"HTTP server listening on port {site._port}")
         await asyncio.Event().wait()
 
-    def _validate_request(self, request: web.Request, turn_modifier: int = 0) -> Result[md.GameState]:
+    async def _call_match(self, request: web.Request, command: Callable[..., Result], *args):
+        """
+        Runs one of the commands in match_commands.py on the actor of the request's match, so that it is serialised with the match's frames and other requests. Commands validate the turn number on the actor, so it cannot change between validating and running the command.
+        """
+        # The command's CPU time is charged to it by the actor, so the timer only counts the handler's own steps
+        timer, start = CpuTimer(), perf_counter()
+        response = await timer.wait(self._run_match_command(request, command, *args))
         match_id = request.query.get('match_id')
-        turn_number = request.query.get('turn_number')
+        if md.GameStateStore().get_actor(match_id) is not None:
+            UsageTracker().record(match_id, 'http', timer.cpu, perf_counter() - start)
+        return response
 
+    async def _run_match_command(self, request: web.Request, command: Callable[..., Result], *args):
+        match_id = request.query.get('match_id')
         try:
-            turn_number = int(turn_number)
+            turn_number = int(request.query.get('turn_number'))
         except (TypeError, ValueError):
-            return Result.failure("Invalid turn number")
-
-        game_state = md.GameStateStore().get_game_state(match_id)
-        if game_state is None:
+            return HTTPServer._error("Invalid turn number")
+
+        actor = md.GameStateStore().get_actor(match_id)
+        if actor is None and (node := self._sensor_server.get_match_node(match_id)) is not None:
+            # Same request, sent to the node running the match
+            self._logger.info(f"[{match_id}] Redirecting request to node {node}")
+            raise web.HTTPTemporaryRedirect(request.url.with_host(node.host).with_port(node.http_port))
+        elif actor is None:
             self._logger.error(f"[{match_id}] Received request which doesn't have associated game state")
-            return Result.failure("Invalid match_id")
-        elif game_state.turn_number + turn_modifier != turn_number:
-            self._logger.error(f"[{match_id}]Received request with turn number {turn_number} that does not match game state turn number {game_state.turn_number} + {turn_modifier}")
-            return Result.failure("Turn out of sync")
-        
-        return Result.success(game_state)
+            return HTTPServer._error("Invalid match_id")
+
+        try:
+            res = await actor.call(command, turn_number, *args)
+        except Exception as err:
+            # e.g. the match has too many commands queued, or its worker process has exited
+            self._logger.error(f"[{match_id}] Unable to run {command.__name__}: {err}")
+            return HTTPServer._error(f"Unable to run {command.__name__}")
+        return HTTPServer._success(res.value) if res.is_success else HTTPServer._error(res.error)
 
     @staticmethod
     def _error(msg: str) :